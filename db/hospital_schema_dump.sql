@@ -6,7 +6,8 @@ CREATE TABLE IF NOT EXISTS nurses_profile(
   name TEXT,
   surname TEXT,
   phone_number INTEGER,
-  address TEXT);
+  address TEXT,
+  version INTEGER NOT NULL DEFAULT 1);
 
 CREATE TABLE IF NOT EXISTS doctors_profile(
   doctor_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -24,6 +25,7 @@ CREATE TABLE IF NOT EXISTS patients_profile(
   address TEXT,
   p_nurse INTEGER,
   p_doctor INTEGER,
+  version INTEGER NOT NULL DEFAULT 1,
   FOREIGN KEY(p_nurse) REFERENCES nurses_profile(nurse_id) ON DELETE CASCADE,
   FOREIGN KEY(p_doctor) REFERENCES doctors_profile(doctor_id) ON DELETE CASCADE);
 
@@ -36,7 +38,102 @@ CREATE TABLE IF NOT EXISTS medicaments(
   bag_volume TEXT,
   administration TEXT,
   m_patient INTEGER,
+  version INTEGER NOT NULL DEFAULT 1,
   FOREIGN KEY(m_patient) REFERENCES patients_profile(patient_id) ON DELETE CASCADE);
 
+CREATE INDEX IF NOT EXISTS patients_profile_p_nurse_idx ON patients_profile(p_nurse);
+CREATE INDEX IF NOT EXISTS patients_profile_p_doctor_idx ON patients_profile(p_doctor);
+CREATE INDEX IF NOT EXISTS medicaments_m_patient_idx ON medicaments(m_patient);
+
+CREATE TABLE IF NOT EXISTS table_versions(name TEXT PRIMARY KEY, version INTEGER NOT NULL);
+INSERT OR IGNORE INTO table_versions VALUES('nurses_profile', 1);
+INSERT OR IGNORE INTO table_versions VALUES('patients_profile', 1);
+INSERT OR IGNORE INTO table_versions VALUES('medicaments', 1);
+
+CREATE TRIGGER IF NOT EXISTS nurses_profile_insert_version AFTER INSERT ON nurses_profile BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'nurses_profile'; END;
+CREATE TRIGGER IF NOT EXISTS nurses_profile_update_version AFTER UPDATE ON nurses_profile
+  WHEN NEW.version = OLD.version BEGIN
+  UPDATE nurses_profile SET version = OLD.version + 1 WHERE nurse_id = NEW.nurse_id;
+  UPDATE table_versions SET version = version + 1 WHERE name = 'nurses_profile'; END;
+CREATE TRIGGER IF NOT EXISTS nurses_profile_delete_version AFTER DELETE ON nurses_profile BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'nurses_profile'; END;
+
+CREATE TRIGGER IF NOT EXISTS patients_profile_insert_version AFTER INSERT ON patients_profile BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'patients_profile'; END;
+CREATE TRIGGER IF NOT EXISTS patients_profile_update_version AFTER UPDATE ON patients_profile
+  WHEN NEW.version = OLD.version BEGIN
+  UPDATE patients_profile SET version = OLD.version + 1 WHERE patient_id = NEW.patient_id;
+  UPDATE table_versions SET version = version + 1 WHERE name = 'patients_profile'; END;
+CREATE TRIGGER IF NOT EXISTS patients_profile_delete_version AFTER DELETE ON patients_profile BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'patients_profile'; END;
+
+CREATE TRIGGER IF NOT EXISTS medicaments_insert_version AFTER INSERT ON medicaments BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'medicaments'; END;
+CREATE TRIGGER IF NOT EXISTS medicaments_update_version AFTER UPDATE ON medicaments
+  WHEN NEW.version = OLD.version BEGIN
+  UPDATE medicaments SET version = OLD.version + 1 WHERE medicament_id = NEW.medicament_id;
+  UPDATE table_versions SET version = version + 1 WHERE name = 'medicaments'; END;
+CREATE TRIGGER IF NOT EXISTS medicaments_delete_version AFTER DELETE ON medicaments BEGIN
+  UPDATE table_versions SET version = version + 1 WHERE name = 'medicaments'; END;
+
+CREATE TABLE IF NOT EXISTS changes(seq INTEGER PRIMARY KEY AUTOINCREMENT, entity TEXT NOT NULL,
+  item_id INTEGER NOT NULL, deleted INTEGER NOT NULL DEFAULT 0, UNIQUE(entity, item_id));
+
+CREATE TRIGGER IF NOT EXISTS nurses_profile_insert_change AFTER INSERT ON nurses_profile BEGIN
+  DELETE FROM changes WHERE entity = 'nurses' AND item_id = NEW.nurse_id;
+  INSERT INTO changes(entity, item_id, deleted) VALUES('nurses', NEW.nurse_id, 0); END;
+CREATE TRIGGER IF NOT EXISTS nurses_profile_update_change AFTER UPDATE ON nurses_profile BEGIN
+  DELETE FROM changes WHERE entity = 'nurses' AND item_id = NEW.nurse_id;
+  INSERT INTO changes(entity, item_id, deleted) VALUES('nurses', NEW.nurse_id, 0); END;
+CREATE TRIGGER IF NOT EXISTS nurses_profile_delete_change AFTER DELETE ON nurses_profile BEGIN
+  DELETE FROM changes WHERE entity = 'nurses' AND item_id = OLD.nurse_id;
+  INSERT INTO changes(entity, item_id, deleted) VALUES('nurses', OLD.nurse_id, 1); END;
+
+CREATE TRIGGER IF NOT EXISTS patients_profile_insert_change AFTER INSERT ON patients_profile BEGIN
+  DELETE FROM changes WHERE entity = 'patients' AND item_id = NEW.patient_id;
+  INSERT INTO changes(entity, item_id, deleted) VALUES('patients', NEW.patient_id, 0); END;
+CREATE TRIGGER IF NOT EXISTS patients_profile_update_change AFTER UPDATE ON patients_profile BEGIN
+  DELETE FROM changes WHERE entity = 'patients' AND item_id = NEW.patient_id;
+  INSERT INTO changes(entity, item_id, deleted) VALUES('patients', NEW.patient_id, 0); END;
+CREATE TRIGGER IF NOT EXISTS patients_profile_delete_change AFTER DELETE ON patients_profile BEGIN
+  DELETE FROM changes WHERE entity = 'patients' AND item_id = OLD.patient_id;
+  INSERT INTO changes(entity, item_id, deleted) VALUES('patients', OLD.patient_id, 1); END;
+
+CREATE TRIGGER IF NOT EXISTS medicaments_insert_change AFTER INSERT ON medicaments BEGIN
+  DELETE FROM changes WHERE entity = 'medicaments' AND item_id = NEW.medicament_id;
+  INSERT INTO changes(entity, item_id, deleted) VALUES('medicaments', NEW.medicament_id, 0); END;
+CREATE TRIGGER IF NOT EXISTS medicaments_update_change AFTER UPDATE ON medicaments BEGIN
+  DELETE FROM changes WHERE entity = 'medicaments' AND item_id = NEW.medicament_id;
+  INSERT INTO changes(entity, item_id, deleted) VALUES('medicaments', NEW.medicament_id, 0); END;
+CREATE TRIGGER IF NOT EXISTS medicaments_delete_change AFTER DELETE ON medicaments BEGIN
+  DELETE FROM changes WHERE entity = 'medicaments' AND item_id = OLD.medicament_id;
+  INSERT INTO changes(entity, item_id, deleted) VALUES('medicaments', OLD.medicament_id, 1); END;
+
+CREATE TABLE IF NOT EXISTS medication_schedules(
+  medicament_id INTEGER PRIMARY KEY,
+  interval_seconds INTEGER,
+  duration_seconds INTEGER,
+  start_time INTEGER NOT NULL,
+  horizon INTEGER,
+  FOREIGN KEY(medicament_id) REFERENCES medicaments(medicament_id) ON DELETE CASCADE);
+CREATE INDEX IF NOT EXISTS medication_schedules_horizon_idx ON medication_schedules(horizon);
+CREATE TABLE IF NOT EXISTS doses(
+  medicament_id INTEGER NOT NULL,
+  due_time INTEGER NOT NULL,
+  nurse_id INTEGER,
+  PRIMARY KEY(medicament_id, due_time),
+  FOREIGN KEY(medicament_id) REFERENCES medicaments(medicament_id) ON DELETE CASCADE);
+CREATE INDEX IF NOT EXISTS doses_nurse_due_idx ON doses(nurse_id, due_time, medicament_id);
+CREATE INDEX IF NOT EXISTS doses_due_idx ON doses(due_time, medicament_id, nurse_id);
+
+CREATE TRIGGER IF NOT EXISTS patients_profile_nurse_doses AFTER UPDATE OF p_nurse ON patients_profile
+  BEGIN UPDATE doses SET nurse_id = NEW.p_nurse WHERE medicament_id IN
+  (SELECT medicament_id FROM medicaments WHERE m_patient = NEW.patient_id); END;
+CREATE TRIGGER IF NOT EXISTS medicaments_patient_doses AFTER UPDATE OF m_patient ON medicaments
+  BEGIN UPDATE doses SET nurse_id = (SELECT p_nurse FROM patients_profile
+  WHERE patient_id = NEW.m_patient) WHERE medicament_id = NEW.medicament_id; END;
+-- Schema version of the objects above, see hospital/migrations.py
+PRAGMA user_version = 5;
 COMMIT;
 PRAGMA foreign_keys=ON;
\ No newline at end of file
@@ -1,11 +1,54 @@
+import argparse
+import sys
+
 from werkzeug.serving import run_simple
 from werkzeug.wsgi import DispatcherMiddleware
+from hospital import database, server
+from hospital.assets import StaticAssets
+from hospital.compression import CompressionMiddleware
 from hospital.resources import app as hospital
 from hospital_admin.application import app as hospital_admin
 
+# Hashed and compressed copies of the static files, built with
+# python -m hospital.assets hospital_admin/static hospital_admin/static_build
+STATIC_BUILD = 'hospital_admin/static_build'
+
 application = DispatcherMiddleware(hospital, {
     '/hospital_admin': hospital_admin
 })
+application = CompressionMiddleware(application, min_size=hospital.config['COMPRESS_MIN_SIZE'],
+                                    level=hospital.config['COMPRESS_LEVEL'])
+# The admin application serves its static folder at its root (static_url_path='')
+application = StaticAssets(application, '/hospital_admin/', STATIC_BUILD)
+
+
+def post_fork():
+    # Every worker opens its own database connections
+    hospital.config['DATABASE'].after_fork()
+
+
 if __name__ == '__main__':
-    run_simple('localhost', 5000, application,
-               use_reloader=True, use_debugger=True, use_evalex=True)
+    parser = argparse.ArgumentParser(description='Run the hospital server')
+    parser.add_argument('--dev', action='store_true',
+                        help='single process with reloader and debugger, never in production')
+    parser.add_argument('--host', default=server.DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=server.DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, one per CPU by default')
+    parser.add_argument('--threads', type=int, default=server.DEFAULT_THREADS,
+                        help='connections served at the same time by every worker')
+    parser.add_argument('--max-requests', type=int, default=server.DEFAULT_MAX_REQUESTS,
+                        help='requests served by a worker before it is replaced, 0 for no limit')
+    args = parser.parse_args()
+    if args.dev:
+        hospital.debug = True
+        run_simple(args.host, args.port, application,
+                   use_reloader=True, use_debugger=True, use_evalex=True)
+    else:
+        # Upgrade the schema once, before the workers compete to do it
+        hospital.config['DATABASE'].migrate()
+        hospital.config['DATABASE'].close()
+        # Every thread of a worker may use a connection at the same time
+        hospital.config['DATABASE'].resize_pool(max(database.DEFAULT_POOL_SIZE, args.threads))
+        # SIGHUP runs this command again to load the new code
+        server.serve(application, args.host, args.port, args.workers, args.max_requests, post_fork,
+                     threads=args.threads, argv=[sys.executable] + sys.argv)
@@ -0,0 +1,219 @@
+'''
+Precompressed, content-hashed copies of the static files.
+
+build copies every file of a source folder to an output folder with the
+hash of its content in the name (js/app.js -> js/app.3f2a1b9c0d4e.js) and,
+for the compressible types, a gzip copy next to it (js/app.3f2a1b9c0d4e.js.gz)
+when it is smaller. manifest.json maps the original names to the hashed ones.
+
+StaticAssets serves those copies under a url prefix, without compressing
+anything per request: the hashed names never change their content, so they
+are sent with far-future cache headers, and the original names are
+revalidated with the ETag of the content. The src and href of the HTML
+pages are replaced by the urls of the hashed copies (see url) when the
+copies are loaded, so the browsers only ask for the hashed names. The
+requests for files that are not in the manifest (or all of them if the
+copies have not been built) go to the wrapped application.
+
+Build the copies before deploying, from the project folder:
+    python -m hospital.assets hospital_admin/static hospital_admin/static_build
+'''
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+import StringIO
+import sys
+
+from werkzeug.http import parse_accept_header, parse_etags
+from werkzeug.wsgi import wrap_file
+
+from compression import is_compressible
+
+MANIFEST = 'manifest.json'
+# Characters of the content hash in the names of the copies
+HASH_LENGTH = 12
+# One year, the longest value the caches are expected to accept
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+# src and href attributes of the HTML pages, the url is the third group
+_REFERENCE = re.compile(r'''(\b(?:src|href)\s*=\s*)(["'])([^"']*)\2''', re.IGNORECASE)
+
+
+def hashed_name(path, digest):
+    '''
+    Returns path with digest before its extension.
+    '''
+    root, extension = os.path.splitext(path)
+    return '%s.%s%s' % (root, digest[:HASH_LENGTH], extension)
+
+
+def content_type(path):
+    mimetype, encoding = mimetypes.guess_type(path)
+    return mimetype or 'application/octet-stream'
+
+
+def build(source, output, level=9):
+    '''
+    Write the hashed and compressed copies of the files of the folder source
+    and their manifest to the folder output, removing its previous content.
+    Returns the manifest: relative path -> {'path': hashed path, 'etag',
+    'gzip': True if there is a compressed copy}.
+    '''
+    if os.path.exists(output):
+        shutil.rmtree(output)
+    os.makedirs(output)
+    output_real = os.path.realpath(output)
+    manifest = {}
+    for folder, folders, files in os.walk(source):
+        # Never copy the output into itself
+        folders[:] = [name for name in folders if os.path.realpath(os.path.join(folder, name)) != output_real]
+        for name in files:
+            path = os.path.join(folder, name)
+            relative = os.path.relpath(path, source).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha1(data).hexdigest()
+            target = hashed_name(relative, digest)
+            target_path = os.path.join(output, *target.split('/'))
+            if not os.path.isdir(os.path.dirname(target_path)):
+                os.makedirs(os.path.dirname(target_path))
+            with open(target_path, 'wb') as f:
+                f.write(data)
+            compressed = False
+            if is_compressible(content_type(relative)):
+                with open(target_path + '.gz', 'wb') as raw:
+                    # mtime 0: the same content always gives the same copy
+                    with gzip.GzipFile('', 'wb', level, raw, mtime=0) as f:
+                        f.write(data)
+                compressed = os.path.getsize(target_path + '.gz') < len(data)
+                if not compressed:
+                    os.remove(target_path + '.gz')
+            manifest[relative] = {'path': target, 'etag': digest[:HASH_LENGTH], 'gzip': compressed}
+    with open(os.path.join(output, MANIFEST), 'wb') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+class StaticAssets(object):
+    '''
+    WSGI middleware that serves the copies built in the folder output under
+    the url prefix and passes the other requests to app.
+    '''
+
+    def __init__(self, app, prefix, output):
+        self.app = app
+        self.prefix = '/' + prefix.strip('/') + '/'
+        self.output = output
+        # url path (relative to prefix) -> (manifest entry, immutable)
+        self.files = {}
+        # hashed path of the HTML pages -> (etag, content, compressed content or None)
+        self.pages = {}
+        manifest_path = os.path.join(output, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'rb') as f:
+                manifest = json.load(f)
+            for relative, entry in manifest.iteritems():
+                self.files[relative] = (entry, False)
+                self.files[entry['path']] = (entry, True)
+            for relative, entry in manifest.iteritems():
+                if content_type(relative) == 'text/html':
+                    self.pages[entry['path']] = self._page(relative.encode('utf-8'), entry)
+
+    def _page(self, relative, entry):
+        '''
+        Returns (etag, content, compressed content or None) of the copy of
+        the HTML page relative with the urls of the hashed copies.
+        '''
+        with open(os.path.join(self.output, *entry['path'].split('/')), 'rb') as f:
+            content = _REFERENCE.sub(lambda match: match.group(1) + match.group(2) +
+                                     self._reference(relative, match.group(3)) + match.group(2), f.read())
+        compressed = StringIO.StringIO()
+        with gzip.GzipFile('', 'wb', 9, compressed, mtime=0) as f:
+            f.write(content)
+        compressed = compressed.getvalue()
+        return (hashlib.sha1(content).hexdigest()[:HASH_LENGTH], content,
+                compressed if len(compressed) < len(content) else None)
+
+    def _reference(self, page, url):
+        '''
+        Returns the url of the hashed copy of the file that the page (relative
+        path) references with url, or url if it is not a static file. Both
+        are byte strings, like the content of the page.
+        '''
+        path = re.split(r'[?#]', url, 1)[0]
+        if not path or ':' in path or path.startswith('//'):
+            return url
+        if path.startswith('/'):
+            if not path.startswith(self.prefix):
+                return url
+            relative = path[len(self.prefix):]
+        else:
+            relative = posixpath.normpath(posixpath.join(posixpath.dirname(page), path))
+        found = self.files.get(relative)
+        # The links between the pages keep the names the users know
+        if found is None or found[1] or content_type(relative) == 'text/html':
+            return url
+        return self.url(relative).encode('utf-8') + url[len(path):]
+
+    def url(self, path):
+        '''
+        Returns the url of the hashed copy of the static file path (relative
+        to the source folder), or of path if it has no copy.
+        '''
+        found = self.files.get(path)
+        return self.prefix + (found[0]['path'] if found is not None else path)
+
+    def __call__(self, environ, start_response):
+        path = environ.get('SCRIPT_NAME', '') + environ.get('PATH_INFO', '')
+        if not path.startswith(self.prefix) or environ.get('REQUEST_METHOD') not in ('GET', 'HEAD'):
+            return self.app(environ, start_response)
+        found = self.files.get(path[len(self.prefix):])
+        if found is None:
+            return self.app(environ, start_response)
+        entry, immutable = found
+        page = self.pages.get(entry['path'])
+        tag = page[0] if page is not None else entry['etag']
+        headers = [('Content-Type', content_type(entry['path'])), ('ETag', '"%s"' % tag), ('Vary', 'Accept-Encoding'),
+                   ('Cache-Control', IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL)]
+        if parse_etags(environ.get('HTTP_IF_NONE_MATCH')).contains_weak(tag):
+            start_response('304 Not Modified', headers)
+            return []
+        accepts_gzip = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))['gzip'] > 0
+        if page is not None:
+            content = page[1]
+            if page[2] is not None and accepts_gzip:
+                content = page[2]
+                headers.append(('Content-Encoding', 'gzip'))
+            headers.append(('Content-Length', str(len(content))))
+            start_response('200 OK', headers)
+            return [content] if environ['REQUEST_METHOD'] != 'HEAD' else []
+        file_path = os.path.join(self.output, *entry['path'].split('/'))
+        if entry['gzip'] and accepts_gzip:
+            file_path += '.gz'
+            headers.append(('Content-Encoding', 'gzip'))
+        headers.append(('Content-Length', str(os.path.getsize(file_path))))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        return wrap_file(environ, open(file_path, 'rb'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the hashed and compressed copies of the static files.')
+    parser.add_argument('source', help='folder of the static files')
+    parser.add_argument('output', help='folder of the copies, its content is replaced')
+    args = parser.parse_args(argv)
+    manifest = build(args.source, args.output)
+    compressed = sum(1 for entry in manifest.itervalues() if entry['gzip'])
+    print json.dumps({'files': len(manifest), 'compressed': compressed})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
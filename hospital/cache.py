@@ -0,0 +1,351 @@
+'''
+Read-through cache of nurses, patients and medicaments.
+
+CachedHospitalDatabase wraps any HospitalDatabaseInterface implementation.
+get_nurse, get_patient and get_medicament are answered from a bounded LRU
+cache per entity whose entries expire after a TTL. The writes made through
+the wrapper evict the entries they change, including the rows removed by the
+ON DELETE CASCADE of the database: deleting a nurse evicts their patients
+and the medicaments of those patients.
+
+Writes made to the database without the wrapper (by another process, e.g.
+another worker of the server) are only seen when the entries expire, unless
+the reader gives the version it has read: every entry keeps the version of
+its object, and an entry of another version is read again. The resources
+give the version of their ETag, so they never send an old body under a new
+ETag.
+'''
+from collections import OrderedDict
+import threading
+import time
+
+import database
+import ids
+
+DEFAULT_CACHE_SIZE = 1000
+# Seconds an entry is kept in the cache
+DEFAULT_CACHE_TTL = 60.0
+
+
+class LRUCache(object):
+    '''
+    Mapping of at most size entries that expire ttl seconds after they are
+    stored. When it is full the least recently used entry is evicted.
+    '''
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL, clock=time.time):
+        if size < 1:
+            raise ValueError("The cache size must be at least 1")
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        # key -> (expiration time, value), the most recently used last
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Incremented by every invalidation, see put
+        self._version = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def get(self, key):
+        '''
+        Returns the value stored for key or None if it is not in the cache
+        or has expired.
+        '''
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if self.ttl is not None and entry[0] <= self.clock():
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            # Put it back as the most recently used
+            self._entries[key] = entry
+            self._stats['hits'] += 1
+            return entry[1]
+
+    @property
+    def version(self):
+        return self._version
+
+    def put(self, key, value, version=None):
+        '''
+        Store value for key. If version is given (the version before value
+        was read) and there has been an invalidation since then, value may
+        be stale and it is not stored.
+        '''
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key):
+        '''
+        Remove key from the cache. Returns True if it was there.
+        '''
+        with self._lock:
+            self._version += 1
+            if self._entries.pop(key, None) is None:
+                return False
+            self._stats['invalidations'] += 1
+            return True
+
+    def invalidate_where(self, predicate):
+        '''
+        Remove the entries whose value satisfies predicate. Returns the keys
+        that have been removed.
+        '''
+        with self._lock:
+            self._version += 1
+            keys = [key for key, (expires, value) in self._entries.iteritems() if predicate(value)]
+            for key in keys:
+                del self._entries[key]
+            self._stats['invalidations'] += len(keys)
+        return keys
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def stats(self):
+        '''
+        Return a dictionary with the cache configuration and counters.
+        '''
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        stats['size'] = self.size
+        stats['ttl'] = self.ttl
+        return stats
+
+
+class CachedHospitalDatabase(database.HospitalDatabaseInterface):
+    '''
+    HospitalDatabaseInterface that keeps the nurses, patients and medicaments
+    read from db in an LRUCache per entity, as (object, version) entries (the
+    version is None if the reader did not give it). Only the objects with
+    all their fields are cached, a request with fields is projected from
+    them. The lists are always read from db.
+    The methods that are not part of the interface (migrate, connection...)
+    are those of db.
+    '''
+
+    def __init__(self, db, size=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_TTL, clock=time.time):
+        super(CachedHospitalDatabase, self).__init__()
+        self.db = db
+        self.nurses = LRUCache(size, ttl, clock)
+        self.patients = LRUCache(size, ttl, clock)
+        self.medicaments = LRUCache(size, ttl, clock)
+
+    def __getattr__(self, name):
+        if name == 'db':
+            raise AttributeError(name)
+        return getattr(self.db, name)
+
+    def cache_stats(self):
+        '''
+        Returns the counters of the cache of every entity.
+        '''
+        return {'nurses': self.nurses.stats(), 'patients': self.patients.stats(),
+                'medicaments': self.medicaments.stats()}
+
+    def clear_cache(self):
+        self.nurses.clear()
+        self.patients.clear()
+        self.medicaments.clear()
+
+    def after_fork(self):
+        # Whatever the parent process had cached may have changed since then
+        self.clear_cache()
+        self.db.after_fork()
+
+    def _get(self, cache, codec, known_fields, read, itemid, fields, version):
+        '''
+        Returns the item itemid from cache, reading it with read on a miss or
+        if the cached item is not of the given version.
+        '''
+        number = codec.decode(itemid)
+        layout = database.get_layout(known_fields, fields)
+        entry = cache.get(number)
+        if entry is not None and (version is None or entry[1] == version):
+            return entry[0].project(layout)
+        # A write between the read and the put must win
+        cache_version = cache.version
+        item = read(number)
+        if item is None:
+            return None
+        # version was read before the item: at worst a newer item is read
+        # again the next time
+        cache.put(number, (item, version), cache_version)
+        return item.project(layout)
+
+    def _evict_patients(self, patientids):
+        '''
+        Evict the patients and the medicaments of the patients with the given
+        numbers.
+        '''
+        for patientid in patientids:
+            self.patients.invalidate(patientid)
+        self.medicaments.invalidate_where(lambda entry: entry[0].raw('patient id') in patientids)
+
+    def clean(self):
+        self.clear_cache()
+        return self.db.clean()
+
+    def load_init_values(self):
+        self.clear_cache()
+        return self.db.load_init_values()
+
+    # NURSES
+    def get_nurse(self, nurseid, fields=None, version=None):
+        return self._get(self.nurses, ids.NURSE_IDS, database.NURSE_FIELDS, self.db.get_nurse, nurseid, fields,
+                         version)
+
+    def get_nurses_list(self, limit=None, after=None, fields=None):
+        return self.db.get_nurses_list(limit, after, fields)
+
+    def iter_nurses_list(self, fields=None):
+        return self.db.iter_nurses_list(fields)
+
+    def modify_nurse(self, nurseid, nursename, nursesurname, nursepn, nurseaddress):
+        number = ids.NURSE_IDS.decode(nurseid)
+        try:
+            return self.db.modify_nurse(number, nursename, nursesurname, nursepn, nurseaddress)
+        finally:
+            self.nurses.invalidate(number)
+
+    def append_nurse(self, nursename, nursesurname, nursepn, nurseaddress):
+        # Misses are not cached, a new id has nothing to invalidate
+        return self.db.append_nurse(nursename, nursesurname, nursepn, nurseaddress)
+
+    def append_nurses(self, nurses):
+        return self.db.append_nurses(nurses)
+
+    def delete_nurse(self, nurseid):
+        number = ids.NURSE_IDS.decode(nurseid)
+        # The database deletes the patients of the nurse too
+        patientids = set(patient.raw('id') for patient in self.db.iter_nurses_patient_list(number, ['id']))
+        try:
+            return self.db.delete_nurse(number)
+        finally:
+            self.nurses.invalidate(number)
+            patientids.update(self.patients.invalidate_where(lambda entry: entry[0].raw('nurse id') == number))
+            self._evict_patients(patientids)
+
+    def contains_nurse(self, nurseid):
+        number = ids.NURSE_IDS.decode(nurseid)
+        return self.nurses.get(number) is not None or self.db.contains_nurse(number)
+
+    # PATIENTS
+    def get_patient(self, patientid, fields=None, version=None):
+        return self._get(self.patients, ids.PATIENT_IDS, database.PATIENT_FIELDS, self.db.get_patient,
+                         patientid, fields, version)
+
+    def get_nurses_patient_list(self, nurseid, limit=None, after=None, fields=None):
+        return self.db.get_nurses_patient_list(nurseid, limit, after, fields)
+
+    def iter_nurses_patient_list(self, nurseid, fields=None):
+        return self.db.iter_nurses_patient_list(nurseid, fields)
+
+    def modify_patient(self, patientid, patientname, patientsurname, patientroom, patientpn, patientaddress):
+        number = ids.PATIENT_IDS.decode(patientid)
+        try:
+            return self.db.modify_patient(number, patientname, patientsurname, patientroom, patientpn,
+                                          patientaddress)
+        finally:
+            self.patients.invalidate(number)
+
+    def delete_patient(self, patientid):
+        number = ids.PATIENT_IDS.decode(patientid)
+        try:
+            return self.db.delete_patient(number)
+        finally:
+            # The database deletes the medicaments of the patient too
+            self._evict_patients(set([number]))
+
+    def contains_patient(self, patientid):
+        number = ids.PATIENT_IDS.decode(patientid)
+        return self.patients.get(number) is not None or self.db.contains_patient(number)
+
+    # MEDICAMENTS
+    def get_medicament(self, medicamentid, fields=None, version=None):
+        return self._get(self.medicaments, ids.MEDICAMENT_IDS, database.MEDICAMENT_FIELDS,
+                         self.db.get_medicament, medicamentid, fields, version)
+
+    def get_patient_medication_list(self, patientid, limit=None, after=None, fields=None):
+        return self.db.get_patient_medication_list(patientid, limit, after, fields)
+
+    def iter_patient_medication_list(self, patientid, fields=None):
+        return self.db.iter_patient_medication_list(patientid, fields)
+
+    def modify_medicament(self, medid, medname, meddosage, medduration, medhours, medbag, medadmin):
+        number = ids.MEDICAMENT_IDS.decode(medid)
+        try:
+            return self.db.modify_medicament(number, medname, meddosage, medduration, medhours, medbag,
+                                             medadmin)
+        finally:
+            self.medicaments.invalidate(number)
+
+    def append_medication(self, medname, meddosage, medduration, medhours, medbag, medadmin, medpatient):
+        return self.db.append_medication(medname, meddosage, medduration, medhours, medbag, medadmin, medpatient)
+
+    def append_medications(self, medicaments):
+        return self.db.append_medications(medicaments)
+
+    def delete_medicament(self, medicamentid):
+        number = ids.MEDICAMENT_IDS.decode(medicamentid)
+        try:
+            return self.db.delete_medicament(number)
+        finally:
+            self.medicaments.invalidate(number)
+
+    def contains_medicament(self, medicamentid):
+        number = ids.MEDICAMENT_IDS.decode(medicamentid)
+        return self.medicaments.get(number) is not None or self.db.contains_medicament(number)
+
+    # RELATED OBJECTS
+    def get_related_items(self, entity, field, values, fields=None, limit=None):
+        return self.db.get_related_items(entity, field, values, fields, limit)
+
+    # WARD
+    def get_nurse_ward(self, nurseid):
+        # One query is cheaper than one cache lookup per object
+        return self.db.get_nurse_ward(nurseid)
+
+    # DOSES
+    def get_due_doses(self, start, end, nurseid=None, limit=None):
+        # The doses change with the time, they are never cached
+        return self.db.get_due_doses(start, end, nurseid, limit)
+
+    # VERSIONS
+    def get_nurse_version(self, nurseid):
+        return self.db.get_nurse_version(nurseid)
+
+    def get_patient_version(self, patientid):
+        return self.db.get_patient_version(patientid)
+
+    def get_medicament_version(self, medicamentid):
+        return self.db.get_medicament_version(medicamentid)
+
+    def get_nurses_version(self):
+        return self.db.get_nurses_version()
+
+    def get_patients_version(self):
+        return self.db.get_patients_version()
+
+    def get_medicaments_version(self):
+        return self.db.get_medicaments_version()
+
+    # CHANGES
+    def get_changes(self, since=0, limit=None):
+        return self.db.get_changes(since, limit)
+
+    def get_change_sequence(self):
+        return self.db.get_change_sequence()
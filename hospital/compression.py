@@ -0,0 +1,137 @@
+'''
+WSGI middleware that compresses the responses with gzip or deflate.
+
+A response is compressed when the Accept-Encoding header of the request
+allows it, its media type is compressible and it has at least min_size
+bytes. The responses without Content-Length (streamed collections) are
+compressed as they are produced, flushing every chunk so that the client
+still receives them as soon as they are ready.
+
+The compressed responses send Vary: Accept-Encoding and their strong ETag
+becomes weak (W/"..."), since the bytes are not those of the original
+representation. If-None-Match uses the weak comparison, so a client
+revalidating the compressed copy still gets a 304.
+
+Usage:
+    application = CompressionMiddleware(application, min_size=1024)
+'''
+from itertools import chain
+import zlib
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header
+from werkzeug.wsgi import ClosingIterator
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_LEVEL = 6
+# Media types worth compressing, text/* always is
+COMPRESSIBLE_TYPES = frozenset(['application/json', 'application/javascript', 'application/x-javascript',
+                                'application/xml', 'image/svg+xml', 'application/x-ndjson',
+                                'application/msgpack', 'application/x-msgpack', 'application/cbor'])
+# Content codings in the order they are preferred: name -> zlib wbits
+ENCODINGS = [('gzip', 16 + zlib.MAX_WBITS), ('deflate', zlib.MAX_WBITS)]
+
+
+def choose_encoding(accept_encoding):
+    '''
+    Returns the name and the zlib wbits of the content coding to use for a
+    request with the given Accept-Encoding header, or None for identity.
+    '''
+    if not accept_encoding:
+        return None
+    accepted = parse_accept_header(accept_encoding)
+    best = None
+    for name, wbits in ENCODINGS:
+        quality = accepted[name]
+        if quality > 0 and (best is None or quality > best[0]):
+            best = (quality, name, wbits)
+    return best[1:] if best is not None else None
+
+
+def is_compressible(mimetype):
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware(object):
+    '''
+    Compresses the responses of app of at least min_size bytes with zlib
+    compression level.
+    '''
+
+    def __init__(self, app, min_size=DEFAULT_MIN_SIZE, level=DEFAULT_LEVEL):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+
+    def __call__(self, environ, start_response):
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            captured[:] = [status, headers, exc_info]
+            # The body is written through the iterable, never with write()
+            return lambda data: None
+        body = self.app(environ, capture)
+        if not captured:
+            # Some applications call start_response in the first iteration
+            iterator = iter(body)
+            first = next(iterator, '')
+            body = ClosingIterator(chain([first], iterator), getattr(body, 'close', None))
+        status, headers, exc_info = captured
+        headers = Headers(headers)
+        if not self._should_compress(status, headers):
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return body
+        length = headers.get('Content-Length', type=int)
+        if length is not None:
+            try:
+                data = ''.join(body)
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+            if len(data) < self.min_size:
+                start_response(status, headers.to_wsgi_list(), exc_info)
+                return [data]
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, encoding[1])
+            data = compressor.compress(data) + compressor.flush()
+            self._set_headers(headers, encoding[0])
+            headers['Content-Length'] = str(len(data))
+            start_response(status, headers.to_wsgi_list(), exc_info)
+            return [data]
+        self._set_headers(headers, encoding[0])
+        start_response(status, headers.to_wsgi_list(), exc_info)
+        return self._compress_stream(body, encoding[1])
+
+    def _should_compress(self, status, headers):
+        if int(status.split(None, 1)[0]) in (204, 206, 304) or 'Content-Encoding' in headers:
+            return False
+        if 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        mimetype = headers.get('Content-Type', '').split(';')[0].strip().lower()
+        return is_compressible(mimetype)
+
+    def _set_headers(self, headers, name):
+        headers['Content-Encoding'] = name
+        vary = [value.strip() for value in headers.get('Vary', '').split(',') if value.strip()]
+        if 'accept-encoding' not in [value.lower() for value in vary]:
+            vary.append('Accept-Encoding')
+        headers['Vary'] = ', '.join(vary)
+        etag = headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            headers['ETag'] = 'W/' + etag
+
+    def _compress_stream(self, body, wbits):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, wbits)
+        try:
+            for chunk in body:
+                data = compressor.compress(chunk)
+                if chunk:
+                    data += compressor.flush(zlib.Z_SYNC_FLUSH)
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
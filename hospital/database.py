@@ -1,15 +1,548 @@
-from copy import deepcopy
+from collections import Mapping, OrderedDict
+from contextlib import contextmanager
+import logging
+import Queue
+import threading
 import sqlite3
 import sys
-import re
 import os
+import time
+
+import ids
+import migrations
+import schedule
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_POOL_TIMEOUT = 5.0
+# Rows read with a pooled connection by the iterators of the collections
+STREAM_PAGE_SIZE = 500
+# Locks of every entity of the in memory database
+DEFAULT_LOCK_STRIPES = 16
+DEFAULT_STORAGE_PROFILE = 'development'
+
+
+# Fields of the objects returned by the databases: name -> (column, id prefix),
+# in the order of the columns of the table
+NURSE_FIELDS = OrderedDict([
+    ('id', ('nurse_id', 'nur-')), ('name', ('name', None)), ('surname', ('surname', None)),
+    ('phone number', ('phone_number', None)), ('address', ('address', None))])
+PATIENT_FIELDS = OrderedDict([
+    ('id', ('patient_id', 'pat-')), ('name', ('name', None)), ('surname', ('surname', None)),
+    ('room', ('room', None)), ('phone number', ('phone_number', None)), ('address', ('address', None)),
+    ('nurse id', ('p_nurse', 'nur-')), ('doctor id', ('p_doctor', 'doc-'))])
+MEDICAMENT_FIELDS = OrderedDict([
+    ('id', ('medicament_id', 'med-')), ('name', ('name', None)), ('dosage', ('dosage', None)),
+    ('duration', ('duration', None)), ('hours', ('hours', None)), ('bag volume', ('bag_volume', None)),
+    ('administration', ('administration', None)), ('patient id', ('m_patient', 'pat-'))])
+DOCTOR_FIELDS = OrderedDict([
+    ('id', ('doctor_id', 'doc-')), ('name', ('name', None)), ('surname', ('surname', None)),
+    ('phone number', ('phone_number', None)), ('address', ('address', None))])
+# Fields of the doses returned by get_due_doses, with the medicament and the
+# patient they are given to. The columns are those of the query of
+# HospitalDatabase.get_due_doses.
+DOSE_FIELDS = OrderedDict([
+    ('due time', ('d.due_time', None)), ('medicament id', ('d.medicament_id', 'med-')),
+    ('patient id', ('m.m_patient', 'pat-')), ('nurse id', ('d.nurse_id', 'nur-')),
+    ('medicament', ('m.name', None)), ('dosage', ('m.dosage', None)),
+    ('administration', ('m.administration', None)), ('patient', ('p.name', None)),
+    ('surname', ('p.surname', None)), ('room', ('p.room', None))])
+
+# Entities of the database: name -> (table, primary key, fields, id codec)
+ENTITIES = OrderedDict([
+    ('nurses', ('nurses_profile', 'nurse_id', NURSE_FIELDS, ids.NURSE_IDS)),
+    ('patients', ('patients_profile', 'patient_id', PATIENT_FIELDS, ids.PATIENT_IDS)),
+    ('medicaments', ('medicaments', 'medicament_id', MEDICAMENT_FIELDS, ids.MEDICAMENT_IDS)),
+    ('doctors', ('doctors_profile', 'doctor_id', DOCTOR_FIELDS, ids.DOCTOR_IDS))])
+# Entities of the change feed (the doctors are not written by the API)
+CHANGE_ENTITIES = OrderedDict((entity, ENTITIES[entity]) for entity in ('nurses', 'patients', 'medicaments'))
+
+
+def check_fields(known_fields, fields):
+    '''
+    Raises ValueError if fields (a list of field names or None for all the
+    fields) contains a name that is not in known_fields.
+    '''
+    if fields is None:
+        return
+    for field in fields:
+        if field not in known_fields:
+            raise ValueError("Unknown field %s" % field)
+
+
+def related_fields(entity, field, fields):
+    '''
+    Checks the arguments of get_related_items. Returns the fields of entity
+    to read, which always include field.
+    raises ValueError if the entity or a field is unknown.
+    '''
+    if entity not in ENTITIES:
+        raise ValueError("Unknown entity %s" % entity)
+    known_fields = ENTITIES[entity][2]
+    check_fields(known_fields, [field])
+    check_fields(known_fields, fields)
+    if fields is not None and field not in fields:
+        fields = [field] + list(fields)
+    return fields
+
+
+def limit_per_value(records, field, limit):
+    '''
+    Yields the first limit records (sorted by field) of every value of field.
+    '''
+    value, count = None, 0
+    for record in records:
+        if count == 0 or record.raw(field) != value:
+            value, count = record.raw(field), 0
+        count += 1
+        if limit is None or count <= limit:
+            yield record
+
+
+class RecordLayout(object):
+    '''
+    Names, columns and id prefixes of the fields stored in a Record. A layout
+    is shared by all the records built with the same fields.
+    '''
+    __slots__ = ('names', 'columns', 'prefixes', 'index')
+
+    def __init__(self, known_fields, names):
+        self.names = tuple(names)
+        self.columns = tuple(known_fields[name][0] for name in self.names)
+        self.prefixes = tuple(known_fields[name][1] for name in self.names)
+        self.index = dict((name, position) for position, name in enumerate(self.names))
+
+
+# Cache of layouts: (id of the field map, set of fields) -> RecordLayout
+_LAYOUTS = {}
+
+
+def get_layout(known_fields, fields=None):
+    '''
+    Returns the RecordLayout with the given fields of known_fields (all of
+    them if fields is None), in the order of known_fields.
+    raises ValueError if a field is unknown.
+    '''
+    key = (id(known_fields), frozenset(fields) if fields is not None else None)
+    layout = _LAYOUTS.get(key)
+    if layout is None:
+        check_fields(known_fields, fields)
+        names = [name for name in known_fields if fields is None or name in fields]
+        layout = _LAYOUTS[key] = RecordLayout(known_fields, names)
+    return layout
+
+
+class Record(object):
+    '''
+    Read only mapping returned by the databases for a nurse, a patient or a
+    medicament. The values are kept in a tuple as they are stored in the
+    database (for instance a row returned by a sqlite3 cursor) and the ids
+    are only formatted ('nur-' + id) when they are read, so building a record
+    costs a single small object.
+    Records cannot be modified: the databases and the cache return the
+    records they store to every reader without copying them, and a write
+    stores a new record (see replace). Copying a record returns the record
+    itself.
+    '''
+    __slots__ = ('_layout', '_values')
+
+    def __init__(self, layout, values):
+        # tuple() returns the same tuple, the rows of sqlite3 cost nothing
+        object.__setattr__(self, '_layout', layout)
+        object.__setattr__(self, '_values', tuple(values))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Records are read only")
+
+    def __delattr__(self, name):
+        raise AttributeError("Records are read only")
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getitem__(self, name):
+        position = self._layout.index[name]
+        value = self._values[position]
+        prefix = self._layout.prefixes[position]
+        if prefix is None or value is None:
+            return value
+        return prefix + str(value)
+
+    def raw(self, name):
+        '''
+        Returns the value of a field as it is stored (the number of an id).
+        '''
+        return self._values[self._layout.index[name]]
+
+    def get(self, name, default=None):
+        return self[name] if name in self._layout.index else default
+
+    def __contains__(self, name):
+        return name in self._layout.index
+
+    def __iter__(self):
+        return iter(self._layout.names)
+
+    def __len__(self):
+        return len(self._layout.names)
+
+    def keys(self):
+        return list(self._layout.names)
+
+    def values(self):
+        return [self[name] for name in self._layout.names]
+
+    def items(self):
+        return [(name, self[name]) for name in self._layout.names]
+
+    def iterkeys(self):
+        return iter(self._layout.names)
+
+    def itervalues(self):
+        for name in self._layout.names:
+            yield self[name]
+
+    def iteritems(self):
+        for name in self._layout.names:
+            yield name, self[name]
+
+    def as_dict(self):
+        '''
+        Returns a new dictionary with the fields of the record.
+        '''
+        return dict(self.iteritems())
+
+    def project(self, layout):
+        '''
+        Returns a record with the fields of layout, which must be a subset
+        of the fields of this record.
+        '''
+        if layout is self._layout:
+            return self
+        index = self._layout.index
+        return Record(layout, tuple(self._values[index[name]] for name in layout.names))
+
+    def replace(self, changes):
+        '''
+        Returns a copy of the record with the stored values of some fields
+        changed. changes is a dictionary field name -> value.
+        '''
+        values = list(self._values)
+        for name, value in changes.iteritems():
+            values[self._layout.index[name]] = value
+        return Record(self._layout, tuple(values))
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return self._layout.names == other._layout.names and self.items() == other.items()
+        if isinstance(other, dict):
+            return self.as_dict() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Record(%r)' % self.as_dict()
+
+# The records can be used wherever a read only mapping is expected
+Mapping.register(Record)
+
+
+class HospitalDatabaseError(Exception):
+    '''
+    Raised when the database could not be accessed or modified.
+    '''
+    pass
+
+
+class PoolTimeoutError(HospitalDatabaseError):
+    '''
+    Raised when no connection could be checked out of the pool before the
+    wait timeout expired.
+    '''
+    pass
+
+
+class StorageProfile(object):
+    '''
+    SQLite settings applied to every connection when it is created:
+    journal mode, busy timeout (milliseconds), synchronous level and the
+    WAL checkpoint policy (pages between automatic checkpoints and the
+    checkpoint mode used when the database is closed).
+    '''
+    JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+    SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+    CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+    def __init__(self, journal_mode='DELETE', synchronous='FULL', busy_timeout=5000,
+                 wal_autocheckpoint=1000, checkpoint_on_close=None):
+        journal_mode = journal_mode.upper()
+        synchronous = synchronous.upper()
+        if journal_mode not in self.JOURNAL_MODES:
+            raise ValueError("Unknown journal mode %s" % journal_mode)
+        if synchronous not in self.SYNCHRONOUS_LEVELS:
+            raise ValueError("Unknown synchronous level %s" % synchronous)
+        if checkpoint_on_close is not None:
+            checkpoint_on_close = checkpoint_on_close.upper()
+            if checkpoint_on_close not in self.CHECKPOINT_MODES:
+                raise ValueError("Unknown checkpoint mode %s" % checkpoint_on_close)
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout = int(busy_timeout)
+        self.wal_autocheckpoint = wal_autocheckpoint
+        self.checkpoint_on_close = checkpoint_on_close
+
+    @property
+    def wal(self):
+        return self.journal_mode == 'WAL'
+
+    def apply(self, con):
+        '''
+        Apply the profile to a new connection.
+        '''
+        # The busy timeout goes first so that changing the journal mode
+        # waits for other connections instead of failing
+        con.execute('PRAGMA busy_timeout = %d' % self.busy_timeout)
+        con.execute('PRAGMA journal_mode = %s' % self.journal_mode)
+        con.execute('PRAGMA synchronous = %s' % self.synchronous)
+        if self.wal and self.wal_autocheckpoint is not None:
+            con.execute('PRAGMA wal_autocheckpoint = %d' % self.wal_autocheckpoint)
+
+
+# Profiles that can be selected by name (e.g. from the application config)
+STORAGE_PROFILES = {
+    # SQLite defaults: rollback journal, a writer blocks the readers
+    'development': StorageProfile(journal_mode='DELETE', synchronous='FULL'),
+    # Fast and not durable, for the test suites
+    'testing': StorageProfile(journal_mode='MEMORY', synchronous='OFF'),
+    # Readers never wait on the writer. NORMAL is durable in WAL mode
+    # except on power loss.
+    'production': StorageProfile(journal_mode='WAL', synchronous='NORMAL', busy_timeout=5000,
+                                 wal_autocheckpoint=1000, checkpoint_on_close='TRUNCATE'),
+}
+
+
+def get_storage_profile(profile):
+    '''
+    Returns the StorageProfile with the given name. StorageProfile objects
+    are returned unchanged.
+    raises ValueError if there is no profile with that name.
+    '''
+    if isinstance(profile, StorageProfile):
+        return profile
+    try:
+        return STORAGE_PROFILES[profile]
+    except KeyError:
+        raise ValueError("Unknown storage profile %s" % profile)
+
+
+class ConnectionPool(object):
+    '''
+    Bounded pool of sqlite3 connections to the same database file.
+    Connections are configured once when they are created (row factory and
+    foreign keys support) and then reused by every checkout. A checkout
+    blocks at most timeout seconds when all the connections are in use.
+    '''
+
+    def __init__(self, db_path, size=DEFAULT_POOL_SIZE, timeout=DEFAULT_POOL_TIMEOUT, on_connect=None):
+        if size < 1:
+            raise ValueError("The pool size must be at least 1")
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        # Optional callable applied to every new connection after the defaults
+        self.on_connect = on_connect
+        # LIFO so the most recently used (hot) connection is reused first
+        self._idle = Queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        # Connections created before the last close_all() are discarded
+        self._generation = 0
+        # Connections of the parent process kept open after a fork, see reset_after_fork
+        self._inherited = []
+        self._stats = {'created': 0, 'closed': 0, 'checkouts': 0, 'waits': 0, 'timeouts': 0}
+
+    def _connect(self):
+        '''
+        Open and configure a new connection.
+        '''
+        # The connection is shared between threads through the pool, never
+        # used by two threads at the same time.
+        con = sqlite3.connect(self.db_path, check_same_thread=False)
+        con.row_factory = sqlite3.Row
+        # Provide support for foreign keys
+        con.execute('PRAGMA foreign_keys = ON')
+        if self.on_connect is not None:
+            self.on_connect(con)
+        return con
+
+    def checkout(self):
+        '''
+        Take a connection from the pool, creating it if the pool has not
+        reached its size yet.
+        raises PoolTimeoutError if no connection was available in time.
+        '''
+        try:
+            con, generation = self._idle.get_nowait()
+        except Queue.Empty:
+            con = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    generation = self._generation
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    con = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+                with self._lock:
+                    self._stats['created'] += 1
+            else:
+                with self._lock:
+                    self._stats['waits'] += 1
+                try:
+                    con, generation = self._idle.get(timeout=self.timeout)
+                except Queue.Empty:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise PoolTimeoutError("No database connection available after %s seconds" % self.timeout)
+        with self._lock:
+            self._stats['checkouts'] += 1
+        return con, generation
+
+    def checkin(self, con, generation):
+        '''
+        Give back a connection obtained with checkout.
+        '''
+        with self._lock:
+            stale = generation != self._generation
+        if stale:
+            # The pool was closed while the connection was checked out
+            self._close(con)
+            return
+        self._idle.put_nowait((con, generation))
+
+    def _close(self, con):
+        con.close()
+        with self._lock:
+            self._stats['closed'] += 1
+
+    @contextmanager
+    def connection(self):
+        '''
+        Context manager that checks out a connection, runs the block inside
+        a transaction (commit on success, rollback on error) and checks the
+        connection back in.
+        '''
+        con, generation = self.checkout()
+        try:
+            with con:
+                yield con
+        finally:
+            self.checkin(con, generation)
+
+    def resize(self, size):
+        '''
+        Change the number of connections of the pool. The open connections
+        are closed as in close_all: call it before using the pool.
+        '''
+        if size < 1:
+            raise ValueError("The pool size must be at least 1")
+        self.close_all()
+        with self._lock:
+            self.size = size
+            self._idle = Queue.LifoQueue(maxsize=size)
+
+    def close_all(self):
+        '''
+        Close the idle connections. Connections currently checked out are
+        closed when they are given back.
+        '''
+        with self._lock:
+            self._generation += 1
+            self._created = 0
+        while True:
+            try:
+                con, generation = self._idle.get_nowait()
+            except Queue.Empty:
+                break
+            self._close(con)
+
+    def reset_after_fork(self):
+        '''
+        Forget the connections inherited from the parent process, in a child
+        process created with fork. They are not closed: closing them could
+        checkpoint or remove the WAL the parent is still using. The child
+        creates its own connections when it needs them.
+        '''
+        # The lock may have been held by another thread of the parent
+        self._lock = threading.Lock()
+        while True:
+            try:
+                self._inherited.append(self._idle.get_nowait())
+            except Queue.Empty:
+                break
+        self._idle = Queue.LifoQueue(maxsize=self.size)
+        self._generation += 1
+        self._created = 0
+
+    def stats(self):
+        '''
+        Return a dictionary with the pool configuration and counters.
+        '''
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['timeout'] = self.timeout
+            stats['open'] = self._created
+        stats['idle'] = self._idle.qsize()
+        stats['in_use'] = stats['open'] - stats['idle']
+        return stats
+
+
+class StripedLock(object):
+    '''
+    Fixed number of reentrant locks shared by any number of keys. The lock
+    of a key is chosen by its hash, so threads working on different keys
+    seldom wait for each other and the memory used does not grow with the
+    keys.
+    '''
+
+    def __init__(self, stripes=DEFAULT_LOCK_STRIPES):
+        if stripes < 1:
+            raise ValueError("There must be at least 1 stripe")
+        self._locks = [threading.RLock() for i in range(stripes)]
+
+    def lock(self, key):
+        '''
+        Returns the lock of key.
+        '''
+        return self._locks[hash(key) % len(self._locks)]
+
 
 class HospitalDatabaseInterface(object):
     '''
     Interface to access the database. The structure of input and output depends
     on the implementation. User and Model are data structures (dictionaries or 
-    customized objects)
+    customized objects). Nurses, patients and medicaments are returned as
+    read only Record mappings.
     '''
+    # Returns the current time in seconds since the epoch: the start of the
+    # medication schedules written
+    clock = time.time
     
     def clean(self):
         '''
@@ -23,24 +556,49 @@ class HospitalDatabaseInterface(object):
         values.
         ''' 
         raise NotImplementedError("")
+
+    def after_fork(self):
+        '''
+        Prepare the database to be used in a process created with fork.
+        Nothing to do for the implementations without connections.
+        '''
+        pass
     
     # NURSES
-    def get_nurse(self, nurseid):
+    def get_nurse(self, nurseid, fields=None, version=None):
         '''
         Return a nurse with id equals nurseid or None if there is no 
         such nurse. Raises a value error if nurseid is not well formed.
+        If fields (a list of names of NURSE_FIELDS) is given the nurse
+        only has those fields. Raises a value error if a field is unknown.
+        version is the version of the nurse read by the caller (see
+        get_nurse_version), e.g. for an ETag: an implementation that keeps
+        copies of the nurses must not return a copy of another version. The
+        others ignore it.
         '''
         raise NotImplementedError("")
 
-    def get_nurses_list(self):
+    def get_nurses_list(self, limit=None, after=None, fields=None):
         '''
-        Return a list of all the nurses.
+        Return a list of all the nurses ordered by id.
+        If after (a nurse id) is given only the nurses with a greater id are
+        returned, and at most limit nurses if limit is given. fields works
+        as in get_nurse.
         '''
         raise NotImplementedError("")
 
+    def iter_nurses_list(self, fields=None):
+        '''
+        Return an iterator over all the nurses ordered by id. Implementations
+        may read the nurses lazily, as they are consumed.
+        '''
+        return iter(self.get_nurses_list(fields=fields))
+
     def modify_nurse(self, nurseid, nursename, nursesurname, nursepn, nurseaddress):
         '''
         Modify the data of the nurse with id=nurseid.
+        It is a single conditional write: there is no need to call
+        contains_nurse first.
         raises HospitalDatabaseError if the database could not be modified.
         raises ValueError if the nurseid has a wrong format.
         returns the id of the edited nurse or None if the nurse was not found.
@@ -56,10 +614,20 @@ class HospitalDatabaseInterface(object):
         '''
         raise NotImplementedError("")
 
+    def append_nurses(self, nurses):
+        '''
+        Creates several nurses at once, in a single transaction.
+        nurses is a list of tuples (nursename, nursesurname, nursepn, nurseaddress).
+        raises HospitalDatabaseError if the database could not be modified.
+        returns the list of ids of the new nurses, in the same order.
+        '''
+        raise NotImplementedError("")
+
     def delete_nurse(self, nurseid):
         '''
-        Deletes the nurse that has the id passed as argument. Returns the
-        id of the deleted nurse or None if the nurse was not found.
+        Deletes the nurse that has the id passed as argument. Returns a
+        true value if the nurse was deleted or a false value if it was not
+        found.
         '''
         raise NotImplementedError("")
 
@@ -70,22 +638,33 @@ class HospitalDatabaseInterface(object):
         raise NotImplementedError("")
 
     # PATIENTS
-    def get_patient(self, patientid):
+    def get_patient(self, patientid, fields=None, version=None):
         '''
         Return a patient with id equals patientid or None if there is no 
         such patient. Raises a value error if patientid is not well formed.
+        fields (names of PATIENT_FIELDS) and version work as in get_nurse.
         '''
         raise NotImplementedError("")
 
-    def get_nurses_patient_list(self, nurseid):
+    def get_nurses_patient_list(self, nurseid, limit=None, after=None, fields=None):
         '''
-        Return a list of all the patients of the nurse with Id=nurseid.
+        Return a list of all the patients of the nurse with Id=nurseid
+        ordered by id. limit, after and fields work as in get_nurses_list.
         '''
         raise NotImplementedError("")
 
-    def modify_patients(self, patientid, patientname, patientsurname, patientroom, patientpn, patientaddress):
+    def iter_nurses_patient_list(self, nurseid, fields=None):
+        '''
+        Return an iterator over all the patients of the nurse with Id=nurseid
+        ordered by id. Implementations may read the patients lazily.
+        '''
+        return iter(self.get_nurses_patient_list(nurseid, fields=fields))
+
+    def modify_patient(self, patientid, patientname, patientsurname, patientroom, patientpn, patientaddress):
         '''
         Modify the data of the patient with id=patientid.
+        It is a single conditional write: there is no need to call
+        contains_patient first.
         raises HospitalDatabaseError if the database could not be modified.
         raises ValueError if the patientid has a wrong format.
         returns the id of the edited patient or None if the patient was not found.
@@ -94,8 +673,9 @@ class HospitalDatabaseInterface(object):
 
     def delete_patient(self, patientid):
         '''
-        Deletes the patient that has the id passed as argument. Returns the
-        id of the deleted patient or None if the patient was not found.
+        Deletes the patient that has the id passed as argument. Returns a
+        true value if the patient was deleted or a false value if it was not
+        found.
         '''
         raise NotImplementedError("")
 
@@ -106,22 +686,33 @@ class HospitalDatabaseInterface(object):
         raise NotImplementedError("")
 
     # MEDICAMENTS
-    def get_medicament(self, medicamentid):
+    def get_medicament(self, medicamentid, fields=None, version=None):
         '''
         Return a medicament with id equals medicamentid or None if there is no 
         such medicament. Raises a value error if medicamentid is not well formed.
+        fields (names of MEDICAMENT_FIELDS) and version work as in get_nurse.
         '''
         raise NotImplementedError("")
 
-    def get_patient_medication_list(self, patientid):
+    def get_patient_medication_list(self, patientid, limit=None, after=None, fields=None):
         '''
-        Return a list of all the medicaments of the patient with Id=patientid.
+        Return a list of all the medicaments of the patient with Id=patientid
+        ordered by id. limit, after and fields work as in get_nurses_list.
         '''
         raise NotImplementedError("")
 
+    def iter_patient_medication_list(self, patientid, fields=None):
+        '''
+        Return an iterator over all the medicaments of the patient with
+        Id=patientid ordered by id. Implementations may read them lazily.
+        '''
+        return iter(self.get_patient_medication_list(patientid, fields=fields))
+
     def modify_medicament(self, medid, medname, meddosage, medduration, medhours, medbag, medadmin):
         '''
         Modify the data of the medicament with id=medicamentid.
+        It is a single conditional write: there is no need to call
+        contains_medicament first.
         raises HospitalDatabaseError if the database could not be modified.
         raises ValueError if the medicamentid has a wrong format.
         returns the id of the edited medicament or None if the medicament was not found.
@@ -132,15 +723,27 @@ class HospitalDatabaseInterface(object):
         '''
         Creates a new medicament.
         raises HospitalDatabaseError if the if the database could not be modified.
-        raises ValueError if the medicamentid has a wrong format.
-        returns the id of the new medicament or None if medicamentid does not exist.
+        raises ValueError if the medpatient has a wrong format.
+        returns the id of the new medicament or None if medpatient does not exist.
+        '''
+        raise NotImplementedError("")
+
+    def append_medications(self, medicaments):
+        '''
+        Creates several medicaments at once, in a single transaction.
+        medicaments is a list of tuples (medname, meddosage, medduration,
+        medhours, medbag, medadmin, medpatient).
+        raises HospitalDatabaseError if the database could not be modified.
+        raises ValueError if a medpatient has a wrong format.
+        returns the list of ids of the new medicaments, in the same order.
         '''
         raise NotImplementedError("")
 
     def delete_medicament(self, medicamentid):
         '''
-        Deletes the medicament that has the id passed as argument. Returns the
-        id of the deleted medicament or None if the medicament was not found.
+        Deletes the medicament that has the id passed as argument. Returns a
+        true value if the medicament was deleted or a false value if it was not
+        found.
         '''
         raise NotImplementedError("")
 
@@ -150,176 +753,698 @@ class HospitalDatabaseInterface(object):
         '''
         raise NotImplementedError("")
 
-class HospitalNonPersistentDatabase(HospitalDatabaseInterface):
+    # WARD
+    def get_nurse_ward(self, nurseid):
+        '''
+        Return the nurse with all their patients and the medication of every
+        patient as a tuple (nurse, patients), where patients is a list of
+        (patient, medication list) tuples. The patients and the medicaments
+        are sorted by id. Return None if the nurse does not exist.
+        '''
+        raise NotImplementedError("")
+
+    # DOSES
+    def get_due_doses(self, start, end, nurseid=None, limit=None):
+        '''
+        Return the doses due from start until end (seconds since the epoch,
+        end excluded) of the patients of the nurse with id nurseid, or of all
+        the patients if nurseid is None, as Records with DOSE_FIELDS sorted by
+        due time and medicament id. The doses come from the hours and the
+        duration of the medicaments (see schedule.py): a medicament whose
+        hours are not understood has none.
+        If limit is given at most limit doses are returned.
+        raises ValueError if nurseid is not well formed, limit is negative or
+        end is more than schedule.MAX_AHEAD seconds after the clock.
+        '''
+        raise NotImplementedError("")
+
+    # RELATED OBJECTS
+    def get_related_items(self, entity, field, values, fields=None, limit=None):
+        '''
+        Return the objects of entity (see ENTITIES) whose field has one of the
+        given values (numbers of ids), sorted by field and by id. They are
+        read at once, not once per value: the patients of many nurses are
+        get_related_items('patients', 'nurse id', nurse numbers) and the
+        doctors of many patients get_related_items('doctors', 'id', doctor
+        numbers). field is always one of the fields of the objects.
+        If limit is given at most limit objects are returned for every value.
+        raises ValueError if the entity or a field is unknown.
+        '''
+        raise NotImplementedError("")
+
+    # VERSIONS
+    def get_nurse_version(self, nurseid):
+        '''
+        Return the version of the nurse with id nurseid, a number that grows
+        every time the nurse is modified, or None if there is no such nurse.
+        Raises a value error if nurseid is not well formed.
+        '''
+        raise NotImplementedError("")
 
-    NURSES = {}
+    def get_patient_version(self, patientid):
+        '''
+        Return the version of the patient, see get_nurse_version.
+        '''
+        raise NotImplementedError("")
 
-    PATIENTS = {}
+    def get_medicament_version(self, medicamentid):
+        '''
+        Return the version of the medicament, see get_nurse_version.
+        '''
+        raise NotImplementedError("")
 
-    MEDICAMENTS = {}
+    def get_nurses_version(self):
+        '''
+        Return the version of the nurses, a number that grows every time a
+        nurse is created, modified or deleted.
+        '''
+        raise NotImplementedError("")
 
-    def __init__(self):
+    def get_patients_version(self):
+        '''
+        Return the version of the patients, see get_nurses_version.
+        '''
+        raise NotImplementedError("")
+
+    def get_medicaments_version(self):
+        '''
+        Return the version of the medicaments, see get_nurses_version.
+        '''
+        raise NotImplementedError("")
+
+    # CHANGES
+    def get_changes(self, since=0, limit=None):
+        '''
+        Return the objects changed after the change sequence number since, in
+        the order of the changes, as a list of dictionaries with the keys
+        'sequence', 'entity' (see CHANGE_ENTITIES), 'id', 'deleted' and
+        'item' (the current Record of the object, None if it was deleted).
+        Only the last change of every object is returned, so the length of
+        the list is at most the number of objects changed since then.
+        If limit is given at most limit changes are returned.
+        raises ValueError if since or limit are negative.
+        '''
+        raise NotImplementedError("")
+
+    def get_change_sequence(self):
+        '''
+        Return the sequence number of the last change, 0 if there are none.
+        It only grows: a client that has read the changes up to it only
+        needs get_changes(since) to be in sync.
+        '''
+        raise NotImplementedError("")
+
+class HospitalNonPersistentDatabase(HospitalDatabaseInterface):
+    '''
+    In memory database. Every instance has its own objects, kept in
+    dictionaries by the number of their ids, plus the indexes of the
+    foreign keys (patients by nurse, medicaments by patient), so the
+    patients of a nurse or the medication of a patient are found in O(k)
+    and the deletes cascade through them. The schedules of the medicaments
+    are kept too, and their doses computed when they are read.
+    Reads take no locks: the records are immutable and the sets of the
+    indexes are replaced, never modified. Writes lock the objects they
+    change with striped locks, always in the order nurse, patient,
+    medicament, so threads that write different objects do not wait for
+    each other.
+    '''
+
+    def __init__(self, lock_stripes=DEFAULT_LOCK_STRIPES):
         super(HospitalNonPersistentDatabase, self).__init__()
+        self._nurse_locks = StripedLock(lock_stripes)
+        self._patient_locks = StripedLock(lock_stripes)
+        self._medicament_locks = StripedLock(lock_stripes)
+        # Protects the id counters, the versions and the changes
+        self._lock = threading.Lock()
+        self.clean()
 
     def clean(self):
-        self.NURSES.clear()
-        self.PATIENTS.clear()
-        self.MEDICAMENTS.clear()
+        with self._lock:
+            self.nurses = {}
+            self.patients = {}
+            self.medicaments = {}
+            self.doctors = {}
+            # Indexes of the foreign keys: number -> frozenset of numbers
+            self._patients_by_nurse = {}
+            self._medication_by_patient = {}
+            # Schedules of the medicaments: number -> (interval, first dose, end)
+            self._schedules = {}
+            # Next id of every entity, the ids are never reused
+            self._next_ids = {"nurses": 0, "patients": 0, "medicaments": 0, "doctors": 0}
+            # Versions of the modified objects by (entity, number) and of the tables
+            self._versions = {}
+            self._table_versions = {}
+            # Last change of every object: (entity, number) -> (sequence, deleted),
+            # in the order of the sequence numbers
+            self._changes = OrderedDict()
 
     def load_init_values(self):
-        nurse0_id = "nur-0"
-        nurse_0 = {"id":nurse0_id, "name":"Mateo","surname":"Gil","phone number":987654321,"address":"Bahia Pikachu N 4"}
-
-        nurse1_id = "nur-1"
-        nurse_1 = {"id":nurse1_id, "name":"Jussi","surname":"Hiltunen","phone number":92345678,"address":"Roca Geodude N 404"}
-    
-        patient0_id = "pat-0"
-        patient_0 = {"id":patient0_id,"name":"Juan Carlos", "surname":"Primero","room":1408,"phone number":1,"address":"Palacio de la Zarzuela","nurse id":nurse1_id,"doctor id":"doc-1"}
-    
-        patient1_id = "pat-1"
-        patient_1 = {"id":patient1_id,"name":"Duquesa", "surname":"de Alba","room":2402,"phone number":0,"address":"Casa de Alba","nurse id":nurse0_id,"doctor id":"doc-1"}
-
-        medicament0_id = "med-0"
-        medicament_0 = {"id":medicament0_id,"name":"Paracetamol", "dosage":"1gr","duration":"1 week","hours":"every 8 hours","bag volume":"100 ml","administration":"intravenous","patient id":patient1_id}
-    
-        medicament1_id = "med-1"
-        medicament_1 = {"id":medicament1_id,"name":"Betadine", "dosage":"20ml","duration":"2 days","hours":"every 6 hours","bag volume":"150 ml","administration":"cutaneous","patient id":patient1_id}
-
-        self.NURSES[nurse0_id] = nurse_0
-        self.NURSES[nurse1_id] = nurse_1
-        self.PATIENTS[patient0_id] = patient_0
-        self.PATIENTS[patient1_id] = patient_1
-        self.MEDICAMENTS[medicament0_id] = medicament_0
-        self.MEDICAMENTS[medicament1_id] = medicament_1
-    
-        self.lastnurse = 2
-        self.lastmedicament = 2
+        # The records keep the numbers of the ids, see NURSE_FIELDS
+        nurses = get_layout(NURSE_FIELDS)
+        patients = get_layout(PATIENT_FIELDS)
+        medicaments = get_layout(MEDICAMENT_FIELDS)
+        doctors = get_layout(DOCTOR_FIELDS)
+
+        nurse_0 = Record(nurses, (0, "Mateo", "Gil", 987654321, "Bahia Pikachu N 4"))
+        nurse_1 = Record(nurses, (1, "Jussi", "Hiltunen", 92345678, "Roca Geodude N 404"))
+        patient_0 = Record(patients, (0, "Juan Carlos", "Primero", 1408, 1, "Palacio de la Zarzuela", 1, 1))
+        patient_1 = Record(patients, (1, "Duquesa", "de Alba", 2402, 0, "Casa de Alba", 0, 1))
+        medicament_0 = Record(medicaments, (0, "Paracetamol", "1gr", "1 week", "every 8 hours", "100 ml",
+                                            "intravenous", 1))
+        medicament_1 = Record(medicaments, (1, "Betadine", "20ml", "2 days", "every 6 hours", "150 ml",
+                                            "cutaneous", 1))
+        doctor_1 = Record(doctors, (1, "Gregory", "House", 912121212, "Princeton Plainsboro"))
+
+        self._insert("nurses", nurse_0)
+        self._insert("nurses", nurse_1)
+        self._insert("patients", patient_0)
+        self._insert("patients", patient_1)
+        self._insert("medicaments", medicament_0)
+        self._insert("medicaments", medicament_1)
+        self._insert("doctors", doctor_1)
+        for medicament in (medicament_0, medicament_1):
+            self._schedule(medicament.raw("id"), medicament["hours"], medicament["duration"])
+        # The loaded objects are the first changes
+        for entity in CHANGE_ENTITIES:
+            for number in sorted(self._items(entity)):
+                self._change(entity, number)
+
+    def _items(self, entity):
+        return {"nurses": self.nurses, "patients": self.patients, "medicaments": self.medicaments,
+                "doctors": self.doctors}[entity]
+
+    def _insert(self, entity, record):
+        '''
+        Store a new record of entity and add it to the indexes. The caller
+        holds the lock of its parent.
+        '''
+        number = record.raw("id")
+        self._items(entity)[number] = record
+        with self._lock:
+            self._next_ids[entity] = max(self._next_ids[entity], number + 1)
+        if entity == "patients":
+            self._index_add(self._patients_by_nurse, record.raw("nurse id"), number)
+        elif entity == "medicaments":
+            self._index_add(self._medication_by_patient, record.raw("patient id"), number)
+
+    def _next_id(self, entity):
+        with self._lock:
+            number = self._next_ids[entity]
+            self._next_ids[entity] = number + 1
+            return number
+
+    def _index_add(self, index, key, number):
+        # Replace the set, a reader may be iterating the old one
+        index[key] = index.get(key, frozenset()) | frozenset([number])
+
+    def _index_remove(self, index, key, number):
+        numbers = index.get(key, frozenset()) - frozenset([number])
+        if numbers:
+            index[key] = numbers
+        else:
+            index.pop(key, None)
+
+    def _indexed(self, items, index, key):
+        '''
+        Returns the records of items whose numbers are in index[key].
+        '''
+        records = []
+        for number in index.get(key, ()):
+            record = items.get(number)
+            # The record may have been deleted after reading the index
+            if record is not None:
+                records.append(record)
+        return records
+
+    def _project(self, item, known_fields, fields):
+        '''
+        Returns the record item with only the given fields (all of them if
+        fields is None).
+        '''
+        layout = get_layout(known_fields, fields)
+        return item.project(layout) if item is not None else None
+
+    def _page(self, items, codec, limit, after):
+        '''
+        Sort items by the number of their id and keep the page of limit
+        items that follows the id after, decoded with codec.
+        '''
+        # The records keep the number of their ids
+        items = sorted(items, key=lambda item: item.raw("id"))
+        if after is not None:
+            after = codec.decode(after)
+            items = [item for item in items if item.raw("id") > after]
+        if limit is not None:
+            items = items[:limit]
+        return items
 
     # NURSES
-    def get_nurse(self, nurseid):
-        # Make a copy in case the caller wants to modify it
-        return deepcopy(self.NURSES.get(nurseid))
-            
-    def get_nurses_list(self):
-        # Get the list of nurses
-        return self.NURSES.values()
+    def get_nurse(self, nurseid, fields=None, version=None):
+        # The records are immutable, there is no need to copy them
+        return self._project(self.nurses.get(ids.NURSE_IDS.decode(nurseid)), NURSE_FIELDS, fields)
+
+    def get_nurses_list(self, limit=None, after=None, fields=None):
+        layout = get_layout(NURSE_FIELDS, fields)
+        return [nurse.project(layout) for nurse in self._page(self.nurses.values(), ids.NURSE_IDS, limit, after)]
 
     def modify_nurse(self, nurseid, nursename, nursesurname, nursepn, nurseaddress):
-        nurse = self.NURSES.get(nurseid)
-        if nurse:
-            nurse["name"] = nursename
-            nurse["surname"] = nursesurname
-            nurse["phone number"] = nursepn
-            nurse["address"] = nurseaddress
-        return nurseid if nurse else None
-            
+        number = ids.NURSE_IDS.decode(nurseid)
+        with self._nurse_locks.lock(number):
+            nurse = self.nurses.get(number)
+            if nurse is None:
+                return None
+            self.nurses[number] = nurse.replace({"name": nursename, "surname": nursesurname,
+                                                 "phone number": nursepn, "address": nurseaddress})
+            self._touch("nurses", number)
+        return ids.NURSE_IDS.encode(number)
+
     def append_nurse(self, nursename, nursesurname, nursepn, nurseaddress):
-        # Check that the nurseid exist otherwise return None
-        global lastnurse
-        newid = "nur-"+ str(lastnurse)
-        lastnurse += 1 
-        nurse = {"id":newid,"name":nursename, "surname":nursesurname, "phone number":nursepn, "address": nurseaddress}
-        self.NURSES[newid] = nurse
-        return newid
+        number = self._next_id("nurses")
+        with self._nurse_locks.lock(number):
+            self._insert("nurses", Record(get_layout(NURSE_FIELDS),
+                                          (number, nursename, nursesurname, nursepn, nurseaddress)))
+            self._touch("nurses", number)
+        return ids.NURSE_IDS.encode(number)
+
+    def append_nurses(self, nurses):
+        return [self.append_nurse(*nurse) for nurse in nurses]
 
     def delete_nurse(self, nurseid):
-        nurse = self.NURSES.pop(nurseid, None)
-        return nurseid if nurse else None
+        number = ids.NURSE_IDS.decode(nurseid)
+        with self._nurse_locks.lock(number):
+            if self.nurses.pop(number, None) is None:
+                return None
+            self._touch("nurses", number, deleted=True)
+            # ON DELETE CASCADE through the index
+            for patient in self._patients_by_nurse.get(number, ()):
+                self._delete_patient(patient)
+        return ids.NURSE_IDS.encode(number)
 
-    def contains_nurse (self, nurseid):
-        return self.NURSES.get(nurseid, None) is not None
+    def contains_nurse(self, nurseid):
+        return ids.NURSE_IDS.decode(nurseid) in self.nurses
 
     # PATIENTS
-    def get_patient(self, patientid):
-        # Make a copy in case the caller wants to modify it
-        return deepcopy(self.PATIENTS.get(patientid))
-            
-    def get_nurses_patient_list(self, nurseid):
-        # Get the list of the patients of a nurse
-        patient_list = []
-        patient_list = [patient for patient in self.PATIENTS.values() if patient.get("nurse id") == nurseid]
-        return patient_list
+    def get_patient(self, patientid, fields=None, version=None):
+        # The records are immutable, there is no need to copy them
+        return self._project(self.patients.get(ids.PATIENT_IDS.decode(patientid)), PATIENT_FIELDS, fields)
+
+    def get_nurses_patient_list(self, nurseid, limit=None, after=None, fields=None):
+        layout = get_layout(PATIENT_FIELDS, fields)
+        # Get the list of the patients of a nurse from the index
+        patient_list = self._indexed(self.patients, self._patients_by_nurse, ids.NURSE_IDS.decode(nurseid))
+        return [patient.project(layout) for patient in self._page(patient_list, ids.PATIENT_IDS, limit, after)]
 
     def modify_patient(self, patientid, patientname, patientsurname, patientroom, patientpn, patientaddress):
-        patient = self.PATIENTS.get(patientid)
-        if patient:
-            patient["name"] = patientname
-            patient["surname"] = patientsurname
-            patient["room"] = patientroom
-            patient["phone number"] = patientpn
-            patient["address"] = patientaddress
-        return patientid if patient else None
+        number = ids.PATIENT_IDS.decode(patientid)
+        with self._patient_locks.lock(number):
+            patient = self.patients.get(number)
+            if patient is None:
+                return None
+            self.patients[number] = patient.replace({"name": patientname, "surname": patientsurname,
+                                                     "room": patientroom, "phone number": patientpn,
+                                                     "address": patientaddress})
+            self._touch("patients", number)
+        return ids.PATIENT_IDS.encode(number)
 
     def delete_patient(self, patientid):
-        patient = self.PATIENTS.pop(patientid, None)
-        return patientid if patient else None
+        number = ids.PATIENT_IDS.decode(patientid)
+        patient = self.patients.get(number)
+        if patient is None:
+            return None
+        # The nurse of a patient never changes: lock it first to update its index
+        with self._nurse_locks.lock(patient.raw("nurse id")):
+            if not self._delete_patient(number):
+                return None
+        return ids.PATIENT_IDS.encode(number)
 
-    def contains_patient (self, patientid):
-        return self.PATIENTS.get(patientid, None) is not None
+    def _delete_patient(self, number):
+        '''
+        Delete the patient and their medication. The caller holds the lock
+        of the nurse of the patient. Returns False if it did not exist.
+        '''
+        with self._patient_locks.lock(number):
+            patient = self.patients.pop(number, None)
+            if patient is None:
+                return False
+            self._index_remove(self._patients_by_nurse, patient.raw("nurse id"), number)
+            self._touch("patients", number, deleted=True)
+            # ON DELETE CASCADE through the index
+            for medicament in self._medication_by_patient.get(number, ()):
+                self._delete_medicament(medicament)
+        return True
+
+    def contains_patient(self, patientid):
+        return ids.PATIENT_IDS.decode(patientid) in self.patients
 
     # MEDICAMENTS
-    def get_medicament(self, medicamentid):
-        # Make a copy in case the caller wants to modify it
-        return deepcopy(self.MEDICAMENTS.get(medicamentid))
-            
-    def get_patient_medication_list(self, patientid):
-        # Get the list of the medication of a patient
-        medication_list = []
-        medication_list = [medicament for medicament in self.MEDICAMENTS.values() if medicament.get("patient id") == patientid]
-        return medication_list
+    def get_medicament(self, medicamentid, fields=None, version=None):
+        # The records are immutable, there is no need to copy them
+        return self._project(self.medicaments.get(ids.MEDICAMENT_IDS.decode(medicamentid)), MEDICAMENT_FIELDS,
+                             fields)
+
+    def get_patient_medication_list(self, patientid, limit=None, after=None, fields=None):
+        layout = get_layout(MEDICAMENT_FIELDS, fields)
+        # Get the list of the medication of a patient from the index
+        medication_list = self._indexed(self.medicaments, self._medication_by_patient,
+                                        ids.PATIENT_IDS.decode(patientid))
+        return [medicament.project(layout)
+                for medicament in self._page(medication_list, ids.MEDICAMENT_IDS, limit, after)]
 
     def modify_medicament(self, medid, medname, meddosage, medduration, medhours, medbag, medadmin):
-        medicament = self.MEDICAMENTS.get(medid)
-        if medicament:
-            medicament["name"] = medname
-            medicament["dosage"] = meddosage
-            medicament["duration"] = medduration
-            medicament["hours"] = medhours
-            medicament["bag volume"] = medbag
-            medicament["administration"] = medadmin
-        return medid if medicament else None
-            
+        number = ids.MEDICAMENT_IDS.decode(medid)
+        with self._medicament_locks.lock(number):
+            medicament = self.medicaments.get(number)
+            if medicament is None:
+                return None
+            self.medicaments[number] = medicament.replace({"name": medname, "dosage": meddosage,
+                                                           "duration": medduration, "hours": medhours,
+                                                           "bag volume": medbag, "administration": medadmin})
+            self._schedule(number, medhours, medduration, keep_start=True)
+            self._touch("medicaments", number)
+        return ids.MEDICAMENT_IDS.encode(number)
+
     def append_medication(self, medname, meddosage, medduration, medhours, medbag, medadmin, medpatient):
-        # Check that the nurseid exist otherwise return None
-        global lastmedicament
-        newid = "med-" + str(lastmedicament)
-        lastmedicament += 1 
-        medicament = {"id": newid, "name": medname, "dosage": meddosage, "duration": medduration, "hours": medhours, "bag volume": medbag, "administration": medadmin, "patient id": medpatient}
-        self.MEDICAMENTS[newid] = medicament
-        return newid
+        patient = ids.PATIENT_IDS.decode(medpatient)
+        # The patient cannot be deleted while the medicament is added
+        with self._patient_locks.lock(patient):
+            if patient not in self.patients:
+                return None
+            number = self._next_id("medicaments")
+            with self._medicament_locks.lock(number):
+                self._insert("medicaments", Record(get_layout(MEDICAMENT_FIELDS),
+                                                   (number, medname, meddosage, medduration, medhours, medbag,
+                                                    medadmin, patient)))
+                self._schedule(number, medhours, medduration)
+                self._touch("medicaments", number)
+        return ids.MEDICAMENT_IDS.encode(number)
+
+    def append_medications(self, medicaments):
+        return [self.append_medication(*medicament) for medicament in medicaments]
 
     def delete_medicament(self, medicamentid):
-        medicament = self.MEDICAMENTS.pop(medicamentid, None)
-        return medicamentid if medicament else None
+        number = ids.MEDICAMENT_IDS.decode(medicamentid)
+        medicament = self.medicaments.get(number)
+        if medicament is None:
+            return None
+        # The patient of a medicament never changes: lock it first to update its index
+        with self._patient_locks.lock(medicament.raw("patient id")):
+            if not self._delete_medicament(number):
+                return None
+        return ids.MEDICAMENT_IDS.encode(number)
+
+    def _delete_medicament(self, number):
+        '''
+        Delete the medicament. The caller holds the lock of its patient.
+        Returns False if it did not exist.
+        '''
+        with self._medicament_locks.lock(number):
+            medicament = self.medicaments.pop(number, None)
+            if medicament is None:
+                return False
+            self._index_remove(self._medication_by_patient, medicament.raw("patient id"), number)
+            self._schedules.pop(number, None)
+            self._touch("medicaments", number, deleted=True)
+        return True
 
     def contains_medicament(self, medicamentid):
-        return self.MEDICAMENTS.get(medicamentid, None) is not None
+        return ids.MEDICAMENT_IDS.decode(medicamentid) in self.medicaments
+
+    # DOSES
+    def _schedule(self, number, hours, duration, keep_start=False):
+        '''
+        Store the schedule of the medicament number, starting now or when it
+        started before if keep_start. The caller holds the lock of the
+        medicament.
+        '''
+        now = int(self.clock())
+        previous = self._schedules.get(number)
+        first = previous[1] if keep_start and previous is not None else now
+        interval, seconds = schedule.parse_interval(hours), schedule.parse_duration(duration)
+        if interval is None:
+            self._schedules.pop(number, None)
+            return
+        # None if the schedule never ends
+        end = first + seconds if seconds is not None else None
+        self._schedules[number] = (interval, first, end)
+
+    def get_due_doses(self, start, end, nurseid=None, limit=None):
+        if limit is not None and limit < 0:
+            raise ValueError("The limit must be positive")
+        if end > self.clock() + schedule.MAX_AHEAD:
+            raise ValueError("The doses can be read at most %d seconds ahead" % schedule.MAX_AHEAD)
+        if nurseid is not None:
+            patients = self._indexed(self.patients, self._patients_by_nurse, ids.NURSE_IDS.decode(nurseid))
+        else:
+            patients = self.patients.values()
+        layout = get_layout(DOSE_FIELDS)
+        doses = []
+        for patient in patients:
+            for medicament in self._indexed(self.medicaments, self._medication_by_patient, patient.raw("id")):
+                found = self._schedules.get(medicament.raw("id"))
+                if found is None:
+                    continue
+                interval, first, last = found
+                last = end if last is None else min(last, end)
+                for due in schedule.dose_times(first, interval, last - first, start, limit):
+                    doses.append(Record(layout, (due, medicament.raw("id"), patient.raw("id"),
+                                                 patient.raw("nurse id"), medicament["name"], medicament["dosage"],
+                                                 medicament["administration"], patient["name"],
+                                                 patient["surname"], patient["room"])))
+        doses.sort(key=lambda dose: (dose.raw("due time"), dose.raw("medicament id")))
+        return doses[:limit] if limit is not None else doses
+
+    # RELATED OBJECTS
+    def get_related_items(self, entity, field, values, fields=None, limit=None):
+        fields = related_fields(entity, field, fields)
+        items = self._items(entity)
+        layout = get_layout(ENTITIES[entity][2], fields)
+        values = set(value for value in values if value is not None)
+        indexes = {("patients", "nurse id"): self._patients_by_nurse,
+                   ("medicaments", "patient id"): self._medication_by_patient}
+        if field == "id":
+            related = [items[value] for value in values if value in items]
+        elif (entity, field) in indexes:
+            related = []
+            for value in values:
+                related.extend(self._indexed(items, indexes[(entity, field)], value))
+        else:
+            related = [item for item in items.itervalues() if item.raw(field) in values]
+        related.sort(key=lambda item: (item.raw(field), item.raw("id")))
+        return [item.project(layout) for item in limit_per_value(related, field, limit)]
+
+    # WARD
+    def get_nurse_ward(self, nurseid):
+        number = ids.NURSE_IDS.decode(nurseid)
+        nurse = self.nurses.get(number)
+        if nurse is None:
+            return None
+        patients = sorted(self._indexed(self.patients, self._patients_by_nurse, number),
+                          key=lambda patient: patient.raw("id"))
+        return nurse, [(patient, sorted(self._indexed(self.medicaments, self._medication_by_patient,
+                                                      patient.raw("id")),
+                                        key=lambda medicament: medicament.raw("id")))
+                       for patient in patients]
+
+    # VERSIONS
+    def _touch(self, entity, number, deleted=False):
+        '''
+        Increment the versions of the table and of the object number of
+        entity after a write.
+        '''
+        with self._lock:
+            self._table_versions[entity] = self._table_versions.get(entity, 1) + 1
+            if deleted:
+                self._versions.pop((entity, number), None)
+            else:
+                self._versions[(entity, number)] = self._versions.get((entity, number), 0) + 1
+        self._change(entity, number, deleted)
+
+    def _version(self, entity, number):
+        # The objects loaded by load_init_values have version 1
+        return self._versions.get((entity, number), 1) if number in self._items(entity) else None
+
+    def get_nurse_version(self, nurseid):
+        return self._version("nurses", ids.NURSE_IDS.decode(nurseid))
+
+    def get_patient_version(self, patientid):
+        return self._version("patients", ids.PATIENT_IDS.decode(patientid))
+
+    def get_medicament_version(self, medicamentid):
+        return self._version("medicaments", ids.MEDICAMENT_IDS.decode(medicamentid))
+
+    def get_nurses_version(self):
+        return self._table_versions.get("nurses", 1)
+
+    def get_patients_version(self):
+        return self._table_versions.get("patients", 1)
+
+    def get_medicaments_version(self):
+        return self._table_versions.get("medicaments", 1)
+
+    # CHANGES
+    def _change(self, entity, number, deleted=False):
+        '''
+        Record a change of the object number of entity with the next
+        sequence number, replacing its previous change.
+        '''
+        with self._lock:
+            sequence = self._sequence() + 1
+            self._changes.pop((entity, number), None)
+            self._changes[(entity, number)] = (sequence, deleted)
+
+    def _sequence(self):
+        if not self._changes:
+            return 0
+        return self._changes[next(reversed(self._changes))][0]
+
+    def get_changes(self, since=0, limit=None):
+        if since < 0 or (limit is not None and limit < 0):
+            raise ValueError("The sequence number and the limit must be positive")
+        # Walk back from the last change until since
+        changes = []
+        with self._lock:
+            for key in reversed(self._changes):
+                sequence, deleted = self._changes[key]
+                if sequence <= since:
+                    break
+                changes.append((sequence, key[0], key[1], deleted))
+        changes.reverse()
+        if limit is not None:
+            changes = changes[:limit]
+        result = []
+        for sequence, entity, number, deleted in changes:
+            item = None if deleted else self._items(entity).get(number)
+            result.append({"sequence": sequence, "entity": entity, "id": CHANGE_ENTITIES[entity][3].encode(number),
+                           "deleted": item is None, "item": item})
+        return result
+
+    def get_change_sequence(self):
+        with self._lock:
+            return self._sequence()
 
 
 class HospitalDatabase(HospitalDatabaseInterface):
     '''
     This class defines the interface for a persistent database.
+    The connections are kept in a ConnectionPool of pool_size connections,
+    a checkout waits at most pool_timeout seconds for a free connection.
+    profile is a StorageProfile or the name of one in STORAGE_PROFILES.
     '''
-    def __init__(self, db_path):
+    def __init__(self, db_path, pool_size=DEFAULT_POOL_SIZE, pool_timeout=DEFAULT_POOL_TIMEOUT,
+                 profile=DEFAULT_STORAGE_PROFILE):
         super(HospitalDatabase, self).__init__()
         self.db_path = db_path
+        self.profile = get_storage_profile(profile)
+        self.pool = ConnectionPool(db_path, size=pool_size, timeout=pool_timeout,
+                                   on_connect=self.profile.apply)
 
     # SETUP AND DELETE THE DATABASE
     def clean(self):
         '''
         Clean the database
         '''
+        # The pooled connections point to the file that is going to be removed
+        self.pool.close_all()
         os.remove(self.db_path)
+        # Remove the WAL files left behind
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def close(self):
+        '''
+        Close all the pooled connections, checkpointing the WAL first if the
+        storage profile asks for it.
+        '''
+        if self.profile.wal and self.profile.checkpoint_on_close and os.path.exists(self.db_path):
+            self.checkpoint(self.profile.checkpoint_on_close)
+        self.pool.close_all()
+
+    def after_fork(self):
+        '''
+        Call it in a process created with fork before using the database:
+        sqlite3 connections must not be shared between processes.
+        '''
+        self.pool.reset_after_fork()
+
+    def checkpoint(self, mode='PASSIVE'):
+        '''
+        Copy the content of the WAL back into the database file.
+        Returns a tuple (busy, log frames, checkpointed frames) or None if the
+        database is not in WAL mode.
+        '''
+        mode = mode.upper()
+        if mode not in StorageProfile.CHECKPOINT_MODES:
+            raise ValueError("Unknown checkpoint mode %s" % mode)
+        if not self.profile.wal:
+            return None
+        with self.connection() as con:
+            return tuple(con.execute('PRAGMA wal_checkpoint(%s)' % mode).fetchone())
+
+    def storage_status(self):
+        '''
+        Returns the journal mode, synchronous level and busy timeout that are
+        in effect in the pooled connections.
+        '''
+        with self.connection() as con:
+            journal_mode = con.execute('PRAGMA journal_mode').fetchone()[0]
+            synchronous = con.execute('PRAGMA synchronous').fetchone()[0]
+            busy_timeout = con.execute('PRAGMA busy_timeout').fetchone()[0]
+        synchronous = StorageProfile.SYNCHRONOUS_LEVELS[synchronous]
+        return {'journal_mode': journal_mode.upper(), 'synchronous': synchronous, 'busy_timeout': busy_timeout}
 
     def load_init_values(self):
         '''
         Load default values in the database. Create tables and load testing
         values.
         ''' 
-        self.create_tables_from_dump()
+        self.migrate()
         self.load_table_values_from_dump()
+        # The dump inserts the medicaments without their doses
+        self.rebuild_schedules()
+
+    # SCHEMA MIGRATIONS
+    def migrate(self, target=None):
+        '''
+        Create the tables or upgrade the existing ones to the target schema
+        version (the latest by default). The data is kept.
+        Returns the list of migration versions that have been applied.
+        '''
+        with self.connection() as con:
+            applied = migrations.migrate(con, target)
+        # The medicaments that existed before the schedules need their doses
+        if migrations.SCHEDULES_VERSION in applied:
+            self.rebuild_schedules()
+        return applied
+
+    def schema_version(self):
+        '''
+        Returns the schema version of the database.
+        '''
+        with self.connection() as con:
+            return migrations.current_version(con)
 
     # MANAGING THE CONNECTIONS:
+    def connection(self):
+        '''
+        Returns a context manager that checks out a configured connection
+        from the pool and runs the block inside a transaction.
+        '''
+        return self.pool.connection()
+
+    def pool_stats(self):
+        '''
+        Returns the size, wait timeout and counters of the connection pool.
+        '''
+        return self.pool.stats()
+
+    def resize_pool(self, size):
+        '''
+        Change the number of pooled connections, e.g. to the number of threads
+        that use the database, before serving anything.
+        '''
+        self.pool.resize(size)
+
     def check_foreign_keys_status(self):
         '''
         Checks the status of foreign keys
@@ -336,10 +1461,10 @@ class HospitalDatabase(HospitalDatabaseInterface):
             # I know I retrieve just one record: use fetchone()
             data = cur.fetchone()
             data_text = 'ON' if data == (1,) else 'OFF'            
-            print "Foreign Keys status: %s" % data_text                
+            logger.info("Foreign Keys status: %s", data_text)                
             
         except sqlite3.Error, e:
-            print "Error %s:" % e.args[0]
+            logger.error("Error %s:", e.args[0])
             sys.exit(1)
             
         finally:
@@ -366,10 +1491,10 @@ class HospitalDatabase(HospitalDatabaseInterface):
             # I know I retrieve just one record: use fetchone()
             data = cur.fetchone()
             data_text = 'ON' if data == (1,) else 'OFF'            
-            print "Foreign Keys status: %s" % data_text
+            logger.info("Foreign Keys status: %s", data_text)
             
         except sqlite3.Error, e:
-            print "Error %s:" % e.args[0]
+            logger.error("Error %s:", e.args[0])
             sys.exit(1)
             
         finally:
@@ -380,77 +1505,67 @@ class HospitalDatabase(HospitalDatabaseInterface):
     # CREATE THE TABLES
     def create_nurses_profile_table(self):
         '''creates nurses_profile table'''
-        keys_on = 'PRAGMA foreign_keys = ON'
         stmnt = 'CREATE TABLE nurses_profile(nurse_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, surname TEXT, phone_number INTEGER, address TEXT)' 
-        con = sqlite3.connect(self.db_path)
-        with con:
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
             # Get the cursor object.
             # It allows to execute SQL code and traverse the result set
             cur = con.cursor()
             try:
-                cur.execute(keys_on)
                 # execute the statement
                 cur.execute(stmnt)
             except sqlite3.Error, e:
-                print "Error %s:" % e.args[0]
+                logger.error("Error %s:", e.args[0])
         return None
         
     def create_doctors_profile_table(self):
         '''creates doctors_profile table'''
-        keys_on = 'PRAGMA foreign_keys = ON'
         stmnt = 'CREATE TABLE doctors_profile(doctor_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, surname TEXT, phone_number INTEGER, address TEXT)' 
-        con = sqlite3.connect(self.db_path)
-        with con:
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
             # Get the cursor object.
             # It allows to execute SQL code and traverse the result set
             cur = con.cursor()
             try:
-                cur.execute(keys_on)
                 # execute the statement
                 cur.execute(stmnt)
             except sqlite3.Error, e:
-                print "Error %s:" % e.args[0]
+                logger.error("Error %s:", e.args[0])
         return None
 
     def create_patients_profile_table(self):
         '''creates patients_profile table'''
-        keys_on = 'PRAGMA foreign_keys = ON'
         stmnt = 'CREATE TABLE patients_profile(patient_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, surname TEXT, room INTEGER,\
                             phone_number INTEGER, address TEXT, p_nurse INTEGER, p_doctor INTEGER,\
                             FOREIGN KEY(p_nurse) REFERENCES nurses_profile(nurse_id) ON DELETE CASCADE\
                             FOREIGN KEY(p_doctor) REFERENCES doctors_profile(doctor_id) ON DELETE CASCADE)'
-        # Connects to the database. Gets a connection object
-        con = sqlite3.connect(self.db_path)
-        with con:
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
             # Get the cursor object.
             # It allows to execute SQL code and traverse the result set
             cur = con.cursor()
             try:
-                cur.execute(keys_on)        
                 # execute the statement
                 cur.execute(stmnt)
             except sqlite3.Error,e:
-                print "Error %s:" % e.args[0]
+                logger.error("Error %s:", e.args[0])
         return None
     
     def create_medicaments_table(self):
         """creates medicaments table"""
-        keys_on = 'PRAGMA foreign_keys = ON'
         stmnt = 'CREATE TABLE medicaments(medicament_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, dosage TEXT, duration TEXT, hours TEXT,\
                             bag_volume TEXT, administration TEXT, m_patient INTEGER, \
                             FOREIGN KEY(m_patient) REFERENCES patients_profile(patient_id) ON DELETE CASCADE)'
-        # Connects to the database. Gets a connection object
-        con = sqlite3.connect(self.db_path)
-        with con:
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
             # Get the cursor object.
             # It allows to execute SQL code and traverse the result set
-            cur = con.cursor() 
+            cur = con.cursor()
             try:
-                cur.execute(keys_on)        
                 # execute the statement
                 cur.execute(stmnt)
             except sqlite3.Error, e:
-                print "Error %s:" % e.args[0]
+                logger.error("Error %s:", e.args[0])
         return None
 
     def create_all_tables(self):
@@ -464,37 +1579,129 @@ class HospitalDatabase(HospitalDatabaseInterface):
 
     def create_tables_from_dump(self):
         '''
-        Create programmatically the tables from a dump file
+        Create programmatically the tables from a dump file.
+        The dump sets the schema version of the objects it creates, so
+        migrate() only applies the migrations added after it.
         '''
-        con = sqlite3.connect(self.db_path)
         with open('db/hospital_schema_dump.sql') as f:
             sql = f.read()
+        with self.connection() as con:
             cur = con.cursor()
             cur.executescript(sql)
+            # The script may switch the foreign keys off in this connection
+            cur.execute('PRAGMA foreign_keys = ON')
+
+    def rebuild_schedules(self):
+        '''
+        Parse again the hours and duration of all the medicaments and write
+        their upcoming doses, keeping the start of the existing schedules.
+        Run it after writing the medicaments table without this class.
+        Returns the number of medicaments.
+        '''
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = self._record_cursor(con)
+            cur.execute('SELECT medicament_id, hours, duration FROM medicaments')
+            medicaments = cur.fetchall()
+            schedule.write_schedules(cur, medicaments, self.clock(), keep_start=True)
+        return len(medicaments)
 
     def load_table_values_from_dump(self):
         '''
         Fill programmatically the tables from a dump file
         '''
-        con = sqlite3.connect(self.db_path)
         with open('db/hospital_data_dump.sql') as f:
             sql = f.read()
+        with self.connection() as con:
             cur = con.cursor()
             cur.executescript(sql)
+            # The script may switch the foreign keys off in this connection
+            cur.execute('PRAGMA foreign_keys = ON')
+
+    def _columns(self, layout):
+        '''
+        Returns the columns to select to build the records of a RecordLayout,
+        in the order of its fields.
+        '''
+        return ', '.join(layout.columns)
+
+    def _record_cursor(self, con):
+        '''
+        Returns a cursor of con that returns plain tuples instead of
+        sqlite3.Row objects. Selecting the columns of a RecordLayout, every
+        tuple can be wrapped in a Record as it is.
+        '''
+        cur = con.cursor()
+        cur.row_factory = None
+        return cur
+
+    def _iter_rows(self, table, key, condition, pvalue, layout):
+        '''
+        Yield a Record with the given layout for every row of table that
+        meets condition (SQL with the parameters pvalue, or None), ordered by
+        the primary key. The rows are read in pages of STREAM_PAGE_SIZE and
+        the pooled connection is given back after every page, so a slow
+        consumer, e.g. a streamed response, does not keep it. Every page is
+        read in its own transaction.
+        '''
+        conditions = [condition] if condition is not None else []
+        after = ()
+        while True:
+            query = 'SELECT %s, %s FROM %s' % (self._columns(layout), key, table)
+            if conditions or after:
+                query += ' WHERE ' + ' AND '.join(conditions + ['%s > ?' % key] * len(after))
+            query += ' ORDER BY %s LIMIT ?' % key
+            # Take a connection from the pool. It is already configured
+            with self.connection() as con:
+                cur = self._record_cursor(con)
+                cur.execute(query, pvalue + after + (STREAM_PAGE_SIZE,))
+                rows = cur.fetchall()
+            for row in rows:
+                # The key is the last column
+                yield Record(layout, row[:-1])
+            if len(rows) < STREAM_PAGE_SIZE:
+                return
+            after = (rows[-1][-1],)
+
+    def _keyset(self, key, prefix, limit, after):
+        '''
+        Returns the end of a SELECT statement (condition on the primary key,
+        ordering and limit) and its parameters to read the page of at most
+        limit rows whose key is greater than the id after.
+        '''
+        sql = ''
+        pvalue = ()
+        if after is not None:
+            sql += ' AND %s > ?' % key
+            pvalue += (ids.CODECS[prefix].decode(after),)
+        sql += ' ORDER BY %s' % key
+        if limit is not None:
+            if limit < 0:
+                raise ValueError("The limit must be positive")
+            sql += ' LIMIT ?'
+            pvalue += (limit,)
+        return sql, pvalue
+
+    def _last_inserted_ids(self, cur, table, count):
+        '''
+        Returns the ids of the last count rows inserted in table by the
+        current transaction. The tables use AUTOINCREMENT and the transaction
+        holds the write lock, so the rows got consecutive ids ending in the
+        last value of the table sequence.
+        '''
+        cur.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,))
+        last = cur.fetchone()[0]
+        return range(last - count + 1, last + 1)
 
     # RETURN OBJECTS
 
-    def create_nurse_object(self, row):
+    def create_nurse_object(self, row, fields=None):
         '''
-        It takes a database Row for a nurse and transform it into a dictionary.
+        It takes a database Row for a nurse and transform it into a Record.
+        If fields is given only those fields are built (see NURSE_FIELDS).
         '''
-        nurse_id = 'nur-' + str(row['nurse_id'])
-        nurse_name = row['name']
-        nurse_surname = row['surname']
-        nurse_phone_number = row['phone_number']
-        nurse_address = row['address']
-        nurse = {'id': nurse_id, 'name': nurse_name, 'surname': nurse_surname, 'phone number': nurse_phone_number, 'address': nurse_address}
-        return nurse
+        layout = get_layout(NURSE_FIELDS, fields)
+        return Record(layout, tuple(row[column] for column in layout.columns))
 
     def create_doctor_object(self, row):
         '''
@@ -508,60 +1715,38 @@ class HospitalDatabase(HospitalDatabaseInterface):
         doctor = {'id': doctor_id, 'name': doctor_name, 'surname': doctor_surname, 'phone number': doctor_phone_number, 'address': doctor_address}
         return doctor
 
-    def create_patient_object(self, row):
-        '''
-        It takes a database Row for a patient and transform it into a dictionary.
-        '''
-        patient_id = 'pat-' + str(row['patient_id'])
-        patient_name = row['name']
-        patient_surname = row['surname']
-        patient_room = row['room']
-        patient_phone_number = row['phone_number']
-        patient_address = row['address']
-        patient_nurse = 'nur-' + str(row['p_nurse'])
-        patient_doctor = 'doc-' + str(row['p_doctor'])
-        patient = {'id': patient_id, 'name': patient_name, 'surname': patient_surname, 'room': patient_room , 'phone number': patient_phone_number, 'address': patient_address, 'nurse id': patient_nurse, 'doctor id': patient_doctor}
-        return patient
-
-    def create_medicament_object(self, row):
-        '''
-        It takes a database Row for a medicament and transform it into a dictionary.
-        '''
-        medicament_id = 'med-' + str(row['medicament_id'])
-        medicament_name = row['name']
-        medicament_dosage = row['dosage']
-        medicament_duration = row['duration']
-        medicament_hours = row['hours']
-        medicament_bag_volume = row['bag_volume']
-        medicament_administration = row['administration']
-        medicament_patient = 'pat-' + str(row['m_patient'])
-        medicament = {'id': medicament_id, 'name': medicament_name, 'dosage': medicament_dosage, 'duration': medicament_duration, 'hours': medicament_hours, 'bag volume': medicament_bag_volume, 'administration': medicament_administration, 'patient id': medicament_patient}
-        return medicament
-    
+    def create_patient_object(self, row, fields=None):
+        '''
+        It takes a database Row for a patient and transform it into a Record.
+        If fields is given only those fields are built (see PATIENT_FIELDS).
+        '''
+        layout = get_layout(PATIENT_FIELDS, fields)
+        return Record(layout, tuple(row[column] for column in layout.columns))
+
+    def create_medicament_object(self, row, fields=None):
+        '''
+        It takes a database Row for a medicament and transform it into a Record.
+        If fields is given only those fields are built (see MEDICAMENT_FIELDS).
+        '''
+        layout = get_layout(MEDICAMENT_FIELDS, fields)
+        return Record(layout, tuple(row[column] for column in layout.columns))
+
     # NURSE
-    def get_nurse(self, nurseid):
+    def get_nurse(self, nurseid, fields=None, version=None):
         '''
         Return a Nurse given its id (nurseid) or None if there is no 
         such nurse. Raises a value error if nurseid is not well formed.
-        nurseid format: nur-\d{1,3}
+        nurseid format: nur-<number> or the number itself (see ids.NURSE_IDS)
         '''
         # Extracts the int which is the id for a nurse in the database
-        match = re.match(r'nur-(\d{1,3})', nurseid)
-        if match is None:
-            raise ValueError("The nurseid is malformed")
-        nurseid = int(match.group(1))
+        nurseid = ids.NURSE_IDS.decode(nurseid)
 
         # Create the SQL Query
-        keys_on = 'PRAGMA foreign_keys = ON'
-        query = 'SELECT * FROM nurses_profile WHERE nurse_id = ?'
-        # Connects to the database. Gets a connection object
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)        
+        layout = get_layout(NURSE_FIELDS, fields)
+        query = 'SELECT %s FROM nurses_profile WHERE nurse_id = ?' % self._columns(layout)
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = self._record_cursor(con)
             # Execute main SQL Statement
             pvalue = (nurseid,)
             cur.execute(query, pvalue)
@@ -570,36 +1755,39 @@ class HospitalDatabase(HospitalDatabaseInterface):
             row = cur.fetchone()
             if row is None:
                 return None
-            # Build the return object
-            return self.create_nurse_object(row)
+            # The row has the columns of the layout
+            return Record(layout, row)
             
-    def get_nurses_list(self):
+    def get_nurses_list(self, limit=None, after=None, fields=None):
         '''
-        Return a list of all the nurses.
+        Return a list of all the nurses ordered by id.
+        If after (a nurse id) is given only the nurses with a greater id are
+        returned, and at most limit nurses if limit is given.
+        raises ValueError if after has a wrong format
         '''
         # Create the SQL Statement
-        keys_on = 'PRAGMA foreign_keys = ON'
-        query = 'SELECT * FROM nurses_profile'
-        # Connects to the database.
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)
+        layout = get_layout(NURSE_FIELDS, fields)
+        keyset, pvalue = self._keyset('nurse_id', 'nur', limit, after)
+        query = 'SELECT %s FROM nurses_profile WHERE 1' % self._columns(layout) + keyset
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = self._record_cursor(con)
             # Execute main SQL Statement
-            cur.execute(query)
+            cur.execute(query, pvalue)
             # Get results
             rows = cur.fetchall()
             if rows is None:
                 return None
-            # Build the return object
-            nurses = []    
-            for row in rows:
-                nurse = self.create_nurse_object(row)
-                nurses.append(nurse)
-            return nurses
+            # Every row has the columns of the layout
+            return [Record(layout, row) for row in rows]
+
+    def iter_nurses_list(self, fields=None):
+        '''
+        Yield all the nurses ordered by id, reading them in pages as they are
+        consumed. No connection is kept between two pages.
+        '''
+        layout = get_layout(NURSE_FIELDS, fields)
+        return self._iter_rows('nurses_profile', 'nurse_id', None, (), layout)
 
     def modify_nurse(self, nurseid, nursename, nursesurname, nursepn, nurseaddress):
         '''
@@ -610,31 +1798,21 @@ class HospitalDatabase(HospitalDatabaseInterface):
         not found
         '''
         # Extracts the int which is the id for a nurse in the database
-        match = re.match(r'nur-(\d{1,3})', nurseid)
-        if match is None:
-            raise ValueError("The nurseid is malformed")
-        nurseid = int(match.group(1))
+        nurseid = ids.NURSE_IDS.decode(nurseid)
         
-        # SQL Statement for activating foreign keys
-        keys_on = 'PRAGMA foreign_keys = ON'
         # SQL Statement to update the user_profile table
         query = 'UPDATE nurses_profile SET name = ?,surname = ?, phone_number = ?, address = ?\
                                            WHERE nurse_id = ?'
-        # Connects to the database. Gets a connection object
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
             cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)        
             # Execute the statement to extract the id associated to a nickname
             pvalue = (nursename, nursesurname, nursepn, nurseaddress, nurseid)
             cur.execute(query, pvalue)
             # Extract the id of the added nurse
             if cur.rowcount < 1:
                 return None
-            return 'nur-' + str(nurseid)
+            return ids.NURSE_IDS.encode(nurseid)
             
     def append_nurse(self, nursename, nursesurname, nursepn, nurseaddress):
         '''
@@ -643,31 +1821,45 @@ class HospitalDatabase(HospitalDatabaseInterface):
         raises ValueError if the nurse_id has a wrong format
         returns the id of the new nurse or None if it could not be created
         '''
-        # SQL STATMENTS FOR KEYS
-        keys_on = 'PRAGMA foreign_keys = ON'
         # SQL Statement for inserting the data
         stmnt = 'INSERT INTO nurses_profile (name,surname,phone_number,address)\
                          VALUES(?,?,?,?)'
-        # Connects  to the database.
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
             cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)
-            # Extract nurse id
-            row = cur.fetchone()
-            if row is not None:
-                nurse_id = 'nur-' + str(row["nurse_id"])
             # Generate the values for SQL statement
             pvalue = (nursename,nursesurname,nursepn,nurseaddress)
             cur.execute(stmnt,pvalue)
             # Extract the id of the added nurse
             lid = cur.lastrowid
             # Return the id in
-            return 'nur-' + str(lid) if lid is not None else None
+            return ids.NURSE_IDS.encode(lid) if lid is not None else None
     
+    def append_nurses(self, nurses):
+        '''
+        Create several nurses in a single transaction.
+        nurses is a list of tuples (nursename, nursesurname, nursepn, nurseaddress)
+        raises ValueError if a tuple does not have 4 values
+        returns the list of ids of the new nurses, in the same order
+        '''
+        # SQL Statement for inserting the data
+        stmnt = 'INSERT INTO nurses_profile (name,surname,phone_number,address)\
+                         VALUES(?,?,?,?)'
+        # Generate the values for SQL statement
+        pvalues = [tuple(nurse) for nurse in nurses]
+        if any(len(pvalue) != 4 for pvalue in pvalues):
+            raise ValueError("A nurse needs name, surname, phone number and address")
+        if not pvalues:
+            return []
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = con.cursor()
+            # All the rows are inserted in the same transaction
+            cur.executemany(stmnt, pvalues)
+            # Extract the ids of the added nurses
+            lids = self._last_inserted_ids(cur, 'nurses_profile', len(pvalues))
+            return [ids.NURSE_IDS.encode(lid) for lid in lids]
+
     def delete_nurse(self, nurseid):
         '''
         Delete a nurse in the Hospital.
@@ -675,23 +1867,13 @@ class HospitalDatabase(HospitalDatabaseInterface):
         return True if the nurse has been deleted False otherwise
         '''
         # Extracts the int which is the id for a nurse in the database
-        match = re.match(r'nur-(\d{1,3})', nurseid)
-        if match is None:
-            raise ValueError("The nurseid is malformed")
-        nurseid = int(match.group(1))
+        nurseid = ids.NURSE_IDS.decode(nurseid)
         
-        # SQL Statement for activating foreign keys
-        keys_on = 'PRAGMA foreign_keys = ON'
         # SQL Statement for deleting the user information
         query = 'DELETE FROM nurses_profile WHERE nurse_id = ?'
-        # Connects to the database. Gets a connection object
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
             cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)        
             # Execute the statement to delete
             pvalue = (nurseid,)
             cur.execute(query, pvalue)
@@ -703,33 +1885,36 @@ class HospitalDatabase(HospitalDatabaseInterface):
     def contains_nurse(self, nurseid):
         '''
         Returns true if the nurse is in the database. False otherwise.
+        Raises a value error if nurseid is not well formed.
         '''
-        return self.get_nurse(nurseid) is not None
+        # Extracts the int which is the id for a nurse in the database
+        nurseid = ids.NURSE_IDS.decode(nurseid)
+
+        # Probe the primary key index without reading the row
+        query = 'SELECT EXISTS(SELECT 1 FROM nurses_profile WHERE nurse_id = ?)'
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = con.cursor()
+            pvalue = (nurseid,)
+            cur.execute(query, pvalue)
+            return cur.fetchone()[0] == 1
 
     # PATIENT
-    def get_patient(self, patientid):
+    def get_patient(self, patientid, fields=None, version=None):
         '''
         Return a Patient given its id (patientid) or None if there is no 
         such patient. Raises a value error if patientid is not well formed.
-        patientid format: pat-\d{1,3}
+        patientid format: pat-<number> or the number itself (see ids.PATIENT_IDS)
         '''
         # Extracts the int which is the id for a patient in the database
-        match = re.match(r'pat-(\d{1,3})', patientid)
-        if match is None:
-            raise ValueError("The patientid is malformed")
-        patientid = int(match.group(1))
+        patientid = ids.PATIENT_IDS.decode(patientid)
 
         # Create the SQL Query
-        keys_on = 'PRAGMA foreign_keys = ON'
-        query = 'SELECT * FROM patients_profile WHERE patient_id = ?'
-        # Connects to the database. Gets a connection object
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)        
+        layout = get_layout(PATIENT_FIELDS, fields)
+        query = 'SELECT %s FROM patients_profile WHERE patient_id = ?' % self._columns(layout)
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = self._record_cursor(con)
             # Execute main SQL Statement
             pvalue = (patientid,)
             cur.execute(query, pvalue)
@@ -738,42 +1923,42 @@ class HospitalDatabase(HospitalDatabaseInterface):
             row = cur.fetchone()
             if row is None:
                 return None
-            # Build the return object
-            return self.create_patient_object(row)
+            # The row has the columns of the layout
+            return Record(layout, row)
             
-    def get_nurses_patient_list(self, nurseid):
+    def get_nurses_patient_list(self, nurseid, limit=None, after=None, fields=None):
         '''
-        Return a list of all the patients.
+        Return a list of all the patients of a nurse ordered by id.
+        limit and after (a patient id) work as in get_nurses_list.
         '''
-        match = re.match(r'nur-(\d{1,3})', nurseid)
-        if match is None:
-            raise ValueError("The nurseid is malformed")
-        nurseid = int(match.group(1))
+        nurseid = ids.NURSE_IDS.decode(nurseid)
 
         # Create the SQL Statement
-        keys_on = 'PRAGMA foreign_keys = ON'
-        query = 'SELECT * FROM patients_profile WHERE p_nurse = ?'
-        # Connects to the database.
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)
+        layout = get_layout(PATIENT_FIELDS, fields)
+        keyset, pkeyset = self._keyset('patient_id', 'pat', limit, after)
+        query = 'SELECT %s FROM patients_profile WHERE p_nurse = ?' % self._columns(layout) + keyset
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = self._record_cursor(con)
             # Execute main SQL Statement
-            pvalue = (nurseid,)        
+            pvalue = (nurseid,) + pkeyset
             cur.execute(query,pvalue)
             # Get results
             rows = cur.fetchall()
             if rows is None:
                 return None
-            # Build the return object
-            patients = []    
-            for row in rows:
-                patient = self.create_patient_object(row)
-                patients.append(patient)
-            return patients
+            # Every row has the columns of the layout
+            return [Record(layout, row) for row in rows]
+
+    def iter_nurses_patient_list(self, nurseid, fields=None):
+        '''
+        Yield all the patients of a nurse ordered by id, reading them in pages
+        as they are consumed.
+        raises ValueError if the nurseid has a wrong format
+        '''
+        number = ids.NURSE_IDS.decode(nurseid)
+        layout = get_layout(PATIENT_FIELDS, fields)
+        return self._iter_rows('patients_profile', 'patient_id', 'p_nurse = ?', (number,), layout)
 
     def modify_patient(self, patientid, patientname, patientsurname, patientroom, patientpn, patientaddress):
         '''
@@ -784,31 +1969,21 @@ class HospitalDatabase(HospitalDatabaseInterface):
         not found
         '''
         # Extracts the int which is the id for a patient in the database
-        match = re.match(r'pat-(\d{1,3})', patientid)
-        if match is None:
-            raise ValueError("The patientid is malformed")
-        patientid = int(match.group(1))
+        patientid = ids.PATIENT_IDS.decode(patientid)
         
-        # SQL Statement for activating foreign keys
-        keys_on = 'PRAGMA foreign_keys = ON'
         # SQL Statement to update the user_profile table
         query = 'UPDATE patients_profile SET name = ?,surname = ?, room = ?, phone_number = ?, address = ?\
                                            WHERE patient_id = ?'
-        # Connects to the database. Gets a connection object
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
             cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)        
             # Execute the statement to extract the id associated to a nickname
             pvalue = (patientname, patientsurname, patientroom, patientpn, patientaddress, patientid)
             cur.execute(query, pvalue)
             # Extract the id of the added patient
             if cur.rowcount < 1:
                 return None
-            return 'pat-' + str(patientid)
+            return ids.PATIENT_IDS.encode(patientid)
     
     def delete_patient(self, patientid):
         '''
@@ -817,23 +1992,13 @@ class HospitalDatabase(HospitalDatabaseInterface):
         return True if the patient has been deleted False otherwise
         '''
         # Extracts the int which is the id for a patient in the database
-        match = re.match(r'pat-(\d{1,3})', patientid)
-        if match is None:
-            raise ValueError("The patientid is malformed")
-        patientid = int(match.group(1))
+        patientid = ids.PATIENT_IDS.decode(patientid)
         
-        # SQL Statement for activating foreign keys
-        keys_on = 'PRAGMA foreign_keys = ON'
         # SQL Statement for deleting the user information
         query = 'DELETE FROM patients_profile WHERE patient_id = ?'
-        # Connects to the database. Gets a connection object
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
             cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)        
             # Execute the statement to delete
             pvalue = (patientid,)
             cur.execute(query, pvalue)
@@ -842,36 +2007,39 @@ class HospitalDatabase(HospitalDatabaseInterface):
                 return False
             return True
 
-    def contains_patient (self, patientid):
+    def contains_patient(self, patientid):
         '''
         Returns true if the patient is in the database. False otherwise.
+        Raises a value error if patientid is not well formed.
         '''
-        return self.get_patient(patientid) is not None
+        # Extracts the int which is the id for a patient in the database
+        patientid = ids.PATIENT_IDS.decode(patientid)
+
+        # Probe the primary key index without reading the row
+        query = 'SELECT EXISTS(SELECT 1 FROM patients_profile WHERE patient_id = ?)'
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = con.cursor()
+            pvalue = (patientid,)
+            cur.execute(query, pvalue)
+            return cur.fetchone()[0] == 1
 
     # MEDICAMENT
-    def get_medicament(self, medicamentid):
+    def get_medicament(self, medicamentid, fields=None, version=None):
         '''
         Return a Medicament given its id (medicamentid) or None if there is no 
         such medicament. Raises a value error if medicamentid is not well formed.
-        medicamentid format: med-\d{1,3}
+        medicamentid format: med-<number> or the number itself (see ids.MEDICAMENT_IDS)
         '''
         # Extracts the int which is the id for a medicament in the database
-        match = re.match(r'med-(\d{1,3})', medicamentid)
-        if match is None:
-            raise ValueError("The medicamentid is malformed")
-        medicamentid = int(match.group(1))
+        medicamentid = ids.MEDICAMENT_IDS.decode(medicamentid)
 
         # Create the SQL Query
-        keys_on = 'PRAGMA foreign_keys = ON'
-        query = 'SELECT * FROM medicaments WHERE medicament_id = ?'
-        # Connects to the database. Gets a connection object
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)        
+        layout = get_layout(MEDICAMENT_FIELDS, fields)
+        query = 'SELECT %s FROM medicaments WHERE medicament_id = ?' % self._columns(layout)
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = self._record_cursor(con)
             # Execute main SQL Statement
             pvalue = (medicamentid,)
             cur.execute(query, pvalue)
@@ -880,42 +2048,42 @@ class HospitalDatabase(HospitalDatabaseInterface):
             row = cur.fetchone()
             if row is None:
                 return None
-            # Build the return object
-            return self.create_medicament_object(row)
+            # The row has the columns of the layout
+            return Record(layout, row)
             
-    def get_patient_medication_list(self, patientid):
+    def get_patient_medication_list(self, patientid, limit=None, after=None, fields=None):
         '''
-        Return a list of all the medicaments of a patient.
+        Return a list of all the medicaments of a patient ordered by id.
+        limit and after (a medicament id) work as in get_nurses_list.
         '''
-        match = re.match(r'pat-(\d{1,3})', patientid)
-        if match is None:
-            raise ValueError("The patientid is malformed")
-        patientid = int(match.group(1))
+        patientid = ids.PATIENT_IDS.decode(patientid)
 
         # Create the SQL Statement
-        keys_on = 'PRAGMA foreign_keys = ON'
-        query = 'SELECT * FROM medicaments WHERE m_patient = ?'
-        # Connects to the database.
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
-            cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)
+        layout = get_layout(MEDICAMENT_FIELDS, fields)
+        keyset, pkeyset = self._keyset('medicament_id', 'med', limit, after)
+        query = 'SELECT %s FROM medicaments WHERE m_patient = ?' % self._columns(layout) + keyset
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = self._record_cursor(con)
             # Execute main SQL Statement
-            pvalue = (patientid,)        
+            pvalue = (patientid,) + pkeyset
             cur.execute(query, pvalue)
             # Get results
             rows = cur.fetchall()
             if rows is None:
                 return None
-            # Build the return object
-            medicaments = []
-            for row in rows:
-                medicament = self.create_medicament_object(row)
-                medicaments.append(medicament)
-            return medicaments
+            # Every row has the columns of the layout
+            return [Record(layout, row) for row in rows]
+
+    def iter_patient_medication_list(self, patientid, fields=None):
+        '''
+        Yield all the medicaments of a patient ordered by id, reading them in
+        pages as they are consumed.
+        raises ValueError if the patientid has a wrong format
+        '''
+        number = ids.PATIENT_IDS.decode(patientid)
+        layout = get_layout(MEDICAMENT_FIELDS, fields)
+        return self._iter_rows('medicaments', 'medicament_id', 'm_patient = ?', (number,), layout)
 
     def modify_medicament(self, medicamentid, medicamentname, medicamentdosage, medicamentduration, medicamenthours, medicamentbag, medicamentadministration):
         '''
@@ -926,64 +2094,85 @@ class HospitalDatabase(HospitalDatabaseInterface):
         not found
         '''
         # Extracts the int which is the id for a medicament in the database
-        match = re.match(r'med-(\d{1,3})', medicamentid)
-        if match is None:
-            raise ValueError("The medicamentid is malformed")
-        medicamentid = int(match.group(1))
+        medicamentid = ids.MEDICAMENT_IDS.decode(medicamentid)
         
-        # SQL Statement for activating foreign keys
-        keys_on = 'PRAGMA foreign_keys = ON'
         # SQL Statement to update the user_profile table
         query = 'UPDATE medicaments SET name = ?,dosage = ?, duration = ?, hours = ?, bag_volume = ?, administration = ?\
                                            WHERE medicament_id = ?'
-        # Connects to the database. Gets a connection object
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
             cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)        
             # Execute the statement to extract the id associated to a nickname
             pvalue = (medicamentname, medicamentdosage, medicamentduration, medicamenthours, medicamentbag, medicamentadministration, medicamentid)
             cur.execute(query, pvalue)
             # Extract the id of the added medicament
             if cur.rowcount < 1:
                 return None
-            return 'med-' + str(medicamentid)
+            # Compute the doses again in the same transaction, from the same start
+            schedule.write_schedules(cur, [(medicamentid, medicamenthours, medicamentduration)], self.clock(),
+                                     keep_start=True)
+            return ids.MEDICAMENT_IDS.encode(medicamentid)
             
     def append_medication(self, medicamentname, medicamentdosage, medicamentduration, medicamenthours, medicamentbag, medicamentadministration, medicamentpatient):
         '''
         Create a new medicament. 
         raises HospitalDatabaseError if the DB could not be modified.
-        raises ValueError if the medicament_id has a wrong format
+        raises ValueError if the medicamentpatient has a wrong format
         returns the id of the new medicament or None if it could not be created
         '''
-        # SQL STATMENTS FOR KEYS
-        keys_on = 'PRAGMA foreign_keys = ON'
+        # Extracts the int which is the id for the patient in the database
+        medicamentpatient = ids.PATIENT_IDS.decode(medicamentpatient)
         # SQL Statement for inserting the data
         stmnt = 'INSERT INTO medicaments (name,dosage,duration,hours,bag_volume,administration,m_patient)\
                          VALUES(?,?,?,?,?,?,?)'
-        # Connects  to the database.
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
             cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)
-            # Extract medicament id
-            row = cur.fetchone()
-            if row != None:
-                medicament_id = 'med-' + str(row["medicament_id"])
             # Generate the values for SQL statement
             pvalue = (medicamentname,medicamentdosage,medicamentduration,medicamenthours,medicamentbag,medicamentadministration,medicamentpatient)
             cur.execute(stmnt,pvalue)
             # Extract the id of the added medicament
             lid = cur.lastrowid
+            # Write its doses in the same transaction
+            if lid is not None:
+                schedule.write_schedules(cur, [(lid, medicamenthours, medicamentduration)], self.clock())
             # Return the id in
-            return 'med-' + str(lid) if lid is not None else None
+            return ids.MEDICAMENT_IDS.encode(lid) if lid is not None else None
     
+    def append_medications(self, medicaments):
+        '''
+        Create several medicaments in a single transaction.
+        medicaments is a list of tuples (medicamentname, medicamentdosage,
+        medicamentduration, medicamenthours, medicamentbag,
+        medicamentadministration, medicamentpatient)
+        raises ValueError if a tuple does not have 7 values or a patient id
+        has a wrong format
+        returns the list of ids of the new medicaments, in the same order
+        '''
+        # SQL Statement for inserting the data
+        stmnt = 'INSERT INTO medicaments (name,dosage,duration,hours,bag_volume,administration,m_patient)\
+                         VALUES(?,?,?,?,?,?,?)'
+        # Generate the values for SQL statement
+        pvalues = [tuple(medicament) for medicament in medicaments]
+        if any(len(pvalue) != 7 for pvalue in pvalues):
+            raise ValueError("A medicament needs name, dosage, duration, hours, bag volume, "
+                             "administration and patient")
+        # Extracts the int which is the id for every patient in the database
+        pvalues = [pvalue[:6] + (ids.PATIENT_IDS.decode(pvalue[6]),) for pvalue in pvalues]
+        if not pvalues:
+            return []
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = con.cursor()
+            # All the rows are inserted in the same transaction
+            cur.executemany(stmnt, pvalues)
+            # Extract the ids of the added medicaments
+            lids = self._last_inserted_ids(cur, 'medicaments', len(pvalues))
+            # Write their doses in the same transaction
+            schedule.write_schedules(cur, [(lid, pvalue[3], pvalue[2]) for lid, pvalue in zip(lids, pvalues)],
+                                     self.clock())
+            return [ids.MEDICAMENT_IDS.encode(lid) for lid in lids]
+
     def delete_medicament(self, medicamentid):
         '''
         Delete a medicament in the Hospital.
@@ -991,23 +2180,13 @@ class HospitalDatabase(HospitalDatabaseInterface):
         return True if the medicament has been deleted False otherwise
         '''
         # Extracts the int which is the id for a medicament in the database
-        match = re.match(r'med-(\d{1,3})', medicamentid)
-        if match is None:
-            raise ValueError("The medicamentid is malformed")
-        medicamentid = int(match.group(1))
+        medicamentid = ids.MEDICAMENT_IDS.decode(medicamentid)
         
-        # SQL Statement for activating foreign keys
-        keys_on = 'PRAGMA foreign_keys = ON'
         # SQL Statement for deleting the user information
         query = 'DELETE FROM medicaments WHERE medicament_id = ?'
-        # Connects to the database. Gets a connection object
-        con = sqlite3.connect(self.db_path)
-        with con:
-            # Cursor and row initialization
-            con.row_factory = sqlite3.Row
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
             cur = con.cursor()
-            # Provide support for foreign keys
-            cur.execute(keys_on)        
             # Execute the statement to delete
             pvalue = (medicamentid,)
             cur.execute(query, pvalue)
@@ -1016,8 +2195,207 @@ class HospitalDatabase(HospitalDatabaseInterface):
                 return False
             return True
 
-    def contains_medicament (self, medicamentid):
+    def contains_medicament(self, medicamentid):
         '''
         Returns true if the medicament is in the database. False otherwise.
+        Raises a value error if medicamentid is not well formed.
         '''
-        return self.get_medicament(medicamentid) is not None
+        # Extracts the int which is the id for a medicament in the database
+        medicamentid = ids.MEDICAMENT_IDS.decode(medicamentid)
+
+        # Probe the primary key index without reading the row
+        query = 'SELECT EXISTS(SELECT 1 FROM medicaments WHERE medicament_id = ?)'
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = con.cursor()
+            pvalue = (medicamentid,)
+            cur.execute(query, pvalue)
+            return cur.fetchone()[0] == 1
+
+    # RELATED OBJECTS
+    def get_related_items(self, entity, field, values, fields=None, limit=None):
+        fields = related_fields(entity, field, fields)
+        table, key, known_fields, codec = ENTITIES[entity]
+        layout = get_layout(known_fields, fields)
+        column = known_fields[field][0]
+        values = sorted(set(value for value in values if value is not None))
+        related = []
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = self._record_cursor(con)
+            # Stay below the SQLite limit of host parameters. The chunks are
+            # sorted too, so the rows of all of them are sorted by column
+            for start in range(0, len(values), 500):
+                chunk = values[start:start + 500]
+                query = 'SELECT %s FROM %s WHERE %s IN (%s) ORDER BY %s, %s' % \
+                        (self._columns(layout), table, column, ','.join('?' * len(chunk)), column, key)
+                cur.execute(query, chunk)
+                related.extend(limit_per_value((Record(layout, row) for row in cur), field, limit))
+        return related
+
+    # WARD
+    def get_nurse_ward(self, nurseid):
+        '''
+        The ward is read with one query that joins the nurse, their patients
+        and the medicaments of the patients through the indexes of the
+        foreign keys. Every row carries the columns of the three tables and
+        is split in the records of the nurse, the patient and the medicament.
+        '''
+        nurses = get_layout(NURSE_FIELDS)
+        patients = get_layout(PATIENT_FIELDS)
+        medicaments = get_layout(MEDICAMENT_FIELDS)
+        columns = ', '.join(['n.' + column for column in nurses.columns] +
+                            ['p.' + column for column in patients.columns] +
+                            ['m.' + column for column in medicaments.columns])
+        query = 'SELECT %s FROM nurses_profile n \
+                 LEFT JOIN patients_profile p ON p.p_nurse = n.nurse_id \
+                 LEFT JOIN medicaments m ON m.m_patient = p.patient_id \
+                 WHERE n.nurse_id = ? ORDER BY p.patient_id, m.medicament_id' % columns
+        pvalue = (ids.NURSE_IDS.decode(nurseid),)
+        # Positions of the columns of every table in the rows
+        pstart = len(nurses.columns)
+        mstart = pstart + len(patients.columns)
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = self._record_cursor(con)
+            cur.execute(query, pvalue)
+            rows = cur.fetchall()
+        if not rows:
+            return None
+        nurse = Record(nurses, rows[0][:pstart])
+        ward = []
+        for row in rows:
+            # The LEFT JOINs fill the columns with NULL if there is no patient or medicament
+            if row[pstart] is None:
+                continue
+            if not ward or ward[-1][0].raw('id') != row[pstart]:
+                ward.append((Record(patients, row[pstart:mstart]), []))
+            if row[mstart] is not None:
+                ward[-1][1].append(Record(medicaments, row[mstart:]))
+        return nurse, ward
+
+    # DOSES
+    def get_due_doses(self, start, end, nurseid=None, limit=None):
+        '''
+        The doses are a range of the index of the doses by nurse and due
+        time, or by due time for all the patients, so the query reads only
+        the rows it returns. The medicament and the patient of every dose
+        are joined through their primary keys. The schedules whose doses
+        are only written before end are extended first.
+        '''
+        layout = get_layout(DOSE_FIELDS)
+        query = 'SELECT %s FROM doses d \
+                 JOIN medicaments m ON m.medicament_id = d.medicament_id \
+                 JOIN patients_profile p ON p.patient_id = m.m_patient WHERE ' % self._columns(layout)
+        pvalue = ()
+        if nurseid is not None:
+            query += 'd.nurse_id = ? AND '
+            pvalue += (ids.NURSE_IDS.decode(nurseid),)
+        query += 'd.due_time >= ? AND d.due_time < ? ORDER BY d.due_time, d.medicament_id'
+        pvalue += (int(start), int(end))
+        if limit is not None:
+            if limit < 0:
+                raise ValueError("The limit must be positive")
+            query += ' LIMIT ?'
+            pvalue += (limit,)
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            schedule.extend_schedules(con, end, self.clock())
+            cur = self._record_cursor(con)
+            cur.execute(query, pvalue)
+            # Every row has the columns of the layout
+            return [Record(layout, row) for row in cur.fetchall()]
+
+    # VERSIONS
+    def _row_version(self, table, key, number):
+        '''
+        Returns the version column of the row of table with the given key or
+        None if there is no such row. Only the primary key index is probed.
+        '''
+        query = 'SELECT version FROM %s WHERE %s = ?' % (table, key)
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = con.cursor()
+            cur.execute(query, (number,))
+            row = cur.fetchone()
+            return row[0] if row is not None else None
+
+    def _table_version(self, table):
+        '''
+        Returns the version of table, maintained by the triggers of the
+        schema (see migrations).
+        '''
+        query = 'SELECT version FROM table_versions WHERE name = ?'
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = con.cursor()
+            cur.execute(query, (table,))
+            row = cur.fetchone()
+            return row[0] if row is not None else None
+
+    def get_nurse_version(self, nurseid):
+        return self._row_version('nurses_profile', 'nurse_id', ids.NURSE_IDS.decode(nurseid))
+
+    def get_patient_version(self, patientid):
+        return self._row_version('patients_profile', 'patient_id', ids.PATIENT_IDS.decode(patientid))
+
+    def get_medicament_version(self, medicamentid):
+        return self._row_version('medicaments', 'medicament_id', ids.MEDICAMENT_IDS.decode(medicamentid))
+
+    def get_nurses_version(self):
+        return self._table_version('nurses_profile')
+
+    def get_patients_version(self):
+        return self._table_version('patients_profile')
+
+    def get_medicaments_version(self):
+        return self._table_version('medicaments')
+
+    # CHANGES
+    def get_changes(self, since=0, limit=None):
+        '''
+        The changes are recorded in the changes table by the triggers of the
+        schema (see migrations), ON DELETE CASCADE included. The changed
+        objects are read with one query per entity after the changes. An
+        object deleted in between is returned as deleted: its tombstone
+        comes in a later change.
+        '''
+        if since < 0 or (limit is not None and limit < 0):
+            raise ValueError("The sequence number and the limit must be positive")
+        query = 'SELECT seq, entity, item_id, deleted FROM changes WHERE seq > ? ORDER BY seq'
+        pvalue = (since,)
+        if limit is not None:
+            query += ' LIMIT ?'
+            pvalue += (limit,)
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = self._record_cursor(con)
+            cur.execute(query, pvalue)
+            changes = cur.fetchall()
+            # Read the objects that still exist, by entity
+            items = {}
+            for entity, (table, key, known_fields, codec) in CHANGE_ENTITIES.iteritems():
+                layout = get_layout(known_fields)
+                numbers = [number for sequence, name, number, deleted in changes if name == entity and not deleted]
+                # Stay below the SQLite limit of host parameters
+                for start in range(0, len(numbers), 500):
+                    chunk = numbers[start:start + 500]
+                    cur.execute('SELECT %s FROM %s WHERE %s IN (%s)' % (self._columns(layout), table, key,
+                                                                        ','.join('?' * len(chunk))), chunk)
+                    for row in cur:
+                        # The id is the first column of the layouts
+                        items[(entity, row[0])] = Record(layout, row)
+        result = []
+        for sequence, entity, number, deleted in changes:
+            item = items.get((entity, number))
+            result.append({'sequence': sequence, 'entity': entity, 'id': CHANGE_ENTITIES[entity][3].encode(number),
+                           'deleted': item is None, 'item': item})
+        return result
+
+    def get_change_sequence(self):
+        query = 'SELECT MAX(seq) FROM changes'
+        # Take a connection from the pool. It is already configured
+        with self.connection() as con:
+            cur = con.cursor()
+            cur.execute(query)
+            return cur.fetchone()[0] or 0
@@ -0,0 +1,408 @@
+'''
+Compact binary encodings of the representations: MessagePack and CBOR.
+
+Both encoders are written in pure Python so that they work wherever the
+application does, without compiled dependencies. They encode the same
+values as JSON (dictionaries and mappings, lists and tuples, strings,
+integers, floats, booleans and None), every string as UTF-8 text, and the
+decoders return the same structures json.loads would: unicode strings,
+lists and dictionaries. Malformed or truncated input, or input nesting
+more than MAX_DEPTH arrays and maps, raises ValueError.
+
+Usage:
+    body = msgpack_dumps({'name': 'Anna', 'room': 12})
+    msgpack_loads(body) == {u'name': u'Anna', u'room': 12}
+'''
+from collections import Mapping
+import struct
+
+# Arrays, maps and tags nested in a decoded value at most
+MAX_DEPTH = 100
+
+_MAX_UINT64 = 2 ** 64 - 1
+_MIN_INT64 = -2 ** 63
+
+
+def _text(value):
+    '''
+    Returns value (str or unicode) as UTF-8 bytes.
+    '''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def _check_key(key):
+    if isinstance(key, (list, dict)):
+        raise ValueError("A list or a map cannot be the key of a map")
+    return key
+
+
+class _Reader(object):
+    '''
+    Position in the encoded data of a decoder.
+    '''
+
+    def __init__(self, data):
+        if not isinstance(data, str):
+            raise TypeError("The encoded data must be a byte string")
+        self.data = data
+        self.position = 0
+        self.depth = 0
+
+    def read(self, size):
+        end = self.position + size
+        if end > len(self.data):
+            raise ValueError("Truncated data at byte %d" % self.position)
+        chunk = self.data[self.position:end]
+        self.position = end
+        return chunk
+
+    def enter(self):
+        '''
+        Start decoding a value nested in the current one.
+        '''
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            raise ValueError("More than %d nested values at byte %d" % (MAX_DEPTH, self.position))
+
+    def leave(self):
+        self.depth -= 1
+
+    def unpack(self, fmt):
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))[0]
+
+    def text(self, size):
+        try:
+            return self.read(size).decode('utf-8')
+        except UnicodeDecodeError:
+            raise ValueError("Invalid UTF-8 string before byte %d" % self.position)
+
+    def finish(self, value):
+        if self.position != len(self.data):
+            raise ValueError("Extra data at byte %d" % self.position)
+        return value
+
+
+# MESSAGEPACK
+def msgpack_dumps(value):
+    '''
+    Returns value encoded as MessagePack.
+    raises TypeError if it contains a value that cannot be encoded and
+    ValueError if an integer does not fit in 64 bits.
+    '''
+    out = []
+    _msgpack_pack(value, out.append)
+    return ''.join(out)
+
+
+def _msgpack_pack(value, write):
+    if value is None:
+        write('\xc0')
+    elif value is True:
+        write('\xc3')
+    elif value is False:
+        write('\xc2')
+    elif isinstance(value, (int, long)):
+        if 0 <= value < 0x80:
+            write(chr(value))
+        elif -32 <= value < 0:
+            write(struct.pack('>b', value))
+        elif value > 0:
+            if value <= 0xff:
+                write(struct.pack('>BB', 0xcc, value))
+            elif value <= 0xffff:
+                write(struct.pack('>BH', 0xcd, value))
+            elif value <= 0xffffffff:
+                write(struct.pack('>BI', 0xce, value))
+            elif value <= _MAX_UINT64:
+                write(struct.pack('>BQ', 0xcf, value))
+            else:
+                raise ValueError("Integer too large for MessagePack: %d" % value)
+        elif value >= -0x80:
+            write(struct.pack('>Bb', 0xd0, value))
+        elif value >= -0x8000:
+            write(struct.pack('>Bh', 0xd1, value))
+        elif value >= -0x80000000:
+            write(struct.pack('>Bi', 0xd2, value))
+        elif value >= _MIN_INT64:
+            write(struct.pack('>Bq', 0xd3, value))
+        else:
+            raise ValueError("Integer too small for MessagePack: %d" % value)
+    elif isinstance(value, float):
+        write(struct.pack('>Bd', 0xcb, value))
+    elif isinstance(value, basestring):
+        data = _text(value)
+        size = len(data)
+        if size < 32:
+            write(chr(0xa0 | size))
+        elif size <= 0xff:
+            write(struct.pack('>BB', 0xd9, size))
+        elif size <= 0xffff:
+            write(struct.pack('>BH', 0xda, size))
+        else:
+            write(struct.pack('>BI', 0xdb, size))
+        write(data)
+    elif isinstance(value, (list, tuple)):
+        size = len(value)
+        if size < 16:
+            write(chr(0x90 | size))
+        elif size <= 0xffff:
+            write(struct.pack('>BH', 0xdc, size))
+        else:
+            write(struct.pack('>BI', 0xdd, size))
+        for item in value:
+            _msgpack_pack(item, write)
+    elif isinstance(value, Mapping):
+        size = len(value)
+        if size < 16:
+            write(chr(0x80 | size))
+        elif size <= 0xffff:
+            write(struct.pack('>BH', 0xde, size))
+        else:
+            write(struct.pack('>BI', 0xdf, size))
+        for key, item in value.iteritems():
+            _msgpack_pack(key, write)
+            _msgpack_pack(item, write)
+    else:
+        raise TypeError("%r cannot be encoded as MessagePack" % (value,))
+
+
+def msgpack_loads(data):
+    '''
+    Returns the value encoded as MessagePack in data.
+    raises ValueError if data is not a valid encoding of one value.
+    '''
+    reader = _Reader(data)
+    return reader.finish(_msgpack_unpack(reader))
+
+
+# Fixed size formats: first byte -> struct format
+_MSGPACK_NUMBERS = {0xca: '>f', 0xcb: '>d', 0xcc: '>B', 0xcd: '>H', 0xce: '>I', 0xcf: '>Q',
+                    0xd0: '>b', 0xd1: '>h', 0xd2: '>i', 0xd3: '>q'}
+# Strings, binaries, arrays and maps: first byte -> (struct format of the size, kind)
+_MSGPACK_CONTAINERS = {0xd9: ('>B', 'str'), 0xda: ('>H', 'str'), 0xdb: ('>I', 'str'),
+                       0xc4: ('>B', 'bin'), 0xc5: ('>H', 'bin'), 0xc6: ('>I', 'bin'),
+                       0xdc: ('>H', 'array'), 0xdd: ('>I', 'array'),
+                       0xde: ('>H', 'map'), 0xdf: ('>I', 'map')}
+
+
+def _msgpack_unpack(reader):
+    first = ord(reader.read(1))
+    if first < 0x80:
+        return first
+    if first >= 0xe0:
+        return first - 0x100
+    if first <= 0x8f:
+        return _msgpack_map(reader, first & 0x0f)
+    if first <= 0x9f:
+        return _msgpack_array(reader, first & 0x0f)
+    if first <= 0xbf:
+        return reader.text(first & 0x1f)
+    if first == 0xc0:
+        return None
+    if first == 0xc2:
+        return False
+    if first == 0xc3:
+        return True
+    if first in _MSGPACK_NUMBERS:
+        return reader.unpack(_MSGPACK_NUMBERS[first])
+    if first in _MSGPACK_CONTAINERS:
+        fmt, kind = _MSGPACK_CONTAINERS[first]
+        size = reader.unpack(fmt)
+        if kind == 'str':
+            return reader.text(size)
+        if kind == 'bin':
+            return reader.read(size)
+        if kind == 'array':
+            return _msgpack_array(reader, size)
+        return _msgpack_map(reader, size)
+    raise ValueError("Unsupported MessagePack type 0x%02x at byte %d" % (first, reader.position - 1))
+
+
+def _msgpack_array(reader, size):
+    reader.enter()
+    result = [_msgpack_unpack(reader) for i in xrange(size)]
+    reader.leave()
+    return result
+
+
+def _msgpack_map(reader, size):
+    reader.enter()
+    result = {}
+    for i in xrange(size):
+        key = _check_key(_msgpack_unpack(reader))
+        result[key] = _msgpack_unpack(reader)
+    reader.leave()
+    return result
+
+
+# CBOR (RFC 7049)
+def cbor_dumps(value):
+    '''
+    Returns value encoded as CBOR.
+    raises TypeError if it contains a value that cannot be encoded and
+    ValueError if an integer does not fit in 64 bits.
+    '''
+    out = []
+    _cbor_pack(value, out.append)
+    return ''.join(out)
+
+
+def _cbor_head(major, number, write):
+    '''
+    Write the initial byte of a data item of type major with its argument number.
+    '''
+    major <<= 5
+    if number < 24:
+        write(chr(major | number))
+    elif number <= 0xff:
+        write(struct.pack('>BB', major | 24, number))
+    elif number <= 0xffff:
+        write(struct.pack('>BH', major | 25, number))
+    elif number <= 0xffffffff:
+        write(struct.pack('>BI', major | 26, number))
+    elif number <= _MAX_UINT64:
+        write(struct.pack('>BQ', major | 27, number))
+    else:
+        raise ValueError("Integer too large for CBOR: %d" % number)
+
+
+def _cbor_pack(value, write):
+    if value is None:
+        write('\xf6')
+    elif value is True:
+        write('\xf5')
+    elif value is False:
+        write('\xf4')
+    elif isinstance(value, (int, long)):
+        if value >= 0:
+            _cbor_head(0, value, write)
+        else:
+            _cbor_head(1, -1 - value, write)
+    elif isinstance(value, float):
+        write(struct.pack('>Bd', 0xfb, value))
+    elif isinstance(value, basestring):
+        data = _text(value)
+        _cbor_head(3, len(data), write)
+        write(data)
+    elif isinstance(value, (list, tuple)):
+        _cbor_head(4, len(value), write)
+        for item in value:
+            _cbor_pack(item, write)
+    elif isinstance(value, Mapping):
+        _cbor_head(5, len(value), write)
+        for key, item in value.iteritems():
+            _cbor_pack(key, write)
+            _cbor_pack(item, write)
+    else:
+        raise TypeError("%r cannot be encoded as CBOR" % (value,))
+
+
+def cbor_loads(data):
+    '''
+    Returns the value encoded as CBOR in data. Tags are ignored (the tagged
+    value is returned) and undefined is decoded as None.
+    raises ValueError if data is not a valid encoding of one value.
+    '''
+    reader = _Reader(data)
+    return reader.finish(_cbor_unpack(reader))
+
+
+# Marks the end of an indefinite length item
+_CBOR_BREAK = object()
+# Size of the argument: additional information -> struct format
+_CBOR_ARGUMENTS = {24: '>B', 25: '>H', 26: '>I', 27: '>Q'}
+
+
+def _cbor_half(bits):
+    '''
+    Returns the half precision float with the given bits.
+    '''
+    exponent = (bits >> 10) & 0x1f
+    mantissa = bits & 0x3ff
+    if exponent == 0:
+        value = mantissa * 2.0 ** -24
+    elif exponent == 0x1f:
+        value = float('nan') if mantissa else float('inf')
+    else:
+        value = (1024 + mantissa) * 2.0 ** (exponent - 25)
+    return -value if bits & 0x8000 else value
+
+
+def _cbor_unpack(reader, allow_break=False):
+    first = ord(reader.read(1))
+    major, info = first >> 5, first & 0x1f
+    if major == 7:
+        if info == 20:
+            return False
+        if info == 21:
+            return True
+        if info in (22, 23):
+            return None
+        if info == 25:
+            return _cbor_half(reader.unpack('>H'))
+        if info == 26:
+            return reader.unpack('>f')
+        if info == 27:
+            return reader.unpack('>d')
+        if info == 31 and allow_break:
+            return _CBOR_BREAK
+        raise ValueError("Unsupported CBOR simple value %d at byte %d" % (info, reader.position - 1))
+    if info < 24:
+        number = info
+    elif info in _CBOR_ARGUMENTS:
+        number = reader.unpack(_CBOR_ARGUMENTS[info])
+    elif info == 31 and major in (2, 3, 4, 5):
+        return _cbor_indefinite(reader, major)
+    else:
+        raise ValueError("Invalid CBOR argument at byte %d" % (reader.position - 1))
+    if major == 0:
+        return number
+    if major == 1:
+        return -1 - number
+    if major == 2:
+        return reader.read(number)
+    if major == 3:
+        return reader.text(number)
+    reader.enter()
+    if major == 4:
+        result = [_cbor_unpack(reader) for i in xrange(number)]
+    elif major == 5:
+        result = {}
+        for i in xrange(number):
+            key = _check_key(_cbor_unpack(reader))
+            result[key] = _cbor_unpack(reader)
+    else:
+        # Tag: the tagged value
+        result = _cbor_unpack(reader)
+    reader.leave()
+    return result
+
+
+def _cbor_indefinite(reader, major):
+    if major in (2, 3):
+        # The chunks are definite length strings of the same type
+        chunks = []
+        while True:
+            first = ord(reader.read(1))
+            if first == 0xff:
+                break
+            if first >> 5 != major or first & 0x1f == 31:
+                raise ValueError("Invalid chunk of an indefinite CBOR string at byte %d" % (reader.position - 1))
+            reader.position -= 1
+            chunks.append(_cbor_unpack(reader))
+        return ''.join(chunks) if major == 2 else u''.join(chunks)
+    reader.enter()
+    items = []
+    while True:
+        item = _cbor_unpack(reader, allow_break=True)
+        if item is _CBOR_BREAK:
+            break
+        items.append(item)
+    reader.leave()
+    if major == 4:
+        return items
+    if len(items) % 2:
+        raise ValueError("CBOR map without the value of its last key")
+    return dict(zip(map(_check_key, items[::2]), items[1::2]))
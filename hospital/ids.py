@@ -0,0 +1,69 @@
+'''
+Codec of the public ids of the hospital (nur-12, pat-3, med-40, doc-1).
+
+The database stores the ids as SQLite integers (signed 64 bits). The API
+shows them with the prefix of their table. Every id is parsed with a
+precompiled regular expression, once per request: the URL converters of
+hospital.utils give the number to the resources, and the database accepts
+both the number and the public id.
+'''
+import re
+
+# Largest id that SQLite can store in an INTEGER PRIMARY KEY
+MAX_ID = 2 ** 63 - 1
+
+
+class IdCodec(object):
+    '''
+    Converts between the public ids with a prefix (e.g. 'nur-12') and the
+    numbers stored in the database.
+    '''
+
+    def __init__(self, prefix, name):
+        self.prefix = prefix
+        self.name = name
+        # 19 digits is enough for MAX_ID, the value is checked in decode
+        self.pattern = r'%s-[0-9]{1,19}' % prefix
+        self._regex = re.compile(r'%s-([0-9]{1,19})\Z' % prefix)
+        self._head = prefix + '-'
+
+    def decode(self, value):
+        '''
+        Returns the number of the id value, which can be the public id or a
+        number that has already been decoded.
+        raises ValueError if value is malformed or out of range.
+        '''
+        if isinstance(value, (int, long)) and not isinstance(value, bool):
+            number = value
+        else:
+            match = self._regex.match(value) if isinstance(value, basestring) else None
+            if match is None:
+                raise ValueError("The %s %s is malformed" % (self.name, value))
+            number = int(match.group(1))
+        if not 0 <= number <= MAX_ID:
+            raise ValueError("The %s %s is out of range" % (self.name, value))
+        return number
+
+    def encode(self, number):
+        '''
+        Returns the public id of a number. None is returned unchanged.
+        '''
+        if number is None:
+            return None
+        return self._head + str(number)
+
+    def normalize(self, value):
+        '''
+        Returns the public id of value, a public id or a number.
+        raises ValueError if value is malformed or out of range.
+        '''
+        return self.encode(self.decode(value))
+
+
+NURSE_IDS = IdCodec('nur', 'nurseid')
+PATIENT_IDS = IdCodec('pat', 'patientid')
+MEDICAMENT_IDS = IdCodec('med', 'medicamentid')
+DOCTOR_IDS = IdCodec('doc', 'doctorid')
+
+# Codecs by prefix
+CODECS = dict((codec.prefix, codec) for codec in (NURSE_IDS, PATIENT_IDS, MEDICAMENT_IDS, DOCTOR_IDS))
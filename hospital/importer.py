@@ -0,0 +1,334 @@
+'''
+Streaming bulk importer for nurses, patients and medicaments.
+
+The input (NDJSON: one JSON object per line, or CSV with a header row) is
+parsed incrementally and written in batches, one transaction per batch, so
+the memory used does not depend on the size of the file. Rows referencing
+an unknown nurse, doctor or patient are rejected, the rest of the batch is
+imported.
+
+Usage from the project folder:
+    python -m hospital.importer --db db/hospital.db nurses nurses.ndjson
+    python -m hospital.importer --db db/hospital.db --format csv medicaments medication.csv
+'''
+import argparse
+import csv
+import json
+import sqlite3
+import sys
+import time
+
+import database
+import schedule
+
+DEFAULT_BATCH_SIZE = 1000
+# Maximum number of rejected rows described in the report
+DEFAULT_MAX_REJECTS = 100
+
+FORMATS = ('ndjson', 'csv')
+
+
+def _spec(entity, fields, references, schedules):
+    '''
+    Returns the import description of entity: the table, primary key and id
+    codec of database.ENTITIES, fields (input name, column), references
+    (input name, column, referenced table, referenced key, id codec) and
+    whether the rows have medication schedules.
+    '''
+    table, key, columns, codec = database.ENTITIES[entity]
+    resolved = []
+    for name, column, referenced in references:
+        referenced_table, referenced_key, referenced_columns, referenced_codec = database.ENTITIES[referenced]
+        resolved.append((name, column, referenced_table, referenced_key, referenced_codec))
+    return {'table': table, 'key': key, 'codec': codec, 'fields': fields, 'references': resolved,
+            'schedules': schedules}
+
+
+# Entities that can be imported, references: (input name, column, referenced entity)
+ENTITIES = {
+    'nurses': _spec('nurses', [('name', 'name'), ('surname', 'surname'), ('phone_number', 'phone_number'),
+                               ('address', 'address')], [], False),
+    'patients': _spec('patients', [('name', 'name'), ('surname', 'surname'), ('room', 'room'),
+                                   ('phone_number', 'phone_number'), ('address', 'address')],
+                      [('nurse_id', 'p_nurse', 'nurses'), ('doctor_id', 'p_doctor', 'doctors')], False),
+    'medicaments': _spec('medicaments', [('name', 'name'), ('dosage', 'dosage'), ('duration', 'duration'),
+                                         ('hours', 'hours'), ('bag_volume', 'bag_volume'),
+                                         ('administration', 'administration')],
+                         [('patient_id', 'm_patient', 'patients')], True),
+}
+
+
+class ImportReport(object):
+    '''
+    Progress and result of an import.
+    '''
+
+    def __init__(self, entity, max_rejects=DEFAULT_MAX_REJECTS):
+        self.entity = entity
+        self.read = 0
+        self.imported = 0
+        self.rejected = 0
+        self.batches = 0
+        self.max_rejects = max_rejects
+        # Only the first max_rejects rejected rows are kept
+        self.rejects = []
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.rejects) < self.max_rejects:
+            self.rejects.append({'line': line, 'reason': reason})
+
+    def as_dict(self):
+        return {'entity': self.entity, 'read': self.read, 'imported': self.imported,
+                'rejected': self.rejected, 'batches': self.batches, 'rejects': list(self.rejects)}
+
+
+def parse_id(value, codec):
+    '''
+    Returns the number of the id value, which can be an integer, a string of
+    digits like "12" (CSV) or a public id like "nur-12", with the IdCodec
+    codec. Raises ValueError if it is malformed or out of range.
+    '''
+    if isinstance(value, basestring):
+        value = value.strip()
+        if value.isdigit():
+            value = int(value)
+    return codec.decode(value)
+
+
+def read_ndjson(stream):
+    '''
+    Yields (line number, object) for every non empty line of stream. The
+    object is None if the line is not a JSON object.
+    '''
+    for lineno, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield lineno, row if isinstance(row, dict) else None
+
+
+def read_csv(stream):
+    '''
+    Yields (line number, object) for every row of a CSV stream with a
+    header. Empty values are read as None.
+    '''
+    reader = csv.reader(stream)
+    try:
+        header = [name.decode('utf-8').strip() for name in next(reader)]
+    except StopIteration:
+        return
+    for values in reader:
+        if not values:
+            continue
+        if len(values) != len(header):
+            yield reader.line_num, None
+            continue
+        row = {}
+        for name, value in zip(header, values):
+            value = value.decode('utf-8')
+            row[name] = value if value != '' else None
+        yield reader.line_num, row
+
+
+READERS = {'ndjson': read_ndjson, 'csv': read_csv}
+
+
+def _prepare(spec, lineno, row, report):
+    '''
+    Returns the values to insert for row (id first) and the referenced ids,
+    or None if the row is rejected.
+    '''
+    if row is None:
+        report.reject(lineno, "Malformed row")
+        return None
+    try:
+        rowid = row.get('id')
+        values = [parse_id(rowid, spec['codec']) if rowid is not None else None]
+        for name, column in spec['fields']:
+            values.append(row[name])
+        references = []
+        for name, column, table, key, codec in spec['references']:
+            references.append(parse_id(row[name], codec))
+    except KeyError, e:
+        report.reject(lineno, "Missing field %s" % e.args[0])
+        return None
+    except (ValueError, OverflowError), e:
+        report.reject(lineno, str(e))
+        return None
+    return values + references, references
+
+
+def _existing_ids(cur, table, key, ids):
+    '''
+    Returns the subset of ids that exist in table.
+    '''
+    existing = set()
+    ids = list(ids)
+    # Stay below the SQLite limit of host parameters
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        query = 'SELECT %s FROM %s WHERE %s IN (%s)' % (key, table, key, ','.join('?' * len(chunk)))
+        cur.execute(query, chunk)
+        existing.update(row[0] for row in cur)
+    return existing
+
+
+def _sequence(cur, table):
+    '''
+    Returns the last id given by AUTOINCREMENT in table, 0 if there is none.
+    '''
+    cur.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,))
+    row = cur.fetchone()
+    return row[0] if row is not None else 0
+
+
+def _inserted_rows(cur, spec, sequence, inserted):
+    '''
+    Returns the id, hours and duration of the medicaments inserted by the
+    current transaction: those with an id greater than sequence, the value
+    of _sequence before the inserts, and those of inserted (the values of
+    the rows) with an explicit id.
+    '''
+    columns = '%s, hours, duration' % spec['key']
+    cur.execute('SELECT %s FROM %s WHERE %s > ?' % (columns, spec['table'], spec['key']), (sequence,))
+    rows = cur.fetchall()
+    # The id is the first value of the rows
+    numbers = sorted(values[0] for values in inserted if values[0] is not None and values[0] <= sequence)
+    # Stay below the SQLite limit of host parameters
+    for start in range(0, len(numbers), 500):
+        chunk = numbers[start:start + 500]
+        cur.execute('SELECT %s FROM %s WHERE %s IN (%s)' % (columns, spec['table'], spec['key'],
+                                                            ','.join('?' * len(chunk))), chunk)
+        rows.extend(cur.fetchall())
+    return rows
+
+
+def _write_batch(con, spec, batch, report):
+    '''
+    Insert a batch of (line number, values, references) in one transaction.
+    '''
+    columns = [spec['key']] + [column for name, column in spec['fields']] + \
+              [column for name, column, table, key, codec in spec['references']]
+    stmnt = 'INSERT INTO %s (%s) VALUES(%s)' % (spec['table'], ','.join(columns), ','.join('?' * len(columns)))
+    cur = con.cursor()
+    # The transactions are managed explicitly to use a savepoint
+    isolation_level = con.isolation_level
+    con.isolation_level = None
+    try:
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            # Check the foreign keys of the whole batch with one query per reference
+            for position, (name, column, table, key, codec) in enumerate(spec['references']):
+                existing = _existing_ids(cur, table, key, set(item[2][position] for item in batch))
+                valid = []
+                for item in batch:
+                    if item[2][position] in existing:
+                        valid.append(item)
+                    else:
+                        report.reject(item[0], "Unknown %s %s" % (name, codec.encode(item[2][position])))
+                batch = valid
+            sequence = _sequence(cur, spec['table'])
+            cur.execute('SAVEPOINT import_batch')
+            try:
+                cur.executemany(stmnt, [item[1] for item in batch])
+                inserted = [item[1] for item in batch]
+            except (sqlite3.IntegrityError, OverflowError):
+                # Find out the offending rows inserting them one by one. An
+                # integer value that does not fit in SQLite is one of them
+                cur.execute('ROLLBACK TO import_batch')
+                inserted = []
+                for lineno, values, references in batch:
+                    try:
+                        cur.execute(stmnt, values)
+                        inserted.append(values)
+                    except (sqlite3.IntegrityError, OverflowError), e:
+                        report.reject(lineno, str(e))
+            imported = len(inserted)
+            if spec['schedules'] and inserted:
+                # The doses are written in the same transaction as the rows
+                schedule.write_schedules(cur, _inserted_rows(cur, spec, sequence, inserted), time.time())
+            cur.execute('RELEASE import_batch')
+            cur.execute('COMMIT')
+        except Exception:
+            cur.execute('ROLLBACK')
+            raise
+    finally:
+        con.isolation_level = isolation_level
+    report.imported += imported
+    report.batches += 1
+
+
+def import_stream(db, entity, stream, format='ndjson', batch_size=DEFAULT_BATCH_SIZE, progress=None,
+                  max_rejects=DEFAULT_MAX_REJECTS):
+    '''
+    Import the rows of entity ('nurses', 'patients' or 'medicaments') read
+    from stream into the HospitalDatabase db.
+    progress is called with the ImportReport after every batch.
+    raises ValueError if the entity, the format or the batch size are wrong.
+    returns the ImportReport.
+    '''
+    if entity not in ENTITIES:
+        raise ValueError("Unknown entity %s" % entity)
+    if format not in READERS:
+        raise ValueError("Unknown format %s" % format)
+    if batch_size < 1:
+        raise ValueError("The batch size must be at least 1")
+    spec = ENTITIES[entity]
+    report = ImportReport(entity, max_rejects)
+    batch = []
+    for lineno, row in READERS[format](stream):
+        report.read += 1
+        prepared = _prepare(spec, lineno, row, report)
+        if prepared is None:
+            continue
+        batch.append((lineno,) + prepared)
+        if len(batch) >= batch_size:
+            with db.connection() as con:
+                _write_batch(con, spec, batch, report)
+            batch = []
+            if progress is not None:
+                progress(report)
+    if batch:
+        with db.connection() as con:
+            _write_batch(con, spec, batch, report)
+        if progress is not None:
+            progress(report)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import nurses, patients or medicaments.')
+    parser.add_argument('entity', choices=sorted(ENTITIES))
+    parser.add_argument('path', help='file to import, - for the standard input')
+    parser.add_argument('--db', default='db/hospital.db', help='path of the database')
+    parser.add_argument('--format', choices=FORMATS, help='format of the file (by default from its extension)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('csv' if args.path.lower().endswith('.csv') else 'ndjson')
+    db = database.HospitalDatabase(args.db)
+    db.migrate()
+
+    def progress(report):
+        sys.stderr.write("%d rows read, %d imported, %d rejected\n" % (report.read, report.imported,
+                                                                      report.rejected))
+
+    stream = sys.stdin if args.path == '-' else open(args.path, 'rb')
+    try:
+        report = import_stream(db, args.entity, stream, fmt, args.batch_size, progress)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        db.close()
+    for reject in report.rejects:
+        sys.stderr.write("line %(line)d: %(reason)s\n" % reject)
+    print json.dumps(report.as_dict())
+    return 1 if report.rejected else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
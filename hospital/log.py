@@ -0,0 +1,206 @@
+'''
+Structured logging of the hospital package.
+
+The modules log with the standard logging module
+(logging.getLogger(__name__)). configure attaches to the 'hospital' logger
+a QueueHandler that only puts the records in a bounded queue: a
+background thread (QueueListener) formats them as JSON lines and writes
+them, so a request never waits for the output. When the queue is full the
+records are dropped and counted instead of blocking.
+
+The level can be set per module (levels={'hospital.resources': 'DEBUG'}).
+The default level is WARNING, so the debug records of the loops that
+build the collections are discarded before anything is formatted.
+With sample=n only one of every n records below WARNING is kept.
+
+Usage:
+    log.configure(level='INFO', levels={'hospital.database': 'DEBUG'}, sample=10)
+'''
+import json
+import logging
+import os
+import Queue
+import sys
+import threading
+import time
+
+ROOT_LOGGER = 'hospital'
+DEFAULT_LEVEL = 'WARNING'
+# Records waiting for the writer thread, the new ones are dropped when it is full
+DEFAULT_QUEUE_SIZE = 10000
+
+# Attributes of every LogRecord, the others come from extra
+_RECORD_ATTRIBUTES = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | set(['message', 'asctime'])
+
+
+class StructuredFormatter(logging.Formatter):
+    '''
+    Formats a record as one JSON object: time, level, logger, message, the
+    values given in extra and the traceback, if any.
+    '''
+
+    def format(self, record):
+        entry = {'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) +
+                 '.%03dZ' % record.msecs,
+                 'level': record.levelname, 'logger': record.name, 'message': record.getMessage()}
+        for key, value in record.__dict__.iteritems():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Formatted by QueueHandler
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=repr, sort_keys=True)
+
+
+class SamplingFilter(logging.Filter):
+    '''
+    Keeps one of every rate records below level. The records of level or
+    above are always kept.
+    '''
+
+    def __init__(self, rate, level=logging.WARNING):
+        logging.Filter.__init__(self)
+        if rate < 1:
+            raise ValueError("The sampling rate must be at least 1")
+        self.rate = rate
+        self.level = level
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= self.level:
+            return True
+        with self._lock:
+            keep = self._count % self.rate == 0
+            self._count += 1
+        return keep
+
+
+class QueueListener(object):
+    '''
+    Background thread that gives the records of queue to handlers. The
+    thread is started again by the first record put in a process created
+    with fork, where it does not exist.
+    '''
+
+    def __init__(self, queue, *handlers):
+        self.queue = queue
+        self.handlers = handlers
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            # After a fork the queue may hold the records of the parent and its lock may be held
+            self.queue = Queue.Queue(maxsize=self.queue.maxsize)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='hospital-log-writer')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            # None is sent by stop
+            if record is None:
+                return
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def stop(self):
+        '''
+        Write the records already queued and stop the thread.
+        '''
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and self._pid == os.getpid():
+            self.queue.put(None)
+            thread.join()
+        for handler in self.handlers:
+            handler.flush()
+
+
+class QueueHandler(logging.Handler):
+    '''
+    Puts the records in the queue of listener without waiting.
+    '''
+
+    def __init__(self, listener):
+        logging.Handler.__init__(self)
+        self.listener = listener
+        self.dropped = 0
+
+    def emit(self, record):
+        if self.listener._pid != os.getpid():
+            self.listener.start()
+        try:
+            # The arguments may change before the writer formats the record
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self.listener.queue.put_nowait(record)
+        except Queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+_handler = None
+
+
+def configure(level=DEFAULT_LEVEL, levels=None, sample=None, stream=None, queue_size=DEFAULT_QUEUE_SIZE):
+    '''
+    Send the records of the hospital package, as JSON lines, to stream
+    (stderr by default) through a background thread. level is the level of
+    the package, levels a dictionary logger name -> level and sample the
+    sampling rate of the records below WARNING (None to keep them all).
+    Configuring again replaces the previous configuration.
+    Returns the QueueHandler.
+    '''
+    global _handler
+    shutdown()
+    output = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    output.setFormatter(StructuredFormatter())
+    listener = QueueListener(Queue.Queue(maxsize=queue_size), output)
+    handler = QueueHandler(listener)
+    if sample is not None:
+        handler.addFilter(SamplingFilter(sample))
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(level)
+    logger.addHandler(handler)
+    # The records are written once, not again by the handlers of the root logger
+    logger.propagate = False
+    for name, module_level in (levels or {}).iteritems():
+        logging.getLogger(name).setLevel(module_level)
+    _handler = handler
+    listener.start()
+    return handler
+
+
+def shutdown():
+    '''
+    Write the queued records and remove the handler added by configure.
+    '''
+    global _handler
+    if _handler is None:
+        return
+    logging.getLogger(ROOT_LOGGER).removeHandler(_handler)
+    _handler.listener.stop()
+    _handler = None
+
+
+def stats():
+    '''
+    Returns the number of records waiting and dropped.
+    '''
+    if _handler is None:
+        return {'pending': 0, 'dropped': 0}
+    return {'pending': _handler.listener.queue.qsize(), 'dropped': _handler.dropped}
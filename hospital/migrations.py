@@ -0,0 +1,200 @@
+'''
+Versioned schema migrations for the hospital database.
+
+The schema version is stored in the database header (PRAGMA user_version).
+Every migration has a number and a list of SQL statements. Migrations with a
+number greater than the current version are applied in order, each one in its
+own transaction together with the new version number, so an existing
+database is upgraded in place without reloading its data.
+'''
+
+# Version that creates the medication schedules: the doses of the existing
+# medicaments are written after applying it (see HospitalDatabase.migrate)
+SCHEDULES_VERSION = 5
+
+# List of (version, description, statements). Never modify a migration that
+# has been released, append a new one instead.
+# Mirror every new migration in db/hospital_schema_dump.sql, together with
+# its PRAGMA user_version.
+MIGRATIONS = [
+    (1, 'initial schema', [
+        'CREATE TABLE IF NOT EXISTS nurses_profile(\
+            nurse_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, surname TEXT,\
+            phone_number INTEGER, address TEXT)',
+        'CREATE TABLE IF NOT EXISTS doctors_profile(\
+            doctor_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, surname TEXT,\
+            phone_number INTEGER, address TEXT)',
+        'CREATE TABLE IF NOT EXISTS patients_profile(\
+            patient_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, surname TEXT, room INTEGER,\
+            phone_number INTEGER, address TEXT, p_nurse INTEGER, p_doctor INTEGER,\
+            FOREIGN KEY(p_nurse) REFERENCES nurses_profile(nurse_id) ON DELETE CASCADE,\
+            FOREIGN KEY(p_doctor) REFERENCES doctors_profile(doctor_id) ON DELETE CASCADE)',
+        'CREATE TABLE IF NOT EXISTS medicaments(\
+            medicament_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, dosage TEXT, duration TEXT,\
+            hours TEXT, bag_volume TEXT, administration TEXT, m_patient INTEGER,\
+            FOREIGN KEY(m_patient) REFERENCES patients_profile(patient_id) ON DELETE CASCADE)',
+    ]),
+    (2, 'foreign key indexes', [
+        # Used by get_nurses_patient_list and ON DELETE CASCADE from nurses
+        'CREATE INDEX IF NOT EXISTS patients_profile_p_nurse_idx ON patients_profile(p_nurse)',
+        # Used by ON DELETE CASCADE from doctors
+        'CREATE INDEX IF NOT EXISTS patients_profile_p_doctor_idx ON patients_profile(p_doctor)',
+        # Used by get_patient_medication_list and ON DELETE CASCADE from patients
+        'CREATE INDEX IF NOT EXISTS medicaments_m_patient_idx ON medicaments(m_patient)',
+    ]),
+    (3, 'row and table versions', [
+        # Version of every row, incremented by a trigger on every update
+        'ALTER TABLE nurses_profile ADD COLUMN version INTEGER NOT NULL DEFAULT 1',
+        'ALTER TABLE patients_profile ADD COLUMN version INTEGER NOT NULL DEFAULT 1',
+        'ALTER TABLE medicaments ADD COLUMN version INTEGER NOT NULL DEFAULT 1',
+        # Version of every table, incremented on every insert, update and delete
+        # (ON DELETE CASCADE fires the delete triggers of the child tables too)
+        'CREATE TABLE IF NOT EXISTS table_versions(name TEXT PRIMARY KEY, version INTEGER NOT NULL)',
+        "INSERT OR IGNORE INTO table_versions VALUES('nurses_profile', 1)",
+        "INSERT OR IGNORE INTO table_versions VALUES('patients_profile', 1)",
+        "INSERT OR IGNORE INTO table_versions VALUES('medicaments', 1)",
+        "CREATE TRIGGER IF NOT EXISTS nurses_profile_insert_version AFTER INSERT ON nurses_profile BEGIN\
+            UPDATE table_versions SET version = version + 1 WHERE name = 'nurses_profile'; END",
+        "CREATE TRIGGER IF NOT EXISTS nurses_profile_update_version AFTER UPDATE ON nurses_profile\
+            WHEN NEW.version = OLD.version BEGIN\
+            UPDATE nurses_profile SET version = OLD.version + 1 WHERE nurse_id = NEW.nurse_id;\
+            UPDATE table_versions SET version = version + 1 WHERE name = 'nurses_profile'; END",
+        "CREATE TRIGGER IF NOT EXISTS nurses_profile_delete_version AFTER DELETE ON nurses_profile BEGIN\
+            UPDATE table_versions SET version = version + 1 WHERE name = 'nurses_profile'; END",
+        "CREATE TRIGGER IF NOT EXISTS patients_profile_insert_version AFTER INSERT ON patients_profile BEGIN\
+            UPDATE table_versions SET version = version + 1 WHERE name = 'patients_profile'; END",
+        "CREATE TRIGGER IF NOT EXISTS patients_profile_update_version AFTER UPDATE ON patients_profile\
+            WHEN NEW.version = OLD.version BEGIN\
+            UPDATE patients_profile SET version = OLD.version + 1 WHERE patient_id = NEW.patient_id;\
+            UPDATE table_versions SET version = version + 1 WHERE name = 'patients_profile'; END",
+        "CREATE TRIGGER IF NOT EXISTS patients_profile_delete_version AFTER DELETE ON patients_profile BEGIN\
+            UPDATE table_versions SET version = version + 1 WHERE name = 'patients_profile'; END",
+        "CREATE TRIGGER IF NOT EXISTS medicaments_insert_version AFTER INSERT ON medicaments BEGIN\
+            UPDATE table_versions SET version = version + 1 WHERE name = 'medicaments'; END",
+        "CREATE TRIGGER IF NOT EXISTS medicaments_update_version AFTER UPDATE ON medicaments\
+            WHEN NEW.version = OLD.version BEGIN\
+            UPDATE medicaments SET version = OLD.version + 1 WHERE medicament_id = NEW.medicament_id;\
+            UPDATE table_versions SET version = version + 1 WHERE name = 'medicaments'; END",
+        "CREATE TRIGGER IF NOT EXISTS medicaments_delete_version AFTER DELETE ON medicaments BEGIN\
+            UPDATE table_versions SET version = version + 1 WHERE name = 'medicaments'; END",
+    ]),
+    (4, 'change feed', [
+        # Last change of every object, deletes included (tombstones). A new change of an
+        # object replaces the previous one with a greater sequence number, so reading the
+        # changes after a sequence number costs the number of changed objects.
+        'CREATE TABLE IF NOT EXISTS changes(seq INTEGER PRIMARY KEY AUTOINCREMENT, entity TEXT NOT NULL,\
+            item_id INTEGER NOT NULL, deleted INTEGER NOT NULL DEFAULT 0, UNIQUE(entity, item_id))',
+        # The existing objects are the first changes
+        "INSERT INTO changes(entity, item_id) SELECT 'nurses', nurse_id FROM nurses_profile ORDER BY nurse_id",
+        "INSERT INTO changes(entity, item_id) SELECT 'patients', patient_id FROM patients_profile ORDER BY patient_id",
+        "INSERT INTO changes(entity, item_id) SELECT 'medicaments', medicament_id FROM medicaments ORDER BY medicament_id",
+        # Also fired by ON DELETE CASCADE
+        "CREATE TRIGGER IF NOT EXISTS nurses_profile_insert_change AFTER INSERT ON nurses_profile BEGIN\
+            DELETE FROM changes WHERE entity = 'nurses' AND item_id = NEW.nurse_id;\
+            INSERT INTO changes(entity, item_id, deleted) VALUES('nurses', NEW.nurse_id, 0); END",
+        "CREATE TRIGGER IF NOT EXISTS nurses_profile_update_change AFTER UPDATE ON nurses_profile BEGIN\
+            DELETE FROM changes WHERE entity = 'nurses' AND item_id = NEW.nurse_id;\
+            INSERT INTO changes(entity, item_id, deleted) VALUES('nurses', NEW.nurse_id, 0); END",
+        "CREATE TRIGGER IF NOT EXISTS nurses_profile_delete_change AFTER DELETE ON nurses_profile BEGIN\
+            DELETE FROM changes WHERE entity = 'nurses' AND item_id = OLD.nurse_id;\
+            INSERT INTO changes(entity, item_id, deleted) VALUES('nurses', OLD.nurse_id, 1); END",
+        "CREATE TRIGGER IF NOT EXISTS patients_profile_insert_change AFTER INSERT ON patients_profile BEGIN\
+            DELETE FROM changes WHERE entity = 'patients' AND item_id = NEW.patient_id;\
+            INSERT INTO changes(entity, item_id, deleted) VALUES('patients', NEW.patient_id, 0); END",
+        "CREATE TRIGGER IF NOT EXISTS patients_profile_update_change AFTER UPDATE ON patients_profile BEGIN\
+            DELETE FROM changes WHERE entity = 'patients' AND item_id = NEW.patient_id;\
+            INSERT INTO changes(entity, item_id, deleted) VALUES('patients', NEW.patient_id, 0); END",
+        "CREATE TRIGGER IF NOT EXISTS patients_profile_delete_change AFTER DELETE ON patients_profile BEGIN\
+            DELETE FROM changes WHERE entity = 'patients' AND item_id = OLD.patient_id;\
+            INSERT INTO changes(entity, item_id, deleted) VALUES('patients', OLD.patient_id, 1); END",
+        "CREATE TRIGGER IF NOT EXISTS medicaments_insert_change AFTER INSERT ON medicaments BEGIN\
+            DELETE FROM changes WHERE entity = 'medicaments' AND item_id = NEW.medicament_id;\
+            INSERT INTO changes(entity, item_id, deleted) VALUES('medicaments', NEW.medicament_id, 0); END",
+        "CREATE TRIGGER IF NOT EXISTS medicaments_update_change AFTER UPDATE ON medicaments BEGIN\
+            DELETE FROM changes WHERE entity = 'medicaments' AND item_id = NEW.medicament_id;\
+            INSERT INTO changes(entity, item_id, deleted) VALUES('medicaments', NEW.medicament_id, 0); END",
+        "CREATE TRIGGER IF NOT EXISTS medicaments_delete_change AFTER DELETE ON medicaments BEGIN\
+            DELETE FROM changes WHERE entity = 'medicaments' AND item_id = OLD.medicament_id;\
+            INSERT INTO changes(entity, item_id, deleted) VALUES('medicaments', OLD.medicament_id, 1); END",
+    ]),
+    (5, 'medication schedules', [
+        # Interval and duration parsed from the hours and duration of every
+        # medicament, time of its first dose and time until which its doses
+        # are written (NULL when all of them are), see schedule.py
+        'CREATE TABLE IF NOT EXISTS medication_schedules(\
+            medicament_id INTEGER PRIMARY KEY, interval_seconds INTEGER, duration_seconds INTEGER,\
+            start_time INTEGER NOT NULL, horizon INTEGER,\
+            FOREIGN KEY(medicament_id) REFERENCES medicaments(medicament_id) ON DELETE CASCADE)',
+        # Used by get_due_doses to extend the schedules
+        'CREATE INDEX IF NOT EXISTS medication_schedules_horizon_idx ON medication_schedules(horizon)',
+        # Upcoming administration times, with the nurse of the patient copied
+        # so that the doses due for a nurse are one range of an index
+        'CREATE TABLE IF NOT EXISTS doses(\
+            medicament_id INTEGER NOT NULL, due_time INTEGER NOT NULL, nurse_id INTEGER,\
+            PRIMARY KEY(medicament_id, due_time),\
+            FOREIGN KEY(medicament_id) REFERENCES medicaments(medicament_id) ON DELETE CASCADE)',
+        # Used by get_due_doses for a nurse and for the whole hospital
+        'CREATE INDEX IF NOT EXISTS doses_nurse_due_idx ON doses(nurse_id, due_time, medicament_id)',
+        'CREATE INDEX IF NOT EXISTS doses_due_idx ON doses(due_time, medicament_id, nurse_id)',
+        # Keep the copied nurse when a patient changes nurse or a medicament patient
+        "CREATE TRIGGER IF NOT EXISTS patients_profile_nurse_doses AFTER UPDATE OF p_nurse ON patients_profile\
+            BEGIN UPDATE doses SET nurse_id = NEW.p_nurse WHERE medicament_id IN\
+            (SELECT medicament_id FROM medicaments WHERE m_patient = NEW.patient_id); END",
+        "CREATE TRIGGER IF NOT EXISTS medicaments_patient_doses AFTER UPDATE OF m_patient ON medicaments\
+            BEGIN UPDATE doses SET nurse_id = (SELECT p_nurse FROM patients_profile\
+            WHERE patient_id = NEW.m_patient) WHERE medicament_id = NEW.medicament_id; END",
+    ]),
+]
+
+
+def latest_version(migrations=MIGRATIONS):
+    '''
+    Returns the version reached after applying all the migrations.
+    '''
+    return max(version for version, description, statements in migrations) if migrations else 0
+
+
+def current_version(con):
+    '''
+    Returns the schema version stored in the database.
+    '''
+    return con.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(con, target=None, migrations=MIGRATIONS):
+    '''
+    Apply to the connection con the pending migrations up to target (the
+    latest version by default).
+    Returns the list of versions that have been applied.
+    '''
+    if target is None:
+        target = latest_version(migrations)
+    applied = []
+    # Manage the transactions explicitly: the sqlite3 module would commit
+    # before every CREATE statement otherwise.
+    isolation_level = con.isolation_level
+    con.isolation_level = None
+    try:
+        for version, description, statements in sorted(migrations):
+            if version > target:
+                break
+            if version <= current_version(con):
+                continue
+            # Take the write lock before checking the version again, another
+            # process may have applied the migration in the meantime
+            con.execute('BEGIN IMMEDIATE')
+            try:
+                if version <= current_version(con):
+                    con.execute('COMMIT')
+                    continue
+                for statement in statements:
+                    con.execute(statement)
+                con.execute('PRAGMA user_version = %d' % version)
+                con.execute('COMMIT')
+            except Exception:
+                con.execute('ROLLBACK')
+                raise
+            applied.append(version)
+    finally:
+        con.isolation_level = isolation_level
+    return applied
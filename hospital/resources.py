@@ -1,27 +1,402 @@
-from flask import Flask, request, Response, make_response, json, g
+import base64
+import hashlib
+import logging
+import time
+
+from flask import Flask, request, Response, make_response, json, g, stream_with_context
 from flask.ext.restful import Resource, Api, reqparse, abort
-from werkzeug.exceptions import NotFound, UnsupportedMediaType
+from werkzeug.exceptions import BadRequest, NotFound, UnsupportedMediaType
 
+import cache
+import compression
 import database
-from utils import RegexConverter
+import encoders
+import ids
+import importer
+import log
+from utils import RegexConverter, ID_CONVERTERS, LinkBuilder
+
+logger = logging.getLogger(__name__)
 
 # Define the application and the api
 app = Flask(__name__, static_url_path = "", static_folder = "images")
 api = Api(app)
 
 DEFAULT_DB_PATH = 'db/hospital.db'
+# Storage profile of the database (see database.STORAGE_PROFILES)
+DEFAULT_STORAGE_PROFILE = 'production'
+# Fields shown by default in the items of the collections
+NURSES_LIST_FIELDS = ['name', 'surname']
+NURSES_PATIENT_LIST_FIELDS = ['name', 'surname', 'room', 'doctor id']
+PATIENT_MEDICATION_LIST_FIELDS = ['name']
+# Entries per entity and seconds they are kept in the cache of the database
+DEFAULT_CACHE_SIZE = 1000
+DEFAULT_CACHE_TTL = 60.0
+# Maximum value of ?limit= in the collections
+MAX_PAGE_LIMIT = 1000
+# Maximum length of the paths of ?expand= and number of objects embedded in
+# a list of related objects
+MAX_EXPAND_DEPTH = 2
+MAX_EXPAND_FANOUT = 50
+# Approximate size in characters of the chunks of a streamed collection
+STREAM_CHUNK_SIZE = 8192
+# Default and maximum seconds of ?within= in the due doses
+DEFAULT_DOSES_WINDOW = 3600
+MAX_DOSES_WINDOW = 7 * 24 * 3600
 
 # Define the application and the api
 app = Flask(__name__)
-app.debug = True
+# Debug (reloader, debugger and tracebacks) is only for development
+app.config.update({'DEBUG': False})
 # Set the database
-app.config.update({'DATABASE': database.HospitalDatabase(DEFAULT_DB_PATH)})
+app.config.update({'STORAGE_PROFILE': DEFAULT_STORAGE_PROFILE})
+app.config.update({'CACHE_SIZE': DEFAULT_CACHE_SIZE, 'CACHE_TTL': DEFAULT_CACHE_TTL})
+# Logging (see log.configure): level of the package, levels of its modules
+# and sampling rate of the records below WARNING
+app.config.update({'LOG_LEVEL': log.DEFAULT_LEVEL, 'LOG_LEVELS': {}, 'LOG_SAMPLE': None})
+# Compression of the responses of at least COMPRESS_MIN_SIZE bytes (see compression),
+# applied by the server in hospital.py
+app.config.update({'COMPRESS_MIN_SIZE': compression.DEFAULT_MIN_SIZE, 'COMPRESS_LEVEL': compression.DEFAULT_LEVEL})
+# Optional Python file overriding the values above, e.g. DEBUG = True
+app.config.from_envvar('HOSPITAL_SETTINGS', silent=True)
+log.configure(app.config['LOG_LEVEL'], app.config['LOG_LEVELS'], app.config['LOG_SAMPLE'])
+app.config.update({'DATABASE': cache.CachedHospitalDatabase(
+    database.HospitalDatabase(DEFAULT_DB_PATH, profile=app.config['STORAGE_PROFILE']),
+    size=app.config['CACHE_SIZE'], ttl=app.config['CACHE_TTL'])})
 api = Api(app)
+# Urls of the resources, compiled once the resources have been added
+links = LinkBuilder(app)
+
+# Upgrade the schema of an existing database before serving anything
+@app.before_first_request
+def migrate_database():
+    app.config['DATABASE'].migrate()
+
 
 # Associates an instance of the database before each request
 @app.before_request
 def set_database():
     g.db = app.config['DATABASE']
+    g.started = time.time()
+
+
+# One INFO record per request
+@app.after_request
+def log_request(response):
+    if logger.isEnabledFor(logging.INFO):
+        elapsed = time.time() - g.started if 'started' in g else None
+        logger.info('%s %s %s', request.method, request.full_path, response.status_code,
+                    extra={'method': request.method, 'path': request.path, 'status': response.status_code,
+                           'milliseconds': round(elapsed * 1000, 3) if elapsed is not None else None})
+    return response
+
+
+# Pagination of the collections: ?limit=<n>&cursor=<opaque>
+def encode_cursor(itemid):
+    '''
+    Returns the opaque cursor of the page that follows the item itemid.
+    '''
+    return base64.urlsafe_b64encode(itemid).rstrip('=')
+
+
+def get_page_arguments():
+    '''
+    Returns the limit and the id of the item after which the page starts,
+    read from the query string. Aborts with 400 if they are wrong.
+    '''
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    after = None
+    try:
+        if limit is not None:
+            limit = int(limit)
+            if not 0 < limit <= MAX_PAGE_LIMIT:
+                raise ValueError()
+        if cursor is not None:
+            after = base64.urlsafe_b64decode(str(cursor) + '=' * (-len(cursor) % 4))
+    except (ValueError, TypeError):
+        abort(400)
+    return limit, after
+
+
+def read_page(read, limit, after):
+    '''
+    Calls read(limit, after) asking for one more item than limit to know if
+    there is a next page. Returns the items and the cursor of the next page
+    (None if this is the last one). Aborts with 400 if the cursor is wrong.
+    '''
+    try:
+        items = read(limit + 1 if limit is not None else None, after)
+    except ValueError:
+        abort(400)
+    if limit is None or len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, encode_cursor(items[-1]["id"])
+
+
+# Sparse fieldsets: ?fields=name,surname
+def get_fields_argument(known_fields):
+    '''
+    Returns the list of fields asked with ?fields= or None if all of them
+    are wanted. Underscores can be used instead of spaces (phone_number).
+    Aborts with 400 if a field is not in known_fields.
+    '''
+    value = request.args.get('fields')
+    if value is None:
+        return None
+    fields = []
+    for field in value.split(','):
+        field = field.strip().replace('_', ' ')
+        if field and field not in fields:
+            fields.append(field)
+    try:
+        if not fields:
+            raise ValueError("No fields")
+        database.check_fields(known_fields, fields)
+    except ValueError:
+        abort(400)
+    return fields
+
+
+def with_id(fields):
+    '''
+    Returns fields plus the id, needed to build the links and the cursors.
+    '''
+    return fields if 'id' in fields else ['id'] + fields
+
+
+# Conditional GET: ETag and If-None-Match
+def make_etag(version):
+    '''
+    Returns the strong ETag (without quotes) of the representation of the
+    requested resource when its data has the given version. The path, the
+    query string (fields, page...) and the media type select the
+    representation, so they are part of the tag.
+    '''
+    return hashlib.sha1('%s %s %s' % (version, response_mediatype(),
+                                      request.full_path.encode('utf-8'))).hexdigest()
+
+
+def not_modified(etag):
+    '''
+    Returns a 304 response if the If-None-Match header of the request
+    contains etag, None otherwise.
+    '''
+    # Weak comparison: the compressed copies have a weak ETag (see compression)
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.headers.extend(etag_headers(etag))
+    return response
+
+
+def etag_headers(etag):
+    '''
+    Returns the headers that send etag. no-cache makes the browsers
+    revalidate their copy (If-None-Match) before using it.
+    '''
+    return {'ETag': '"%s"' % etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept'}
+
+
+# Content negotiation: Accept selects the representation of the responses and
+# Content-Type the format of the bodies of POST and PUT. JSON, the default
+# representation of flask-restful, is used when no other one is accepted.
+BINARY_MEDIA_TYPES = [('application/msgpack', encoders.msgpack_dumps, encoders.msgpack_loads),
+                      ('application/x-msgpack', encoders.msgpack_dumps, encoders.msgpack_loads),
+                      ('application/cbor', encoders.cbor_dumps, encoders.cbor_loads)]
+BODY_DECODERS = dict((mediatype, decode) for mediatype, encode, decode in BINARY_MEDIA_TYPES)
+
+
+def binary_representation(encode):
+    '''
+    Returns a flask-restful representation that encodes the data with encode.
+    '''
+    def output(data, code, headers=None):
+        response = make_response(encode(data), code)
+        response.headers.extend(headers or {})
+        return response
+    return output
+
+for mediatype, encode, decode in BINARY_MEDIA_TYPES:
+    api.representation(mediatype)(binary_representation(encode))
+
+
+def response_mediatype():
+    '''
+    Returns the media type of the representation negotiated with the Accept
+    header of the request, the one api.make_response uses.
+    '''
+    return request.accept_mimetypes.best_match(api.representations, default=api.default_mediatype)
+
+
+def get_body():
+    '''
+    Returns the body of the request decoded according to its Content-Type
+    (JSON or one of BINARY_MEDIA_TYPES), None for other types.
+    Aborts with 400 if the body is not valid.
+    '''
+    decode = BODY_DECODERS.get(request.mimetype)
+    if decode is None:
+        return request.get_json()
+    try:
+        return decode(request.get_data())
+    except ValueError:
+        raise BadRequest("The body is not valid %s" % request.mimetype)
+
+
+# Embedding of related resources: ?expand=patients.medication,doctor
+# (entity, relation) -> (related entity, field, many). A relation with many
+# embeds the list of the related objects whose field is the id of the object,
+# the others embed the related object whose id is the field of the object.
+EXPANSIONS = {
+    ('nurses', 'patients'): ('patients', 'nurse id', True),
+    ('patients', 'medication'): ('medicaments', 'patient id', True),
+    ('patients', 'nurse'): ('nurses', 'nurse id', False),
+    ('patients', 'doctor'): ('doctors', 'doctor id', False),
+    ('medicaments', 'patient'): ('patients', 'patient id', False),
+}
+
+
+def get_expand_argument(entity):
+    '''
+    Returns the tree of relations of entity asked with ?expand= ({} if none),
+    e.g. {'patients': {'medication': {}}} for ?expand=patients.medication.
+    Aborts with 400 if a relation is unknown or a path is longer than
+    MAX_EXPAND_DEPTH.
+    '''
+    value = request.args.get('expand')
+    tree = {}
+    if value is None:
+        return tree
+    for path in value.split(','):
+        relations = [relation.strip() for relation in path.split('.')]
+        if len(relations) > MAX_EXPAND_DEPTH:
+            abort(400)
+        node, current = tree, entity
+        for relation in relations:
+            if (current, relation) not in EXPANSIONS:
+                abort(400)
+            current = EXPANSIONS[(current, relation)][0]
+            node = node.setdefault(relation, {})
+    return tree
+
+
+def expand_fields(entity, tree, fields):
+    '''
+    Returns fields plus the fields needed to embed the relations of tree.
+    '''
+    if fields is None or not tree:
+        return fields
+    fields = with_id(fields)
+    for relation in tree:
+        related, field, many = EXPANSIONS[(entity, relation)]
+        if not many and field not in fields:
+            fields = fields + [field]
+    return fields
+
+
+def expand_version(version, entity, tree):
+    '''
+    Returns the version of a representation of entity with version and the
+    relations of tree embedded: it also changes with the tables of the
+    embedded objects. The doctors are not written by the API.
+    '''
+    if not tree:
+        return version
+    versions = [version]
+    pending = [(entity, tree)]
+    related = set()
+    while pending:
+        current, node = pending.pop()
+        for relation, subtree in node.iteritems():
+            related.add(EXPANSIONS[(current, relation)][0])
+            pending.append((EXPANSIONS[(current, relation)][0], subtree))
+    for name in sorted(related - set(['doctors'])):
+        versions.append(getattr(g.db, 'get_%s_version' % name)())
+    return ' '.join(map(str, versions))
+
+
+def expand_items(entity, records, items, tree):
+    '''
+    Embeds the relations of tree in items, the dictionaries built from the
+    records of entity (same order). Every relation is read with one query for
+    all the records, level by level, instead of one query per record. At
+    most MAX_EXPAND_FANOUT objects are embedded in a list; if there are more,
+    '<relation> truncated' is true.
+    '''
+    for relation, subtree in tree.iteritems():
+        related, field, many = EXPANSIONS[(entity, relation)]
+        if many:
+            found = g.db.get_related_items(related, field, [record.raw('id') for record in records],
+                                           limit=MAX_EXPAND_FANOUT + 1)
+        else:
+            found = g.db.get_related_items(related, 'id', [record.raw(field) for record in records])
+        found_items = [record.as_dict() for record in found]
+        expand_items(related, found, found_items, subtree)
+        if many:
+            groups = {}
+            for record, item in zip(found, found_items):
+                groups.setdefault(record.raw(field), []).append(item)
+            for record, item in zip(records, items):
+                group = groups.get(record.raw('id'), [])
+                item[relation] = group[:MAX_EXPAND_FANOUT]
+                if len(group) > MAX_EXPAND_FANOUT:
+                    item[relation + ' truncated'] = True
+        else:
+            found_by_id = dict((record.raw('id'), item) for record, item in zip(found, found_items))
+            for record, item in zip(records, items):
+                item[relation] = found_by_id.get(record.raw(field))
+
+
+# Streaming of the collections: ?stream=true
+def is_stream_request():
+    '''
+    Returns True if the client asked for the whole collection as a streamed
+    response. Aborts with 400 if it is combined with pagination or with
+    ?expand=, which reads the related objects of a whole page at once, and
+    with 406 if the negotiated representation is not JSON, the only one
+    that is streamed.
+    '''
+    if request.args.get('stream', '').lower() not in ('1', 'true'):
+        return False
+    if 'limit' in request.args or 'cursor' in request.args or 'expand' in request.args:
+        abort(400)
+    if response_mediatype() != 'application/json':
+        abort(406)
+    return True
+
+
+def stream_collection(envelope, key, rows, build_item):
+    '''
+    Returns a chunked JSON response with the envelope plus a list called key
+    with build_item(row) for every row. The items are serialized as the rows
+    are read, so the memory used does not depend on their number.
+    The streamed responses are always JSON, is_stream_request rejects the
+    requests that negotiated another representation.
+    '''
+    def generate():
+        # Open the list at the end of the envelope
+        head = json.dumps(envelope)
+        yield (head[:-1] + ', ' if envelope else '{') + json.dumps(key) + ': ['
+        # Group the items in chunks of about STREAM_CHUNK_SIZE characters
+        separator = ''
+        chunk = []
+        size = 0
+        for row in rows:
+            item = json.dumps(build_item(row))
+            chunk.append(item)
+            size += len(item)
+            if size >= STREAM_CHUNK_SIZE:
+                yield separator + ', '.join(chunk)
+                separator = ', '
+                chunk = []
+                size = 0
+        if chunk:
+            yield separator + ', '.join(chunk)
+        yield ']}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 
 # Define the resources
@@ -29,32 +404,61 @@ class Nurses_list(Resource):
     # GET
     def get(self):
 
-        nurses_list_db = g.db.get_nurses_list()
+        # The version is read before the data: the ETag may be older than
+        # the body, never newer
+        expand = get_expand_argument('nurses')
+        etag = make_etag(expand_version(g.db.get_nurses_version(), 'nurses', expand))
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        # Only the shown fields are read from the database
+        fields = get_fields_argument(database.NURSE_FIELDS) or NURSES_LIST_FIELDS
+        build_item = lambda nurse: self._nurse_item(nurse, fields)
+
+        # Export the whole collection as it is read from the database
+        if is_stream_request():
+            response = stream_collection({}, 'nurses_list', g.db.iter_nurses_list(with_id(fields)), build_item)
+            response.headers.extend(etag_headers(etag))
+            return response
+
+        limit, after = get_page_arguments()
+        read = lambda limit, after: g.db.get_nurses_list(limit, after, expand_fields('nurses', expand, with_id(fields)))
+        nurses_list_db, cursor = read_page(read, limit, after)
 
         nurses_list = []
         for nurse in nurses_list_db:
-            _nurseid = nurse["id"]
-            _nursename = nurse["name"]
-            _nursesurname = nurse["surname"]
-            _nurseurl = api.url_for(Nurses_profile, nurseid=_nurseid)
-            print _nurseurl
-            nurse = {}
-            nurse['name'] = _nursename
-            nurse['surname'] = _nursesurname
-            nurse['link'] = {'rel': 'self', 'href': _nurseurl, 'rel': 'self'}
-            nurses_list.append(nurse)
+            nurses_list.append(build_item(nurse))
+        expand_items('nurses', nurses_list_db, nurses_list, expand)
         # Create the envelope
         envelope = {}
         envelope['nurses_list'] = nurses_list
+        if cursor is not None:
+            envelope['next'] = {'title': 'next page', 'rel': 'next',
+                                'href': links.url_for(Nurses_list, limit=limit, cursor=cursor,
+                                                      fields=request.args.get('fields'),
+                                                      expand=request.args.get('expand'))}
 
-        return envelope
+        return envelope, 200, etag_headers(etag)
+
+    def _nurse_item(self, nurse, fields):
+        _nurseurl = links.url_for(Nurses_profile, nurseid=nurse["id"])
+        logger.debug('nurse link %s', _nurseurl)
+        item = {}
+        for field in fields:
+            item[field] = nurse[field]
+        item['link'] = {'rel': 'self', 'href': _nurseurl, 'rel': 'self'}
+        return item
 
     # POST
     def post(self):
 
-        nurse = request.get_json()
+        nurse = get_body()
         if not nurse:
             raise UnsupportedMediaType()
+        # A JSON array creates all the nurses in one transaction
+        if isinstance(nurse, list):
+            return self._post_list(nurse)
         nursename, nursesurname, nursepn, nurseaddress = None, None, None, None
         try:
             nursename = nurse['name']
@@ -66,10 +470,30 @@ class Nurses_list(Resource):
         newnurseid = g.db.append_nurse(nursename, nursesurname, nursepn, nurseaddress)
         if not newnurseid:
             abort(500)
-        url = api.url_for(Nurses_profile, nurseid=newnurseid)
+        url = links.url_for(Nurses_profile, nurseid=newnurseid)
 
         return None, 201, {'Location': url}
 
+    def _post_list(self, nurses):
+        rows = []
+        try:
+            for nurse in nurses:
+                rows.append((nurse['name'], nurse['surname'], nurse['phone_number'], nurse['address']))
+        except Exception:
+            abort(400)
+        newnurseids = g.db.append_nurses(rows)
+        if len(newnurseids) != len(rows):
+            abort(500)
+        # Create the envelope with the links to the new nurses
+        nurses_list = []
+        for newnurseid in newnurseids:
+            url = links.url_for(Nurses_profile, nurseid=newnurseid)
+            nurses_list.append({'link': {'rel': 'self', 'href': url}})
+        envelope = {}
+        envelope['nurses_list'] = nurses_list
+
+        return envelope, 201
+
 
 class Nurses_profile(Resource):
     # GET
@@ -83,17 +507,31 @@ class Nurses_profile(Resource):
         if not self._isauthorized(nurseid, authorization):
             return {'message': "No permission to access the data."},401
         '''
-        nurse = g.db.get_nurse(nurseid)
-        if not nurse:
+        # A cheap probe of the version answers the revalidations
+        version = g.db.get_nurse_version(nurseid)
+        if version is None:
+            abort(404)
+        expand = get_expand_argument('nurses')
+        etag = make_etag(expand_version(version, 'nurses', expand))
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        fields = get_fields_argument(database.NURSE_FIELDS)
+        record = g.db.get_nurse(nurseid, expand_fields('nurses', expand, fields), version)
+        if not record:
             abort(404)
+        # The database returns a read only Record
+        nurse = record.project(database.get_layout(database.NURSE_FIELDS, fields)).as_dict()
+        expand_items('nurses', [record], [nurse], expand)
         nurse['link'] = {'title': 'patient list', 'rel': 'related',
-                         'href': api.url_for(Nurses_patient_list, nurseid=nurseid)}
+                         'href': links.url_for(Nurses_patient_list, nurseid=nurseid)}
 
         envelope = {}
-        envelope['link'] = {'title': 'nurses list', 'rel': 'related', 'href': api.url_for(Nurses_list)}
+        envelope['link'] = {'title': 'nurses list', 'rel': 'related', 'href': links.url_for(Nurses_list)}
         envelope['nurse'] = nurse
 
-        return envelope
+        return envelope, 200, etag_headers(etag)
 
     # PUT
     def put(self, nurseid):
@@ -107,21 +545,26 @@ class Nurses_profile(Resource):
         if not self._isauthorized(nurseid, authorization):
             return {'message': "No permission to access the data."},401
         '''
-        if not g.db.contains_nurse(nurseid):
-            abort(404)
-
-        nurse = request.get_json()
-        if not nurse:
-            raise UnsupportedMediaType()
-
+        nurse = get_body()
         try:
             nursename = nurse['name']
             nursesurname = nurse['surname']
             nursepn = nurse['phone_number']
             nurseaddress = nurse['address']
-            g.db.modify_nurse(nurseid, nursename, nursesurname, nursepn, nurseaddress)
         except Exception:
+            # An unexisting nurse is reported before a wrong request
+            if not g.db.contains_nurse(nurseid):
+                abort(404)
+            if not nurse:
+                raise UnsupportedMediaType()
             abort(400)
+        # The update reports itself if the nurse does not exist
+        try:
+            modified = g.db.modify_nurse(nurseid, nursename, nursesurname, nursepn, nurseaddress)
+        except Exception:
+            abort(400)
+        if modified is None:
+            abort(404)
 
         return None, 204, {"name": nursename, "surname": nursesurname, "phone number": nursepn, "address": nurseaddress}
 
@@ -147,7 +590,7 @@ class Nurses_profile(Resource):
             abort(404)
 
     def _isauthorized(self, nurseid, authorization):
-        if authorization is not None and (authorization.lower() == "admin" or authorization.lower() == nurseid.lower()):
+        if authorization is not None and (authorization.lower() == "admin" or authorization.lower() == ids.NURSE_IDS.normalize(nurseid)):
             return True
         return False
 
@@ -164,34 +607,58 @@ class Nurses_patient_list(Resource):
         if not self._isauthorized(nurseid, authorization):
             return {'message': "No permission to access the data."},401
         '''
-        nurses_patient_list_db = g.db.get_nurses_patient_list(nurseid)
+        expand = get_expand_argument('patients')
+        etag = make_etag(expand_version(g.db.get_patients_version(), 'patients', expand))
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        # Only the shown fields are read from the database
+        fields = get_fields_argument(database.PATIENT_FIELDS) or NURSES_PATIENT_LIST_FIELDS
+        build_item = lambda patient: self._patient_item(nurseid, patient, fields)
+
+        # Export the whole collection as it is read from the database
+        if is_stream_request():
+            envelope = {'link': {'title': 'nurse', 'rel': 'related',
+                                 'href': links.url_for(Nurses_profile, nurseid=nurseid)}}
+            rows = g.db.iter_nurses_patient_list(nurseid, with_id(fields))
+            response = stream_collection(envelope, 'nurses_patient_list', rows, build_item)
+            response.headers.extend(etag_headers(etag))
+            return response
+
+        limit, after = get_page_arguments()
+        read = lambda limit, after: g.db.get_nurses_patient_list(nurseid, limit, after,
+                                                                 expand_fields('patients', expand, with_id(fields)))
+        nurses_patient_list_db, cursor = read_page(read, limit, after)
 
         nurses_patient_list = []
         for patient in nurses_patient_list_db:
-            _patientid = patient["id"]
-            _patientname = patient["name"]
-            _patientsurname = patient["surname"]
-            _patientroom = patient["room"]
-            _patientdoctor = patient["doctor id"]
-            args = {'patientid': _patientid, 'nurseid': nurseid}
-            _patienturl = api.url_for(Nurses_patient_profile, **args)
-            print _patienturl
-            patient = {}
-            patient['name'] = _patientname
-            patient['surname'] = _patientsurname
-            patient['room'] = _patientroom
-            patient['doctor id'] = _patientdoctor
-            patient['link'] = {'rel': 'related', 'href': _patienturl, 'rel': 'related'}
-            nurses_patient_list.append(patient)
+            nurses_patient_list.append(build_item(patient))
+        expand_items('patients', nurses_patient_list_db, nurses_patient_list, expand)
         # Create the envelope
         envelope = {}
-        envelope['link'] = {'title': 'nurse', 'rel': 'related', 'href': api.url_for(Nurses_profile, nurseid=nurseid)}
+        envelope['link'] = {'title': 'nurse', 'rel': 'related', 'href': links.url_for(Nurses_profile, nurseid=nurseid)}
         envelope['nurses_patient_list'] = nurses_patient_list
+        if cursor is not None:
+            envelope['next'] = {'title': 'next page', 'rel': 'next',
+                                'href': links.url_for(Nurses_patient_list, nurseid=nurseid, limit=limit, cursor=cursor,
+                                                      fields=request.args.get('fields'),
+                                                      expand=request.args.get('expand'))}
 
-        return envelope
+        return envelope, 200, etag_headers(etag)
+
+    def _patient_item(self, nurseid, patient, fields):
+        args = {'patientid': patient["id"], 'nurseid': nurseid}
+        _patienturl = links.url_for(Nurses_patient_profile, **args)
+        logger.debug('patient link %s', _patienturl)
+        item = {}
+        for field in fields:
+            item[field] = patient[field]
+        item['link'] = {'rel': 'related', 'href': _patienturl, 'rel': 'related'}
+        return item
 
     def _isauthorized(self, nurseid, authorization):
-        if authorization is not None and (authorization.lower() == "admin" or authorization.lower() == nurseid.lower()):
+        if authorization is not None and (authorization.lower() == "admin" or authorization.lower() == ids.NURSE_IDS.normalize(nurseid)):
             return True
         return False
 
@@ -208,18 +675,32 @@ class Nurses_patient_profile(Resource):
         if not self._isauthorized(nurseid, authorization):
             return {'message': "No permission to access the data."},401
         '''
-        patient = g.db.get_patient(patientid)
-        if not patient:
+        # A cheap probe of the version answers the revalidations
+        version = g.db.get_patient_version(patientid)
+        if version is None:
+            abort(404)
+        expand = get_expand_argument('patients')
+        etag = make_etag(expand_version(version, 'patients', expand))
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        fields = get_fields_argument(database.PATIENT_FIELDS)
+        record = g.db.get_patient(patientid, expand_fields('patients', expand, fields), version)
+        if not record:
             abort(404)
+        # The database returns a read only Record
+        patient = record.project(database.get_layout(database.PATIENT_FIELDS, fields)).as_dict()
+        expand_items('patients', [record], [patient], expand)
         patient['link'] = {'title': 'patient medication', 'rel': 'related',
-                           'href': api.url_for(Patient_medication_list, nurseid=nurseid, patientid=patientid)}
+                           'href': links.url_for(Patient_medication_list, nurseid=nurseid, patientid=patientid)}
 
         envelope = {}
         envelope['link'] = {'title': 'patient list', 'rel': 'related',
-                            'href': api.url_for(Nurses_patient_list, nurseid=nurseid)}
+                            'href': links.url_for(Nurses_patient_list, nurseid=nurseid)}
         envelope['patient'] = patient
 
-        return envelope
+        return envelope, 200, etag_headers(etag)
 
     # PUT
     def put(self, nurseid, patientid):
@@ -232,22 +713,28 @@ class Nurses_patient_profile(Resource):
         if not self._isauthorized(nurseid, authorization):
             return {'message': "No permission to access the data."},401
         '''
-        if not g.db.contains_patient(patientid):
-            abort(404)
-
-        patient = request.get_json()
-        if not patient:
-            raise UnsupportedMediaType()
-
+        patient = get_body()
         try:
             patientname = patient['name']
             patientsurname = patient['surname']
             patientroom = patient['room']
             patientpn = patient['phone_number']
             patientaddress = patient['address']
-            g.db.modify_patient(patientid, patientname, patientsurname, patientroom, patientpn, patientaddress)
+        except Exception:
+            # An unexisting patient is reported before a wrong request
+            if not g.db.contains_patient(patientid):
+                abort(404)
+            if not patient:
+                raise UnsupportedMediaType()
+            abort(400)
+        # The update reports itself if the patient does not exist
+        try:
+            modified = g.db.modify_patient(patientid, patientname, patientsurname, patientroom, patientpn,
+                                           patientaddress)
         except Exception:
             abort(400)
+        if modified is None:
+            abort(404)
 
         return None, 204, {"name": patientname, "surname": patientsurname, "room": patientroom,
                            "phone number": patientpn, "address": patientaddress}
@@ -274,7 +761,7 @@ class Nurses_patient_profile(Resource):
             abort(404)
 
     def _isauthorized(self, nurseid, authorization):
-        if authorization is not None and (authorization.lower() == "admin" or authorization.lower() == nurseid.lower()):
+        if authorization is not None and (authorization.lower() == "admin" or authorization.lower() == ids.NURSE_IDS.normalize(nurseid)):
             return True
         return False
 
@@ -291,26 +778,56 @@ class Patient_medication_list(Resource):
         if not self._isauthorized(nurseid, authorization):
             return {'message': "No permission to access the data."},401
         '''
-        patient_medication_list_db = g.db.get_patient_medication_list(patientid)
+        expand = get_expand_argument('medicaments')
+        etag = make_etag(expand_version(g.db.get_medicaments_version(), 'medicaments', expand))
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        # Only the shown fields are read from the database
+        fields = get_fields_argument(database.MEDICAMENT_FIELDS) or PATIENT_MEDICATION_LIST_FIELDS
+        build_item = lambda medicament: self._medicament_item(nurseid, patientid, medicament, fields)
+
+        # Export the whole collection as it is read from the database
+        if is_stream_request():
+            envelope = {'link': {'title': 'patient', 'rel': 'related',
+                                 'href': links.url_for(Nurses_patient_profile, nurseid=nurseid, patientid=patientid)}}
+            rows = g.db.iter_patient_medication_list(patientid, with_id(fields))
+            response = stream_collection(envelope, 'patient_medication_list', rows, build_item)
+            response.headers.extend(etag_headers(etag))
+            return response
+
+        limit, after = get_page_arguments()
+        read = lambda limit, after: g.db.get_patient_medication_list(
+            patientid, limit, after, expand_fields('medicaments', expand, with_id(fields)))
+        patient_medication_list_db, cursor = read_page(read, limit, after)
 
         patient_medication_list = []
         for medicament in patient_medication_list_db:
-            _medicamentid = medicament["id"]
-            _medicamentname = medicament["name"]
-            args = {'nurseid': nurseid, 'patientid': patientid, 'medicamentid': _medicamentid}
-            _medicamenturl = api.url_for(Patient_medication, **args)
-            print _medicamenturl
-            medicament = {}
-            medicament['name'] = _medicamentname
-            medicament['link'] = {'rel': 'self', 'href': _medicamenturl, 'rel': 'self'}
-            patient_medication_list.append(medicament)
+            patient_medication_list.append(build_item(medicament))
+        expand_items('medicaments', patient_medication_list_db, patient_medication_list, expand)
         # Create the envelope
         envelope = {}
         envelope['link'] = {'title': 'patient', 'rel': 'related',
-                            'href': api.url_for(Nurses_patient_profile, nurseid=nurseid, patientid=patientid)}
+                            'href': links.url_for(Nurses_patient_profile, nurseid=nurseid, patientid=patientid)}
         envelope['patient_medication_list'] = patient_medication_list
+        if cursor is not None:
+            envelope['next'] = {'title': 'next page', 'rel': 'next',
+                                'href': links.url_for(Patient_medication_list, nurseid=nurseid, patientid=patientid,
+                                                      limit=limit, cursor=cursor, fields=request.args.get('fields'),
+                                                      expand=request.args.get('expand'))}
 
-        return envelope
+        return envelope, 200, etag_headers(etag)
+
+    def _medicament_item(self, nurseid, patientid, medicament, fields):
+        args = {'nurseid': nurseid, 'patientid': patientid, 'medicamentid': medicament["id"]}
+        _medicamenturl = links.url_for(Patient_medication, **args)
+        logger.debug('medicament link %s', _medicamenturl)
+        item = {}
+        for field in fields:
+            item[field] = medicament[field]
+        item['link'] = {'rel': 'self', 'href': _medicamenturl, 'rel': 'self'}
+        return item
 
     # POST
     def post(self, nurseid, patientid):
@@ -323,9 +840,12 @@ class Patient_medication_list(Resource):
         if not self._isauthorized(nurseid, authorization):
             return {'message': "No permission to access the data."},401
         '''
-        medicament = request.get_json()
+        medicament = get_body()
         if not medicament:
             raise UnsupportedMediaType()
+        # A JSON array creates all the medicaments in one transaction
+        if isinstance(medicament, list):
+            return self._post_list(nurseid, patientid, medicament)
         medicamentname, medicamentdosage, medicamentduration, medicamenthours, medicamentbag, medicamentadministration, medicationpatient = None, None, None, None, None, None, None
         try:
             medicamentname = medicament['name']
@@ -337,16 +857,48 @@ class Patient_medication_list(Resource):
             medicamentpatient = medicament['patientid']
         except Exception:
             abort(400)
-        newmedicamentid = g.db.append_medication(medicamentname, medicamentdosage, medicamentduration, medicamenthours,
-                                                 medicamentbag, medicamentadministration, medicamentpatient)
+        try:
+            newmedicamentid = g.db.append_medication(medicamentname, medicamentdosage, medicamentduration,
+                                                     medicamenthours, medicamentbag, medicamentadministration,
+                                                     medicamentpatient)
+        except ValueError:
+            # Malformed patientid
+            abort(400)
         if not newmedicamentid:
             abort(500)
-        url = api.url_for(Patient_medication, nurseid=nurseid, patientid=patientid, medicamentid=newmedicamentid)
+        url = links.url_for(Patient_medication, nurseid=nurseid, patientid=patientid, medicamentid=newmedicamentid)
 
         return None, 201, {'Location': url}
 
+    def _post_list(self, nurseid, patientid, medicaments):
+        rows = []
+        try:
+            for medicament in medicaments:
+                rows.append((medicament['name'], medicament['dosage'], medicament['duration'],
+                             medicament['hours'], medicament['bag_volume'], medicament['administration'],
+                             medicament['patientid']))
+        except Exception:
+            abort(400)
+        try:
+            newmedicamentids = g.db.append_medications(rows)
+        except ValueError:
+            # Malformed patientid
+            abort(400)
+        if len(newmedicamentids) != len(rows):
+            abort(500)
+        # Create the envelope with the links to the new medicaments
+        patient_medication_list = []
+        for newmedicamentid in newmedicamentids:
+            url = links.url_for(Patient_medication, nurseid=nurseid, patientid=patientid,
+                                medicamentid=newmedicamentid)
+            patient_medication_list.append({'link': {'rel': 'self', 'href': url}})
+        envelope = {}
+        envelope['patient_medication_list'] = patient_medication_list
+
+        return envelope, 201
+
     def _isauthorized(self, nurseid, authorization):
-        if authorization is not None and (authorization.lower() == "admin" or authorization.lower() == nurseid.lower()):
+        if authorization is not None and (authorization.lower() == "admin" or authorization.lower() == ids.NURSE_IDS.normalize(nurseid)):
             return True
         return False
 
@@ -363,16 +915,30 @@ class Patient_medication(Resource):
         if not self._isauthorized(nurseid, authorization):
             return {'message': "No permission to access the data."},401
         '''
-        medicament = g.db.get_medicament(medicamentid)
-        if not medicament:
+        # A cheap probe of the version answers the revalidations
+        version = g.db.get_medicament_version(medicamentid)
+        if version is None:
+            abort(404)
+        expand = get_expand_argument('medicaments')
+        etag = make_etag(expand_version(version, 'medicaments', expand))
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        fields = get_fields_argument(database.MEDICAMENT_FIELDS)
+        record = g.db.get_medicament(medicamentid, expand_fields('medicaments', expand, fields), version)
+        if not record:
             abort(404)
+        # The database returns a read only Record
+        medicament = record.project(database.get_layout(database.MEDICAMENT_FIELDS, fields)).as_dict()
+        expand_items('medicaments', [record], [medicament], expand)
 
         envelope = {}
         envelope['link'] = {'title': 'medication list', 'rel': 'related',
-                            'href': api.url_for(Patient_medication_list, nurseid=nurseid, patientid=patientid)}
+                            'href': links.url_for(Patient_medication_list, nurseid=nurseid, patientid=patientid)}
         envelope['medicament'] = medicament
 
-        return envelope
+        return envelope, 200, etag_headers(etag)
 
     # PUT
     def put(self, nurseid, patientid, medicamentid):
@@ -385,13 +951,7 @@ class Patient_medication(Resource):
         if not self._isauthorized(nurseid, authorization):
             return {'message': "No permission to access the data."},401
         '''
-        if not g.db.contains_medicament(medicamentid):
-            abort(404)
-
-        medicament = request.get_json()
-        if not medicament:
-            raise UnsupportedMediaType()
-
+        medicament = get_body()
         try:
             medicamentname = medicament['name']
             medicamentdosage = medicament['dosage']
@@ -399,10 +959,21 @@ class Patient_medication(Resource):
             medicamenthours = medicament['hours']
             medicamentbag = medicament['bag_volume']
             medicamentadministration = medicament['administration']
-            g.db.modify_medicament(medicamentid, medicamentname, medicamentdosage, medicamentduration, medicamenthours,
-                                   medicamentbag, medicamentadministration)
+        except Exception:
+            # An unexisting medicament is reported before a wrong request
+            if not g.db.contains_medicament(medicamentid):
+                abort(404)
+            if not medicament:
+                raise UnsupportedMediaType()
+            abort(400)
+        # The update reports itself if the medicament does not exist
+        try:
+            modified = g.db.modify_medicament(medicamentid, medicamentname, medicamentdosage, medicamentduration,
+                                              medicamenthours, medicamentbag, medicamentadministration)
         except Exception:
             abort(400)
+        if modified is None:
+            abort(404)
 
         return None, 204, {"name": medicamentname, "dosage": medicamentdosage, "duration": medicamentduration,
                            "hours": medicamenthours, "bag_volume": medicamentbag,
@@ -430,30 +1001,217 @@ class Patient_medication(Resource):
             abort(404)
 
     def _isauthorized(self, nurseid, authorization):
-        if authorization is not None and (authorization.lower() == "admin" or authorization.lower() == nurseid.lower()):
+        if authorization is not None and (authorization.lower() == "admin" or authorization.lower() == ids.NURSE_IDS.normalize(nurseid)):
             return True
         return False
 
 
+class Nurses_ward(Resource):
+    # GET
+    def get(self, nurseid):
+        '''
+        Returns the nurse, all their patients and the medication of every
+        patient, read from the database at once, so a ward screen needs one
+        request instead of one per patient and medication list.
+        '''
+        # The ward changes with any of the three tables
+        etag = make_etag('%s %s %s' % (g.db.get_nurses_version(), g.db.get_patients_version(),
+                                       g.db.get_medicaments_version()))
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        ward = g.db.get_nurse_ward(nurseid)
+        if ward is None:
+            abort(404)
+        nurse, patients = ward
+
+        patients_list = []
+        for patient, medication in patients:
+            args = {'nurseid': nurseid, 'patientid': patient['id']}
+            item = patient.as_dict()
+            item['link'] = {'rel': 'self', 'href': links.url_for(Nurses_patient_profile, **args)}
+            item['medication link'] = {'title': 'patient medication', 'rel': 'related',
+                                       'href': links.url_for(Patient_medication_list, **args)}
+            item['medication'] = []
+            for medicament in medication:
+                medicament_item = medicament.as_dict()
+                medicament_item['link'] = {'rel': 'self', 'href': links.url_for(Patient_medication,
+                                                                                medicamentid=medicament['id'], **args)}
+                item['medication'].append(medicament_item)
+            patients_list.append(item)
+        # Create the envelope
+        envelope = {}
+        envelope['nurse'] = nurse.as_dict()
+        envelope['nurse']['link'] = {'rel': 'self', 'href': links.url_for(Nurses_profile, nurseid=nurseid)}
+        envelope['patients'] = patients_list
+
+        return envelope, 200, etag_headers(etag)
+
+
+def due_doses_envelope(nurseid=None):
+    '''
+    Returns the envelope of the doses due from ?from= (seconds since the
+    epoch, now by default) during ?within= seconds of the patients of the
+    nurse number nurseid, or of all the patients if it is None. At most
+    ?limit= doses are returned, "truncated" tells if there were more.
+    The period cannot end more than schedule.MAX_AHEAD seconds from now.
+    '''
+    try:
+        start = int(request.args.get('from', int(time.time())))
+        within = int(request.args.get('within', DEFAULT_DOSES_WINDOW))
+        limit = int(request.args.get('limit', MAX_PAGE_LIMIT))
+        if start < 0 or not 0 < within <= MAX_DOSES_WINDOW or not 0 < limit <= MAX_PAGE_LIMIT:
+            raise ValueError()
+    except ValueError:
+        abort(400)
+    try:
+        # One more dose than limit tells if there are more
+        doses = g.db.get_due_doses(start, start + within, nurseid, limit + 1)
+    except ValueError:
+        abort(400)
+
+    doses_list = []
+    for dose in doses[:limit]:
+        item = dose.as_dict()
+        item['due'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(dose['due time']))
+        if dose['nurse id'] is not None:
+            item['link'] = {'title': 'medicament', 'rel': 'related',
+                            'href': links.url_for(Patient_medication, nurseid=dose['nurse id'],
+                                                  patientid=dose['patient id'], medicamentid=dose['medicament id'])}
+        doses_list.append(item)
+    # Create the envelope
+    envelope = {}
+    envelope['from'] = start
+    envelope['until'] = start + within
+    envelope['doses'] = doses_list
+    envelope['truncated'] = len(doses) > limit
+    return envelope
+
+
+class Nurses_doses(Resource):
+    # GET
+    def get(self, nurseid):
+        '''
+        Returns the doses of medication due in the ward of the nurse, the
+        patients they take care of, sorted by due time (see
+        due_doses_envelope for the arguments).
+        '''
+        if not g.db.contains_nurse(nurseid):
+            abort(404)
+        envelope = due_doses_envelope(nurseid)
+        envelope['nurse link'] = {'title': 'nurse', 'rel': 'related',
+                                  'href': links.url_for(Nurses_profile, nurseid=nurseid)}
+        return envelope
+
+
+class Hospital_doses(Resource):
+    # GET
+    def get(self):
+        '''
+        Returns the doses of medication due in all the wards, sorted by due
+        time (see due_doses_envelope for the arguments).
+        '''
+        return due_doses_envelope()
+
+
+class Hospital_changes(Resource):
+    # GET
+    def get(self):
+        '''
+        Returns the nurses, patients and medicaments changed after the change
+        sequence number ?since= (0 by default, everything), at most ?limit=
+        of them. A deleted object comes with "deleted": true and no item. The
+        client keeps "sequence" and asks for the changes since it the next
+        time; "next" links the rest of the changes if there are more.
+        '''
+        # The sequence number is read before the changes
+        etag = make_etag(g.db.get_change_sequence())
+        response = not_modified(etag)
+        if response is not None:
+            return response
+
+        try:
+            since = int(request.args.get('since', 0))
+            limit = int(request.args.get('limit', MAX_PAGE_LIMIT))
+            if since < 0 or not 0 < limit <= MAX_PAGE_LIMIT:
+                raise ValueError()
+        except ValueError:
+            abort(400)
+        # One more change than limit tells if there are more
+        changes = g.db.get_changes(since, limit + 1)
+
+        changes_list = []
+        for change in changes[:limit]:
+            item = {'sequence': change['sequence'], 'entity': change['entity'], 'id': change['id'],
+                    'deleted': change['deleted']}
+            if not change['deleted']:
+                item['item'] = change['item'].as_dict()
+            changes_list.append(item)
+        # Create the envelope
+        envelope = {}
+        envelope['changes'] = changes_list
+        envelope['sequence'] = changes_list[-1]['sequence'] if changes_list else since
+        if len(changes) > limit:
+            envelope['next'] = {'title': 'next changes', 'rel': 'next',
+                                'href': links.url_for(Hospital_changes, since=envelope['sequence'], limit=limit)}
+
+        return envelope, 200, etag_headers(etag)
+
+
+class Hospital_import(Resource):
+    # POST
+    def post(self, entity):
+        '''
+        Import the nurses, patients or medicaments sent in the body as NDJSON
+        (application/x-ndjson) or CSV (text/csv). The body is read as a
+        stream. Returns the import report.
+        '''
+        if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+            fmt = 'ndjson'
+        elif request.mimetype == 'text/csv':
+            fmt = 'csv'
+        else:
+            raise UnsupportedMediaType()
+        try:
+            batch_size = int(request.args.get('batch_size', importer.DEFAULT_BATCH_SIZE))
+            if batch_size < 1:
+                raise ValueError()
+        except ValueError:
+            abort(400)
+        report = importer.import_stream(g.db, entity, request.stream, fmt, batch_size)
+
+        return report.as_dict()
+
+
 app.url_map.converters['regex'] = RegexConverter
+# The ids in the urls are given to the resources as numbers
+app.url_map.converters.update(ID_CONVERTERS)
 
 # define the routes
 api.add_resource(Nurses_list, '/hospital/api/nurses/', endpoint='nurses')
-api.add_resource(Nurses_profile, '/hospital/api/nurses/<regex("nur-\d+"):nurseid>/', endpoint='nurse')
-api.add_resource(Nurses_patient_list, '/hospital/api/nurses/<regex("nur-\d+"):nurseid>/patients/', endpoint='npatients')
+api.add_resource(Nurses_profile, '/hospital/api/nurses/<nurseid:nurseid>/', endpoint='nurse')
+api.add_resource(Nurses_ward, '/hospital/api/nurses/<nurseid:nurseid>/ward/', endpoint='nward')
+api.add_resource(Nurses_doses, '/hospital/api/nurses/<nurseid:nurseid>/doses/', endpoint='ndoses')
+api.add_resource(Nurses_patient_list, '/hospital/api/nurses/<nurseid:nurseid>/patients/', endpoint='npatients')
 api.add_resource(Nurses_patient_profile,
-                 '/hospital/api/nurses/<regex("nur-\d+"):nurseid>/patients/<regex("pat-\d+"):patientid>/',
+                 '/hospital/api/nurses/<nurseid:nurseid>/patients/<patientid:patientid>/',
                  endpoint='npatient')
 api.add_resource(Patient_medication_list,
-                 '/hospital/api/nurses/<regex("nur-\d+"):nurseid>/patients/<regex("pat-\d+"):patientid>/medication/',
+                 '/hospital/api/nurses/<nurseid:nurseid>/patients/<patientid:patientid>/medication/',
                  endpoint='npmedication')
 api.add_resource(Patient_medication,
-                 '/hospital/api/nurses/<regex("nur-\d+"):nurseid>/patients/<regex("pat-\d+"):patientid>/medication/<regex("med-\d+"):medicamentid>/',
+                 '/hospital/api/nurses/<nurseid:nurseid>/patients/<patientid:patientid>/medication/<medicamentid:medicamentid>/',
                  endpoint='npmedicament')
+api.add_resource(Hospital_changes, '/hospital/api/changes/', endpoint='changes')
+api.add_resource(Hospital_doses, '/hospital/api/doses/', endpoint='doses')
+api.add_resource(Hospital_import, '/hospital/api/admin/import/<regex("nurses|patients|medicaments"):entity>/',
+                 endpoint='import')
+links.compile()
 
 # Start the application
 # DATABASE SHOULD BE POPULATED PREVIOUSLY
 if __name__ == '__main__':
-    print "Populating the database"
+    logger.info("Populating the database")
     # Debug true activates automatic code reloading and improved error messages
     app.run(debug=True)
@@ -0,0 +1,166 @@
+'''
+Medication schedules.
+
+The hours ("every 8 hours", "twice a day") and the duration ("1 week",
+"2 days") of a medicament are free text. When a medicament is written they
+are parsed into an interval and a duration in seconds, stored in the
+medication_schedules table with the time of the first dose, and the
+upcoming administration times are written to the doses table (see the
+migrations). The doses due in a period are then one range of the indexes
+of doses, for a nurse or for the whole hospital.
+
+A medicament whose hours cannot be parsed has no doses. One whose duration
+cannot be parsed never ends. The doses are written up to the horizon of
+the schedule, at most OPEN_HORIZON seconds or MAX_DOSES ahead, and
+extend_schedules writes the following ones before a later period is read,
+at most MAX_AHEAD seconds after now.
+'''
+import math
+import re
+
+# Seconds of every unit of time accepted in the texts
+UNITS = {'minute': 60, 'min': 60, 'm': 60, 'hour': 3600, 'hr': 3600, 'h': 3600,
+         'day': 86400, 'd': 86400, 'week': 604800, 'w': 604800, 'month': 2592000}
+# Doses of a medicament without a known duration that are computed
+OPEN_HORIZON = 7 * 86400
+# Doses computed for a single medicament at most
+MAX_DOSES = 2000
+# Seconds after now until which the doses due can be read
+MAX_AHEAD = 2 * OPEN_HORIZON
+
+_NUMBER = r'(\d+(?:[.,]\d+)?)'
+# every 8 hours, each 30 min, every hour
+_EVERY = re.compile(r'^(?:every|each)\s+(?:%s\s*)?([a-z]+?)s?$' % _NUMBER)
+# once a day, twice a day, 3 times a day, 3 times per week
+_TIMES = re.compile(r'^(once|twice|(\d+)\s*times)\s+(?:a|per|every|each)\s+([a-z]+?)s?$')
+# 1 week, 2 days, for 12 hours
+_DURATION = re.compile(r'^(?:for\s+)?%s\s*([a-z]+?)s?$' % _NUMBER)
+
+
+def _number(text):
+    return float(text.replace(',', '.')) if text else 1.0
+
+
+def parse_interval(hours):
+    '''
+    Returns the seconds between two doses described by hours, or None if the
+    text is not understood.
+    '''
+    text = (hours or '').strip().lower()
+    match = _EVERY.match(text)
+    if match is not None and match.group(2) in UNITS:
+        seconds = _number(match.group(1)) * UNITS[match.group(2)]
+        return int(seconds) if seconds >= 1 else None
+    match = _TIMES.match(text)
+    if match is not None and match.group(3) in UNITS:
+        times = {'once': 1, 'twice': 2}.get(match.group(1)) or int(match.group(2))
+        if times > 0:
+            return UNITS[match.group(3)] // times or None
+    return None
+
+
+def parse_duration(duration):
+    '''
+    Returns the seconds described by duration, or None if the text is not
+    understood.
+    '''
+    text = (duration or '').strip().lower()
+    match = _DURATION.match(text)
+    if match is None or match.group(2) not in UNITS:
+        return None
+    seconds = _number(match.group(1)) * UNITS[match.group(2)]
+    return int(seconds) if seconds >= 1 else None
+
+
+def dose_times(start, interval, duration, now, limit=MAX_DOSES):
+    '''
+    Returns the times (seconds since the epoch) of the doses given every
+    interval seconds for duration seconds since start that are not before
+    now, at most limit of them (no limit if None). Without a duration the
+    doses end OPEN_HORIZON seconds after now.
+    '''
+    if interval is None:
+        return []
+    end = start + duration if duration is not None else now + OPEN_HORIZON
+    first = max(0, int(math.ceil(float(now - start) / interval)))
+    times = []
+    due = start + first * interval
+    while due < end and (limit is None or len(times) < limit):
+        times.append(due)
+        due += interval
+    return times
+
+
+def dose_period(start, interval, duration, now):
+    '''
+    Returns (times, horizon): the dose_times from now and the time until
+    which they are all the doses of the schedule, None if there are no more.
+    '''
+    times = dose_times(start, interval, duration, now)
+    if len(times) == MAX_DOSES:
+        return times, times[-1] + interval
+    if interval is None or duration is not None:
+        return times, None
+    return times, now + OPEN_HORIZON
+
+
+def write_schedules(con, medicaments, now, keep_start=False):
+    '''
+    Parse the hours and duration of medicaments, a list of (medicament id
+    number, hours, duration), and store their schedules and upcoming doses
+    with the connection or cursor con, in the transaction of the caller.
+    The schedules start at now, or when they started before if keep_start
+    and the medicament already had one.
+    '''
+    for number, hours, duration in medicaments:
+        start = None
+        if keep_start:
+            row = con.execute('SELECT start_time FROM medication_schedules WHERE medicament_id = ?',
+                              (number,)).fetchone()
+            start = row[0] if row is not None else None
+        if start is None:
+            start = int(now)
+        interval, seconds = parse_interval(hours), parse_duration(duration)
+        times, horizon = dose_period(start, interval, seconds, int(now))
+        con.execute('INSERT OR REPLACE INTO medication_schedules(medicament_id, interval_seconds, '
+                    'duration_seconds, start_time, horizon) VALUES(?, ?, ?, ?, ?)',
+                    (number, interval, seconds, start, horizon))
+        con.execute('DELETE FROM doses WHERE medicament_id = ?', (number,))
+        if not times:
+            continue
+        row = con.execute('SELECT p.p_nurse FROM medicaments m '
+                          'JOIN patients_profile p ON p.patient_id = m.m_patient '
+                          'WHERE m.medicament_id = ?', (number,)).fetchone()
+        if row is None:
+            continue
+        con.executemany('INSERT INTO doses(medicament_id, due_time, nurse_id) VALUES(?, ?, ?)',
+                        [(number, due, row[0]) for due in times])
+
+
+def extend_schedules(con, until, now):
+    '''
+    Write the doses of the schedules whose horizon is before until, up to
+    until at least, with the connection or cursor con, in the transaction
+    of the caller. Only the schedules to extend are read, through the index
+    of the horizons. The doses before now that were never written are not
+    written either, like those before a schedule is written.
+    raises ValueError if until is more than MAX_AHEAD seconds after now.
+    '''
+    if until > now + MAX_AHEAD:
+        raise ValueError("The doses can be read at most %d seconds ahead" % MAX_AHEAD)
+    rows = con.execute('SELECT s.medicament_id, s.interval_seconds, s.duration_seconds, s.start_time, s.horizon, '
+                       'p.p_nurse FROM medication_schedules s '
+                       'JOIN medicaments m ON m.medicament_id = s.medicament_id '
+                       'JOIN patients_profile p ON p.patient_id = m.m_patient '
+                       'WHERE s.horizon < ?', (int(until),)).fetchall()
+    for number, interval, duration, start, horizon, nurse in rows:
+        times, end = [], max(horizon, int(now))
+        while end is not None and end < until:
+            more, end = dose_period(start, interval, duration, end)
+            times.extend(more)
+        # Another process may have extended or written the schedule since it was read
+        cur = con.execute('UPDATE medication_schedules SET horizon = ? WHERE medicament_id = ? AND horizon = ? '
+                          'AND start_time = ? AND interval_seconds = ?', (end, number, horizon, start, interval))
+        if cur.rowcount == 1:
+            con.executemany('INSERT OR IGNORE INTO doses(medicament_id, due_time, nurse_id) VALUES(?, ?, ?)',
+                            [(number, due, nurse) for due in times])
@@ -0,0 +1,308 @@
+'''
+Pre-forking HTTP server for production.
+
+The master process opens the listening socket and forks the workers,
+which share it: the kernel gives every connection to one of them. Every
+worker serves up to threads connections at a time, each one in its own
+thread with a small stack, so slow or idle clients do not hold the whole
+process and thousands of idle connections fit in one worker. The SQLite
+work of those threads is bounded by the connection pool of the database,
+which should have a connection per thread. A worker is replaced after
+max_requests requests, or when it dies. post_fork is called in every
+worker before it serves anything, to open its own database connections.
+
+Signals of the master:
+    SIGTERM, SIGINT  stop: the workers finish the request they are serving
+    SIGHUP           graceful restart: the master executes argv again, so the
+                     new code and settings are loaded, keeping its pid, the
+                     listening socket and the old workers, which stop after
+                     their current request once the new ones are started.
+                     Without argv only the workers are replaced, forked from
+                     the code already loaded
+
+Usage from the project folder:
+    python hospital.py --workers 4 --threads 50 --max-requests 10000
+'''
+import errno
+import fcntl
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5000
+DEFAULT_BACKLOG = 128
+# Requests served by a worker before it is replaced, 0 for no limit
+DEFAULT_MAX_REQUESTS = 10000
+# Seconds a worker waits for a connection before checking if it must stop
+WORKER_POLL_INTERVAL = 1.0
+# Seconds the master waits before replacing a worker that failed
+RESPAWN_DELAY = 1.0
+# Connections served at the same time by a worker
+DEFAULT_THREADS = 1
+# Bytes of stack of every connection thread, instead of the default of the system (often 8 MB)
+THREAD_STACK_SIZE = 512 * 1024
+# Seconds a connection may stay idle before it is closed
+CONNECTION_TIMEOUT = 30.0
+# Environment given by a master to the one that replaces it on SIGHUP
+LISTEN_FD_ENV = 'HOSPITAL_LISTEN_FD'
+OLD_WORKERS_ENV = 'HOSPITAL_OLD_WORKERS'
+
+
+class RequestHandler(WSGIRequestHandler):
+    # An idle client must not keep a thread (or a whole worker) forever
+    timeout = CONNECTION_TIMEOUT
+
+
+class ConnectionThreads(object):
+    '''
+    Serves every connection accepted by a werkzeug server in its own
+    thread, at most size of them at the same time: the next accept waits
+    for a free thread.
+    '''
+
+    def __init__(self, server, size):
+        self.server = server
+        self._free = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._threads = set()
+
+    def process_request(self, request, client_address):
+        self._free.acquire()
+        thread = threading.Thread(target=self._serve, args=(request, client_address))
+        thread.daemon = True
+        with self._lock:
+            self._threads.add(thread)
+        thread.start()
+
+    def _serve(self, request, client_address):
+        try:
+            self.server.finish_request(request, client_address)
+        except Exception:
+            self.server.handle_error(request, client_address)
+        finally:
+            self.server.shutdown_request(request)
+            with self._lock:
+                self._threads.discard(threading.current_thread())
+            self._free.release()
+
+    def join(self):
+        '''
+        Wait for the connections being served.
+        '''
+        with self._lock:
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join()
+
+
+def default_workers():
+    return multiprocessing.cpu_count()
+
+
+def _family(host):
+    return socket.AF_INET6 if ':' in host else socket.AF_INET
+
+
+def inherited_socket(host=DEFAULT_HOST):
+    '''
+    Returns the listening socket left by the master that executed this one
+    on SIGHUP, or None.
+    '''
+    fd = os.environ.pop(LISTEN_FD_ENV, None)
+    if fd is None:
+        return None
+    sock = socket.socket(_sock=socket.fromfd(int(fd), _family(host), socket.SOCK_STREAM))
+    os.close(int(fd))
+    sock.setblocking(0)
+    return sock
+
+
+def listen(host=DEFAULT_HOST, port=DEFAULT_PORT, backlog=DEFAULT_BACKLOG):
+    '''
+    Returns a non blocking listening socket: the workers that do not get a
+    connection go back to wait instead of blocking in accept.
+    '''
+    sock = socket.socket(_family(host), socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(0)
+    return sock
+
+
+class PreforkServer(object):
+    '''
+    Master of the worker processes that serve the WSGI application app on
+    the listening socket sock. argv is the command executed on SIGHUP to
+    load the new code, see the module documentation.
+    '''
+
+    def __init__(self, app, sock, workers=None, max_requests=DEFAULT_MAX_REQUESTS, post_fork=None,
+                 threads=DEFAULT_THREADS, argv=None):
+        self.app = app
+        self.sock = sock
+        self.workers = workers or default_workers()
+        if self.workers < 1:
+            raise ValueError("There must be at least 1 worker")
+        if threads < 1:
+            raise ValueError("There must be at least 1 thread per worker")
+        self.threads = threads
+        self.max_requests = max_requests
+        self.post_fork = post_fork
+        self.argv = argv
+        # pid -> generation of the running workers
+        self.children = {}
+        self.generation = 0
+        self._stop = False
+        self._restart = False
+
+    # MASTER
+    def run(self):
+        '''
+        Start the workers and keep them running until the master is stopped.
+        '''
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_restart)
+        for i in range(self.workers):
+            self._spawn()
+        # The workers of the master this one replaced, they are children too
+        old = os.environ.pop(OLD_WORKERS_ENV, '')
+        self._stop_workers([int(pid) for pid in old.split(',') if pid])
+        while True:
+            if self._stop:
+                break
+            if self._restart:
+                self._restart = False
+                if self.argv is not None:
+                    self._reexec()
+                self._replace_workers()
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except OSError, e:
+                # A signal arrived, go and check the flags
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            generation = self.children.pop(pid, None)
+            if generation == self.generation and not self._stop:
+                # Recycled after max_requests or failed
+                if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+                    time.sleep(RESPAWN_DELAY)
+                self._spawn()
+        self._stop_workers(self.children.keys())
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, 0)
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.ECHILD:
+                    break
+                raise
+            self.children.pop(pid, None)
+        self.sock.close()
+
+    def _handle_stop(self, signum, frame):
+        self._stop = True
+
+    def _handle_restart(self, signum, frame):
+        self._restart = True
+
+    def _reexec(self):
+        # The workers keep serving until the new master has started its own
+        os.environ[LISTEN_FD_ENV] = str(self.sock.fileno())
+        os.environ[OLD_WORKERS_ENV] = ','.join(str(pid) for pid in self.children)
+        flags = fcntl.fcntl(self.sock.fileno(), fcntl.F_GETFD)
+        fcntl.fcntl(self.sock.fileno(), fcntl.F_SETFD, flags & ~fcntl.FD_CLOEXEC)
+        try:
+            os.execv(self.argv[0], self.argv)
+        except OSError:
+            # Keep serving the code already loaded
+            sys.excepthook(*sys.exc_info())
+            del os.environ[LISTEN_FD_ENV]
+            del os.environ[OLD_WORKERS_ENV]
+
+    def _replace_workers(self):
+        old = self.children.keys()
+        self.generation += 1
+        for i in range(self.workers):
+            self._spawn()
+        self._stop_workers(old)
+
+    def _stop_workers(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError, e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = self.generation
+            return pid
+        # The worker never returns to the code of the master
+        status = 1
+        try:
+            self._work()
+            status = 0
+        except BaseException:
+            sys.excepthook(*sys.exc_info())
+        finally:
+            os._exit(status)
+
+    # WORKER
+    def _work(self):
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+        # Ctrl+C reaches the whole process group, the master stops the workers
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        if self.post_fork is not None:
+            self.post_fork()
+        served = [0]
+        served_lock = threading.Lock()
+
+        def app(environ, start_response):
+            with served_lock:
+                served[0] += 1
+            return self.app(environ, start_response)
+
+        host, port = self.sock.getsockname()[:2]
+        server = make_server(host, port, app, request_handler=RequestHandler, fd=self.sock.fileno())
+        server.timeout = WORKER_POLL_INTERVAL
+        # werkzeug keeps the bare socket of fromfd, whose connections are read
+        # through a C FILE that ignores their timeout: use the python socket
+        if not isinstance(server.socket, socket.socket):
+            server.socket = socket.socket(_sock=server.socket)
+        connections = None
+        if self.threads > 1:
+            threading.stack_size(THREAD_STACK_SIZE)
+            connections = ConnectionThreads(server, self.threads)
+            server.process_request = connections.process_request
+        while not stopping and not (self.max_requests and served[0] >= self.max_requests):
+            server.handle_request()
+        # Finish the requests being served before exiting
+        if connections is not None:
+            connections.join()
+
+
+def serve(app, host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, max_requests=DEFAULT_MAX_REQUESTS,
+          post_fork=None, backlog=DEFAULT_BACKLOG, threads=DEFAULT_THREADS, argv=None):
+    '''
+    Serve app with a PreforkServer until it is stopped. argv is the command
+    that started the process, executed again on SIGHUP.
+    '''
+    sock = inherited_socket(host)
+    if sock is None:
+        sock = listen(host, port, backlog)
+    PreforkServer(app, sock, workers, max_requests, post_fork, threads, argv).run()
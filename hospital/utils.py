@@ -1,4 +1,8 @@
-from werkzeug.routing import BaseConverter
+from flask import request, url_for
+from werkzeug.routing import BaseConverter, ValidationError, parse_rule
+from werkzeug.urls import url_quote
+
+import ids
 
 class RegexConverter(BaseConverter):
     '''
@@ -7,3 +11,120 @@ class RegexConverter(BaseConverter):
     def __init__(self, url_map, *items):
         super(RegexConverter, self).__init__(url_map)
         self.regex = items[0]
+
+class IdConverter(BaseConverter):
+    '''
+    Base class of the converters of the ids in the url (nur-12, pat-3...).
+    The view receives the number of the id, already parsed with the codec,
+    and url_for accepts both the number and the public id.
+    '''
+    codec = None
+
+    def __init__(self, url_map):
+        super(IdConverter, self).__init__(url_map)
+        self.regex = self.codec.pattern
+
+    def to_python(self, value):
+        try:
+            return self.codec.decode(value)
+        except ValueError:
+            # Out of range: the url does not match
+            raise ValidationError()
+
+    def to_url(self, value):
+        return self.codec.normalize(value)
+
+class NurseIdConverter(IdConverter):
+    codec = ids.NURSE_IDS
+
+class PatientIdConverter(IdConverter):
+    codec = ids.PATIENT_IDS
+
+class MedicamentIdConverter(IdConverter):
+    codec = ids.MEDICAMENT_IDS
+
+class DoctorIdConverter(IdConverter):
+    codec = ids.DOCTOR_IDS
+
+# Name of the converters in the url rules: <nurseid:nurseid>
+ID_CONVERTERS = {'nurseid': NurseIdConverter, 'patientid': PatientIdConverter,
+                 'medicamentid': MedicamentIdConverter, 'doctorid': DoctorIdConverter}
+
+class LinkTemplate(object):
+    '''
+    Path of a url rule compiled to a format string: the static parts quoted
+    like werkzeug does and a %s for every variable, filled with the to_url
+    of its converter.
+    '''
+    def __init__(self, rule):
+        self.rule = rule
+        parts = []
+        self.variables = []
+        for converter, arguments, variable in parse_rule(rule.rule):
+            if converter is None:
+                parts.append(url_quote(variable, rule.map.charset, safe='/:|+').replace('%', '%%'))
+            else:
+                parts.append('%s')
+                self.variables.append((variable, rule._converters[variable].to_url))
+        self.pattern = ''.join(parts)
+        self.arguments = frozenset(variable for variable, to_url in self.variables)
+
+    def build(self, values):
+        path = self.pattern % tuple(to_url(values[variable]) for variable, to_url in self.variables)
+        # The same join as werkzeug's MapAdapter.build
+        return '%s/%s' % (request.script_root.rstrip('/'), path.lstrip('/'))
+
+class LinkBuilder(object):
+    '''
+    Builds the same urls as api.url_for, from LinkTemplates compiled once
+    by compile after the resources have been added, instead of going
+    through the url map for every link. The urls with values that are not
+    variables of the rule (the query string) are built by url_for.
+    '''
+    def __init__(self, app):
+        self.app = app
+        # endpoint -> LinkTemplates of its rules, in the order of the url map
+        self._templates = {}
+        # (endpoint, names of the values) -> LinkTemplate or None for url_for
+        self._choices = {}
+
+    def compile(self):
+        templates = {}
+        for rule in self.app.url_map.iter_rules():
+            templates.setdefault(rule.endpoint, []).append(LinkTemplate(rule))
+        self._templates = templates
+        self._choices = {}
+
+    def _choose(self, endpoint, values):
+        '''
+        Returns the template of the rule url_for would use for values, or
+        None if it is not built only from the values.
+        '''
+        if self.app.url_default_functions:
+            return None
+        templates = self._templates.get(endpoint, ())
+        # url_for tries the rules for GET first
+        for method in ('GET', None):
+            for template in templates:
+                if template.rule.suitable_for(values, method):
+                    if template.rule.defaults or template.arguments != frozenset(values):
+                        return None
+                    return template
+        return None
+
+    def url_for(self, resource, **values):
+        '''
+        Returns the url of resource (a Resource added to the api) with
+        values, like api.url_for.
+        '''
+        endpoint = resource.endpoint
+        if None in values.itervalues():
+            return url_for(endpoint, **values)
+        key = (endpoint, frozenset(values))
+        try:
+            template = self._choices[key]
+        except KeyError:
+            template = self._choices[key] = self._choose(endpoint, values)
+        if template is None:
+            return url_for(endpoint, **values)
+        return template.build(values)
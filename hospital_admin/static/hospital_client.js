@@ -57,10 +57,15 @@ function get_nurses_list() {
 
 
 function getNurse(apiurl) {
+    //The ward view returns the nurse, their patients and the medication of every patient
+    var wardurl = apiurl + "ward/";
     return $.ajax({
-        url: apiurl,
+        url: wardurl,
         dataType: RESPONSE_FORMAT,
         headers: {"Authorization": "admin"}
+    }).always(function () {
+        $("#nurse").empty();
+
     }).done(function (data, textStatus, jqXHR) {
         if (DEBUG) {
             console.log("RECEIVED RESPONSE: data:", data, "; textStatus:", textStatus)
@@ -70,22 +75,17 @@ function getNurse(apiurl) {
         if (RESPONSE_FORMAT === "json") {
             var nurse = data.nurse;
             $("#nurse_profile").attr('action', apiurl);
-            var nurse_patients_list_url = nurse.link.href;
             $("#name").val(nurse.name);
             $("#surname").val(nurse.surname);
             $("#phone_number").val(nurse['phone number']);
             $("#address").val(nurse.address);
-            $.when(
-                getNursePatientsList(nurse_patients_list_url, apiurl)
-            )
-                .always(function () {
-                    $("#newNurseData").hide();
-                    $("#newMedicamentData").hide();
-                    $("#existingNurseData").show();
-                    //Be sure that the content is shown
-                    $("#mainContent").show();
-                });
+            showNurseWard(data.patients, apiurl);
         }
+        $("#newNurseData").hide();
+        $("#newMedicamentData").hide();
+        $("#existingNurseData").show();
+        //Be sure that the content is shown
+        $("#mainContent").show();
 
     }).fail(function (jqXHR, textStatus, errorThrown) {
         if (DEBUG) {
@@ -98,36 +98,6 @@ function getNurse(apiurl) {
 }
 
 
-function getNursePatientsList(apiurl, nurseurl) {
-    return $.ajax({
-        url: apiurl,
-        dataType: RESPONSE_FORMAT,
-        headers: {"Authorization": "admin"}
-    }).always(function () {
-        $("#nurse").empty();
-
-    }).done(function (data, textStatus, jqXHR) {
-        if (DEBUG) {
-            console.log("RECEIVED RESPONSE: data:", data, "; textStatus:", textStatus)
-        }
-        $("#patientsNumber").text(data.nurses_patient_list.length);
-        if (RESPONSE_FORMAT === "json") {
-            pats = data['nurses_patient_list'];
-            for (var i = 0; i < pats.length; i++) {
-                getPatient(pats[i].link.href, nurseurl);
-            }
-        }
-
-    }).fail(function (jqXHR, textStatus, errorThrown) {
-        if (DEBUG) {
-            console.log("RECEIVED ERROR: textStatus:", textStatus, ";error:", errorThrown)
-        }
-        alert("Could not fetch the nurse's patients list.  Please, try again");
-
-    });
-}
-
-
 function addNurse(apiurl, nurseData) {
     return $.ajax({
         url: apiurl,
@@ -253,32 +223,6 @@ Checking github.s
 
 */
 
-function getPatient(apiurl, nurseurl) {
-    $.ajax({
-        url: apiurl,
-        dataType: RESPONSE_FORMAT,
-        headers: {"Authorization": "admin"}
-    }).done(function (data, textStatus, jqXHR) {
-        if (DEBUG) {
-            console.log("RECEIVED RESPONSE: data:", data, "; textStatus:", textStatus)
-        }
-        var patient = data.patient;
-        var name = patient.name;
-        var surname = patient.surname;
-        var room = patient.room;
-        var medication = patient.link.href;
-        appendPatientToList(apiurl, name, surname, room, medication, nurseurl);
-        getMedication(medication, name, surname, room, apiurl, nurseurl);
-
-    }).fail(function (jqXHR, textStatus, errorThrown) {
-        if (DEBUG) {
-            console.log("RECEIVED ERROR: textStatus:", textStatus, ";error:", errorThrown)
-        }
-        alert("Cannot get information from patient: " + apiurl);
-    });
-}
-
-
 function deletePatient(apiurl) {
     $.ajax({
         url: apiurl,
@@ -301,62 +245,6 @@ function deletePatient(apiurl) {
 }
 
 
-function getMedication(apiurl, pname, psurname, proom, purl, nurl) {
-    return $.ajax({
-        url: apiurl,
-        dataType: RESPONSE_FORMAT,
-        headers: {"Authorization": "admin"}
-    }).always(function () {
-        $("#patient_medication_list").empty();
-
-    }).done(function (data, textStatus, jqXHR) {
-        if (DEBUG) {
-            console.log("RECEIVED RESPONSE: data:", data, "; textStatus:", textStatus)
-        }
-        $("#medicationNumber").text(data.patient_medication_list.length);
-        if (RESPONSE_FORMAT === "json") {
-            meds = data['patient_medication_list'];
-            for (var i = 0; i < meds.length; i++) {
-                getMedicament(meds[i].link.href, pname, psurname, proom, purl, nurl);
-            }
-        }
-
-    }).fail(function (jqXHR, textStatus, errorThrown) {
-        if (DEBUG) {
-            console.log("RECEIVED ERROR: textStatus:", textStatus, ";error:", errorThrown)
-        }
-        alert("Could not fetch the patient medication list.  Please, try again");
-    });
-}
-
-
-function getMedicament(apiurl, pname, psurname, proom, purl, nurl) {
-    $.ajax({
-        url: apiurl,
-        dataType: RESPONSE_FORMAT,
-        headers: {"Authorization": "admin"}
-    }).done(function (data, textStatus, jqXHR) {
-        if (DEBUG) {
-            console.log("RECEIVED RESPONSE: data:", data, "; textStatus:", textStatus)
-        }
-        var medicament = data.medicament;
-        var name = medicament.name;
-        var dosage = medicament.dosage;
-        var duration = medicament.duration;
-        var hours = medicament.hours;
-        var bag_volume = medicament['bag volume'];
-        var administration = medicament.administration;
-        appendMedicamentToList(apiurl, name, dosage, duration, hours, bag_volume, administration, pname, psurname, proom, purl, nurl);
-
-    }).fail(function (jqXHR, textStatus, errorThrown) {
-        if (DEBUG) {
-            console.log("RECEIVED ERROR: textStatus:", textStatus, ";error:", errorThrown)
-        }
-        alert("Cannot get information from medicament: " + apiurl);
-    });
-}
-
-
 function addMedicament(apiurl, medicamentData) {
     return $.ajax({
         url: apiurl,
@@ -629,6 +517,28 @@ function appendNurseToList(url, id, name) {
 }
 
 
+function showNurseWard(patients, nurseurl) {
+    //The patients come with their medication, no more requests are needed
+    $("#patient_medication_list").empty();
+    $("#patientsNumber").text(patients.length);
+    var medicationNumber = 0;
+    for (var i = 0; i < patients.length; i++) {
+        var patient = patients[i];
+        var patienturl = patient.link.href;
+        appendPatientToList(patienturl, patient.name, patient.surname, patient.room,
+            patient['medication link'].href, nurseurl);
+        for (var j = 0; j < patient.medication.length; j++) {
+            var medicament = patient.medication[j];
+            appendMedicamentToList(medicament.link.href, medicament.name, medicament.dosage, medicament.duration,
+                medicament.hours, medicament['bag volume'], medicament.administration, patient.name,
+                patient.surname, patient.room, patienturl, nurseurl);
+        }
+        medicationNumber += patient.medication.length;
+    }
+    $("#medicationNumber").text(medicationNumber);
+}
+
+
 function appendPatientToList(apiurl, name, surname, room, url, nurseurl) {
     var $patient = $("<div>").addClass('patient').html("" +
         "<form action='" + apiurl + "'>" +
@@ -0,0 +1,153 @@
+import unittest, os
+
+import hospital.database
+import hospital.cache as cache
+
+db_path = 'db/hospital_test.db'
+db = hospital.database.HospitalDatabase(db_path)
+
+class FakeClock(object):
+    '''
+    Clock that only moves when the test says so
+    '''
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_lru_eviction(self):
+        '''
+        Check that the least recently used entry is evicted when the cache is full
+        '''
+        print '('+self.test_lru_eviction.__name__+')', self.test_lru_eviction.__doc__
+        lru = cache.LRUCache(size=2, ttl=None)
+        lru.put(1, 'a')
+        lru.put(2, 'b')
+        self.assertEquals(lru.get(1), 'a')
+        lru.put(3, 'c')
+        self.assertIsNone(lru.get(2))
+        self.assertEquals(lru.get(1), 'a')
+        self.assertEquals(lru.get(3), 'c')
+        stats = lru.stats()
+        self.assertEquals(stats['hits'], 3)
+        self.assertEquals(stats['misses'], 1)
+        self.assertEquals(stats['evictions'], 1)
+        self.assertEquals(stats['entries'], 2)
+
+    def test_ttl(self):
+        '''
+        Check that the entries expire after the TTL
+        '''
+        print '('+self.test_ttl.__name__+')', self.test_ttl.__doc__
+        clock = FakeClock()
+        lru = cache.LRUCache(size=10, ttl=5, clock=clock)
+        lru.put(1, 'a')
+        clock.now += 4
+        self.assertEquals(lru.get(1), 'a')
+        clock.now += 1
+        self.assertIsNone(lru.get(1))
+        self.assertEquals(lru.stats()['expirations'], 1)
+
+    def test_stale_put(self):
+        '''
+        Check that a value read before an invalidation is not stored
+        '''
+        print '('+self.test_stale_put.__name__+')', self.test_stale_put.__doc__
+        lru = cache.LRUCache(size=10, ttl=None)
+        version = lru.version
+        lru.invalidate(1)
+        lru.put(1, 'old', version)
+        self.assertIsNone(lru.get(1))
+
+class CachedDatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        self.db = cache.CachedHospitalDatabase(db, size=100, ttl=60)
+        self.db.load_init_values()
+
+    def tearDown(self):
+        self.db.clean()
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_read_through(self):
+        '''
+        Check that the second get of a nurse is a hit and that fields are projected from the cache
+        '''
+        print '('+self.test_read_through.__name__+')', self.test_read_through.__doc__
+        nurse = self.db.get_nurse('nur-1')
+        self.assertEquals(nurse, db.get_nurse('nur-1'))
+        self.assertEquals(self.db.get_nurse(1, ['name']), {'name': nurse['name']})
+        self.assertTrue(self.db.contains_nurse('nur-1'))
+        stats = self.db.cache_stats()['nurses']
+        self.assertEquals(stats['misses'], 1)
+        self.assertEquals(stats['hits'], 2)
+        self.assertIsNone(self.db.get_nurse('nur-500'))
+
+    def test_modify_invalidates(self):
+        '''
+        Check that modify_patient evicts the cached patient
+        '''
+        print '('+self.test_modify_invalidates.__name__+')', self.test_modify_invalidates.__doc__
+        self.db.get_patient('pat-0')
+        self.db.modify_patient('pat-0', 'new name', 'new surname', 1, 2, 'new address')
+        self.assertEquals(self.db.get_patient('pat-0')['name'], 'new name')
+
+    def test_delete_nurse_cascade(self):
+        '''
+        Check that deleting a nurse evicts their patients and their medicaments
+        '''
+        print '('+self.test_delete_nurse_cascade.__name__+')', self.test_delete_nurse_cascade.__doc__
+        self.db.get_nurse('nur-1')
+        patient = self.db.get_patient('pat-0')
+        self.assertEquals(patient['nurse id'], 'nur-1')
+        medicaments = self.db.get_patient_medication_list('pat-0')
+        for medicament in medicaments:
+            self.db.get_medicament(medicament['id'])
+        self.assertTrue(self.db.delete_nurse('nur-1'))
+        self.assertIsNone(self.db.get_nurse('nur-1'))
+        self.assertIsNone(self.db.get_patient('pat-0'))
+        for medicament in medicaments:
+            self.assertIsNone(self.db.get_medicament(medicament['id']))
+        self.assertEquals(self.db.cache_stats()['medicaments']['entries'], 0)
+
+
+    def test_other_process_write(self):
+        '''
+        Check that a cached object of another version than the one read is not returned
+        '''
+        print '('+self.test_other_process_write.__name__+')', self.test_other_process_write.__doc__
+        # Two workers, each with its own connections and cache
+        other = cache.CachedHospitalDatabase(hospital.database.HospitalDatabase(db_path), size=100, ttl=60)
+        try:
+            for worker in (self.db, other):
+                self.assertEquals(worker.get_nurse('nur-1', version=worker.get_nurse_version('nur-1'))['name'],
+                                  'Jussi')
+                worker.get_patient('pat-0', version=worker.get_patient_version('pat-0'))
+            self.db.modify_nurse('nur-1', 'new name', 'new surname', 1, 'new address')
+            self.db.modify_patient('pat-0', 'new patient', 'new surname', 1, 2, 'new address')
+            version = other.get_nurse_version('nur-1')
+            self.assertEquals(other.get_nurse('nur-1', version=version)['name'], 'new name')
+            self.assertEquals(other.get_patient('pat-0', version=other.get_patient_version('pat-0'))['name'],
+                              'new patient')
+            # The entry read again is of the new version
+            misses = other.cache_stats()['nurses']['misses']
+            self.assertEquals(other.get_nurse('nur-1', version=version)['name'], 'new name')
+            self.assertEquals(other.cache_stats()['nurses']['misses'], misses)
+        finally:
+            other.db.close()
+
+if __name__ == '__main__':
+    print 'Start running tests'
+    unittest.main()
@@ -0,0 +1,217 @@
+import unittest, gzip, json, os, re, shutil, StringIO, tempfile, zlib
+
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+from werkzeug.wsgi import DispatcherMiddleware
+
+import hospital.assets as assets
+import hospital.compression as compression
+
+
+def text_app(size, content_type='application/json', stream=False):
+    '''
+    WSGI application that answers size bytes
+    '''
+    def app(environ, start_response):
+        headers = [('Content-Type', content_type), ('ETag', '"v1"'), ('Vary', 'Accept')]
+        if not stream:
+            headers.append(('Content-Length', str(size)))
+        start_response('200 OK', headers)
+        if stream:
+            return iter(['a' * (size // 2), 'b' * (size - size // 2)])
+        return ['a' * size]
+    return app
+
+
+class CompressionMiddlewareTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def get(self, app, accept_encoding=None):
+        headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+        client = Client(compression.CompressionMiddleware(app, min_size=100), BaseResponse)
+        return client.get('/', headers=headers)
+
+    def test_negotiation(self):
+        '''
+        Check that gzip or deflate is used only when Accept-Encoding allows it
+        '''
+        print '('+self.test_negotiation.__name__+')', self.test_negotiation.__doc__
+        app = text_app(1000)
+        resp = self.get(app)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEquals(resp.data, 'a' * 1000)
+        resp = self.get(app, 'gzip, deflate')
+        self.assertEquals(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEquals(gzip.GzipFile(fileobj=StringIO.StringIO(resp.data)).read(), 'a' * 1000)
+        self.assertEquals(int(resp.headers['Content-Length']), len(resp.data))
+        self.assertEquals(resp.headers['Vary'], 'Accept, Accept-Encoding')
+        self.assertEquals(resp.headers['ETag'], 'W/"v1"')
+        resp = self.get(app, 'gzip;q=0.5, deflate')
+        self.assertEquals(resp.headers['Content-Encoding'], 'deflate')
+        self.assertEquals(zlib.decompress(resp.data), 'a' * 1000)
+        resp = self.get(app, 'gzip;q=0, br')
+        self.assertNotIn('Content-Encoding', resp.headers)
+
+    def test_thresholds_and_types(self):
+        '''
+        Check that small responses and incompressible types are not compressed
+        '''
+        print '('+self.test_thresholds_and_types.__name__+')', self.test_thresholds_and_types.__doc__
+        resp = self.get(text_app(99), 'gzip')
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEquals(resp.data, 'a' * 99)
+        resp = self.get(text_app(1000, 'image/png'), 'gzip')
+        self.assertNotIn('Content-Encoding', resp.headers)
+        resp = self.get(text_app(1000, 'text/html; charset=utf-8'), 'gzip')
+        self.assertEquals(resp.headers['Content-Encoding'], 'gzip')
+
+    def test_streamed_response(self):
+        '''
+        Check that the responses without length are compressed chunk by chunk
+        '''
+        print '('+self.test_streamed_response.__name__+')', self.test_streamed_response.__doc__
+        resp = self.get(text_app(1000, stream=True), 'gzip')
+        self.assertEquals(resp.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', resp.headers)
+        self.assertEquals(gzip.GzipFile(fileobj=StringIO.StringIO(resp.data)).read(), 'a' * 500 + 'b' * 500)
+
+
+class StaticAssetsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.output = os.path.join(tempfile.mkdtemp(), 'build')
+        os.makedirs(os.path.join(self.source, 'js'))
+        with open(os.path.join(self.source, 'js', 'app.js'), 'wb') as f:
+            f.write('var nurses = [];\n' * 200)
+        with open(os.path.join(self.source, 'logo.png'), 'wb') as f:
+            f.write('\x89PNG' + os.urandom(500))
+        with open(os.path.join(self.source, 'index.html'), 'wb') as f:
+            f.write('<script src="js/app.js?v=1"></script><img src=\'logo.png\'><a href="other.html">'
+                    '<a href="#top"><script src="https://cdn.example.com/lib.js"></script>'
+                    '<script src="js/missing.js"></script>' + '<p>Nurses</p>' * 100)
+        self.manifest = assets.build(self.source, self.output)
+        self.client = Client(assets.StaticAssets(text_app(10), '/hospital_admin/', self.output),
+                             BaseResponse)
+
+    def tearDown(self):
+        shutil.rmtree(self.source)
+        shutil.rmtree(os.path.dirname(self.output))
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_build(self):
+        '''
+        Check the hashed names, the compressed copies and the manifest
+        '''
+        print '('+self.test_build.__name__+')', self.test_build.__doc__
+        entry = self.manifest['js/app.js']
+        self.assertRegexpMatches(entry['path'], r'^js/app\.[0-9a-f]{12}\.js$')
+        self.assertTrue(entry['gzip'])
+        self.assertFalse(self.manifest['logo.png']['gzip'])
+        with open(os.path.join(self.output, entry['path'] + '.gz'), 'rb') as f:
+            self.assertEquals(gzip.GzipFile(fileobj=f).read(), 'var nurses = [];\n' * 200)
+        with open(os.path.join(self.output, assets.MANIFEST), 'rb') as f:
+            self.assertEquals(json.load(f), self.manifest)
+        # The same content gives the same copies
+        output = self.output + '2'
+        try:
+            self.assertEquals(assets.build(self.source, output), self.manifest)
+        finally:
+            shutil.rmtree(output)
+
+    def test_serve(self):
+        '''
+        Check the cache headers, the precompressed copies and the revalidation
+        '''
+        print '('+self.test_serve.__name__+')', self.test_serve.__doc__
+        entry = self.manifest['js/app.js']
+        url = '/hospital_admin/' + entry['path']
+        resp = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEquals(resp.status_code, 200)
+        self.assertEquals(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEquals(resp.headers['Cache-Control'], assets.IMMUTABLE_CACHE_CONTROL)
+        self.assertEquals(resp.headers['Content-Type'], assets.content_type('app.js'))
+        self.assertEquals(gzip.GzipFile(fileobj=StringIO.StringIO(resp.data)).read(), 'var nurses = [];\n' * 200)
+        resp = self.client.get(url)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEquals(resp.data, 'var nurses = [];\n' * 200)
+        # The original name is revalidated
+        resp = self.client.get('/hospital_admin/js/app.js')
+        self.assertEquals(resp.headers['Cache-Control'], assets.REVALIDATE_CACHE_CONTROL)
+        resp = self.client.get('/hospital_admin/js/app.js', headers={'If-None-Match': resp.headers['ETag']})
+        self.assertEquals(resp.status_code, 304)
+        self.assertEquals(self.client.get('/hospital_admin/' + self.manifest['logo.png']['path'],
+                                          headers={'Accept-Encoding': 'gzip'}).headers.get('Content-Encoding'), None)
+        self.assertEquals(assets.StaticAssets(None, '/hospital_admin/', self.output).url('js/app.js'), url)
+        # The other files go to the application
+        self.assertEquals(self.client.get('/hospital_admin/js/missing.js').data, 'a' * 10)
+        self.assertEquals(self.client.get('/hospital/api/nurses/').data, 'a' * 10)
+
+    def test_pages(self):
+        '''
+        Check that the pages reference the hashed copies, which are the files served
+        '''
+        print '('+self.test_pages.__name__+')', self.test_pages.__doc__
+        static = assets.StaticAssets(None, '/hospital_admin/', self.output)
+        resp = self.client.get('/hospital_admin/index.html')
+        self.assertEquals(resp.headers['Cache-Control'], assets.REVALIDATE_CACHE_CONTROL)
+        self.assertIn('src="%s?v=1"' % static.url('js/app.js'), resp.data)
+        self.assertIn("src='%s'" % static.url('logo.png'), resp.data)
+        for kept in ('href="other.html"', 'href="#top"', 'src="https://cdn.example.com/lib.js"',
+                     'src="js/missing.js"'):
+            self.assertIn(kept, resp.data)
+        self.assertEquals(self.client.get('/hospital_admin/index.html', headers={'If-None-Match': resp.headers['ETag']}
+                                          ).status_code, 304)
+        compressed = self.client.get('/hospital_admin/index.html', headers={'Accept-Encoding': 'gzip'})
+        self.assertEquals(compressed.headers['Content-Encoding'], 'gzip')
+        self.assertEquals(gzip.GzipFile(fileobj=StringIO.StringIO(compressed.data)).read(), resp.data)
+        # The browser asks for the url in the page
+        url = re.search(r'src="([^"?]+)\?v=1"', resp.data).group(1)
+        resp = self.client.get(url)
+        self.assertEquals(resp.headers['Cache-Control'], assets.IMMUTABLE_CACHE_CONTROL)
+        self.assertEquals(resp.data, 'var nurses = [];\n' * 200)
+
+
+class AdminStaticTestCase(unittest.TestCase):
+    '''
+    The copies of the static files of the admin UI, mounted as in hospital.py
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+        from hospital_admin.application import app as hospital_admin
+        cls.output = os.path.join(tempfile.mkdtemp(), 'build')
+        assets.build('hospital_admin/static', cls.output)
+        application = DispatcherMiddleware(text_app(10), {'/hospital_admin': hospital_admin})
+        cls.client = Client(assets.StaticAssets(application, '/hospital_admin/', cls.output), BaseResponse)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(os.path.dirname(cls.output))
+
+    def test_referenced_assets(self):
+        '''
+        Check that the assets referenced by the admin pages are the hashed copies
+        '''
+        print '('+self.test_referenced_assets.__name__+')', self.test_referenced_assets.__doc__
+        page = self.client.get('/hospital_admin/index.html').data
+        urls = re.findall(r'(?:src|href)="(/hospital_admin/[^"]+)"', page)
+        self.assertIn('/hospital_admin/bootstrap/css/bootstrap.min.css', [re.sub(r'\.[0-9a-f]{12}\.', '.', url)
+                                                                          for url in urls])
+        for url in urls:
+            resp = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+            self.assertEquals(resp.status_code, 200)
+            self.assertEquals(resp.headers['Cache-Control'], assets.IMMUTABLE_CACHE_CONTROL)
+        css = self.client.get('/hospital_admin/bootstrap/css/bootstrap.min.css', headers={'Accept-Encoding': 'gzip'})
+        self.assertEquals(css.headers['Content-Encoding'], 'gzip')
+
+if __name__ == '__main__':
+    print 'Start running tests'
+    unittest.main()
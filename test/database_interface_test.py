@@ -1,6 +1,8 @@
-import unittest, sqlite3, os, copy
+import unittest, sqlite3, os, copy, threading
 
 import hospital.database
+import hospital.migrations
+import hospital.schedule
 
 db_path = 'db/hospital_test.db'
 db = hospital.database.HospitalDatabase(db_path)
@@ -120,6 +122,34 @@ class NurseDbAPITestCase(DatabaseAPITestCase):
             elif nurse['id'] == self.nurse2_id:
                 self.assertDictContainsSubset(nurse,self.nurse2)
 
+    def test_get_nurses_list_pages(self):
+        '''
+        Test that get_nurses_list returns pages of nurses ordered by id
+        '''
+        print '('+self.test_get_nurses_list_pages.__name__+')', self.test_get_nurses_list_pages.__doc__
+        nurses = db.get_nurses_list(limit=4)
+        self.assertEquals([nurse['id'] for nurse in nurses], ['nur-0', 'nur-1', 'nur-2', 'nur-3'])
+        nurses = db.get_nurses_list(limit=4, after='nur-3')
+        self.assertEquals([nurse['id'] for nurse in nurses], ['nur-4', 'nur-6', 'nur-7', 'nur-8'])
+        nurses = db.get_nurses_list(after='nur-8')
+        self.assertEquals([nurse['id'] for nurse in nurses], ['nur-9', 'nur-10', 'nur-11'])
+        with self.assertRaises(ValueError):
+            db.get_nurses_list(after='pat-1')
+
+    def test_get_nurses_list_fields(self):
+        '''
+        Test that get_nurses_list and get_nurse return only the asked fields
+        '''
+        print '('+self.test_get_nurses_list_fields.__name__+')', self.test_get_nurses_list_fields.__doc__
+        nurses = db.get_nurses_list(limit=2, fields=['id', 'name'])
+        self.assertEquals(len(nurses), 2)
+        for nurse in nurses:
+            self.assertEquals(sorted(nurse.keys()), ['id', 'name'])
+        nurse = db.get_nurse(self.nurse1_id, fields=['phone number'])
+        self.assertEquals(nurse.keys(), ['phone number'])
+        with self.assertRaises(ValueError):
+            db.get_nurses_list(fields=['salary'])
+
     def test_delete_nurse(self):
         '''
         Test that the nurse nur-1 is deleted
@@ -201,6 +231,30 @@ class NurseDbAPITestCase(DatabaseAPITestCase):
         resp2 = db.get_nurse(nurseid)
         self.assertDictContainsSubset(new_nurse, resp2)
 
+    def test_append_nurses(self):
+        '''
+        Test that several nurses are created at once and their ids are returned in order
+        '''
+        print '('+self.test_append_nurses.__name__+')', self.test_append_nurses.__doc__
+        nurses = [("name %d" % i, "surname %d" % i, i, "address %d" % i) for i in range(20)]
+        nurseids = db.append_nurses(nurses)
+        self.assertEquals(len(nurseids), 20)
+        self.assertEquals(len(set(nurseids)), 20)
+        for i, nurseid in enumerate(nurseids):
+            nurse = db.get_nurse(nurseid)
+            self.assertEquals(nurse['name'], "name %d" % i)
+        self.assertEquals(len(db.get_nurses_list()), self.initial_size + 20)
+        self.assertEquals(db.append_nurses([]), [])
+
+    def test_append_nurses_wrong(self):
+        '''
+        Test that no nurse is created if one of them is malformed
+        '''
+        print '('+self.test_append_nurses_wrong.__name__+')', self.test_append_nurses_wrong.__doc__
+        with self.assertRaises(ValueError):
+            db.append_nurses([("name", "surname", 1, "address"), ("name",)])
+        self.assertEquals(len(db.get_nurses_list()), self.initial_size)
+
     def test_not_contains_nurse(self):
         '''
         Check if the database does not contain a nurse with id nur-5
@@ -216,6 +270,33 @@ class NurseDbAPITestCase(DatabaseAPITestCase):
         self.assertTrue(db.contains_nurse(self.nurse1_id))
         self.assertTrue(db.contains_nurse(self.nurse2_id))      
 
+    def test_contains_nurse_malformed_id(self):
+        '''
+        Test that contains_nurse with id ='1' raises an error
+        '''
+        print '('+self.test_contains_nurse_malformed_id.__name__+')', self.test_contains_nurse_malformed_id.__doc__
+        with self.assertRaises(ValueError):
+            db.contains_nurse('1')
+
+    def test_wide_nurse_ids(self):
+        '''
+        Test that ids with more than 3 digits, up to 64 bits, are not truncated
+        '''
+        print '('+self.test_wide_nurse_ids.__name__+')', self.test_wide_nurse_ids.__doc__
+        with db.connection() as con:
+            con.execute("INSERT INTO nurses_profile(nurse_id, name, surname, phone_number, address) "
+                        "VALUES(5000000000, 'Big', 'Id', 1, 'Far away')")
+        nurse = db.get_nurse('nur-5000000000')
+        self.assertEquals(nurse['id'], 'nur-5000000000')
+        # The number of the id is accepted too
+        self.assertEquals(db.get_nurse(5000000000), nurse)
+        self.assertIsNone(db.get_nurse('nur-1000'))
+        self.assertEquals(db.modify_nurse(5000000000, 'a', 'b', 2, 'c'), 'nur-5000000000')
+        with self.assertRaises(ValueError):
+            db.get_nurse('nur-99999999999999999999')
+        with self.assertRaises(ValueError):
+            db.get_nurse('nur-12abc')
+
 
 class PatientDbAPITestCase(DatabaseAPITestCase):
     patient0 = {'id':'pat-0','name':'Juan Carlos','surname':'Primero','room':1408,'phone number':1,'address':'Palacio de la Zarzuela','nurse id':'nur-1','doctor id':'doc-1'}
@@ -576,7 +657,7 @@ class MedicamentDbAPITestCase(DatabaseAPITestCase):
         '''
         The method append_medication will construct the 
         '''
-        medicamentid = db.append_medication("new name","new dosage","new duration","new hours","new bag","new administration","0")
+        medicamentid = db.append_medication("new name","new dosage","new duration","new hours","new bag","new administration","pat-0")
         self.assertIsNotNone(medicamentid)
         #Get the expected modified medicament
         new_medicament = {}
@@ -591,6 +672,35 @@ class MedicamentDbAPITestCase(DatabaseAPITestCase):
         resp2 = db.get_medicament(medicamentid)
         self.assertDictContainsSubset(new_medicament, resp2)
 
+    def test_append_medications(self):
+        '''
+        Test that several medicaments are created at once and their ids are returned in order
+        '''
+        print '('+self.test_append_medications.__name__+')', self.test_append_medications.__doc__
+        medicaments = [("med %d" % i, "dosage", "1 week", "every 8 hours", "100 ml", "oral", 0) for i in range(5)]
+        medicamentids = db.append_medications(medicaments)
+        self.assertEquals(len(medicamentids), 5)
+        for i, medicamentid in enumerate(medicamentids):
+            medicament = db.get_medicament(medicamentid)
+            self.assertEquals(medicament['name'], "med %d" % i)
+            self.assertEquals(medicament['patient id'], 'pat-0')
+
+    def test_append_medications_patient_ids(self):
+        '''
+        Check that the patient of a new medicament can be given by its public id, and a malformed one is rejected
+        '''
+        print '('+self.test_append_medications_patient_ids.__name__+')', self.test_append_medications_patient_ids.__doc__
+        medicamentids = db.append_medications([("med", "dosage", "1 week", "every 8 hours", "100 ml", "oral", "pat-1"),
+                                               ("med", "dosage", "1 week", "every 8 hours", "100 ml", "oral", 0)])
+        self.assertEquals([db.get_medicament(medicamentid)['patient id'] for medicamentid in medicamentids],
+                          ['pat-1', 'pat-0'])
+        medicamentid = db.append_medication("med", "dosage", "1 week", "every 8 hours", "100 ml", "oral", "pat-1")
+        self.assertEquals(db.get_medicament(medicamentid)['patient id'], 'pat-1')
+        with self.assertRaises(ValueError):
+            db.append_medication("med", "dosage", "1 week", "every 8 hours", "100 ml", "oral", "patient-1")
+        with self.assertRaises(ValueError):
+            db.append_medications([("med", "dosage", "1 week", "every 8 hours", "100 ml", "oral", "pat-x")])
+
     def test_not_contains_medicament(self):
         '''
         Check if the database does not contain a medicament with id med-5
@@ -605,6 +715,572 @@ class MedicamentDbAPITestCase(DatabaseAPITestCase):
         print '('+self.test_contains_medicament.__name__+')', self.test_contains_medicament.__doc__
         self.assertTrue(db.contains_medicament(self.medicament1_id))
         self.assertTrue(db.contains_medicament(self.medicament2_id))     
+
+class ConnectionPoolTestCase(DatabaseAPITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_connections_are_reused(self):
+        '''
+        Check that consecutive operations reuse the same pooled connection
+        '''
+        print '('+self.test_connections_are_reused.__name__+')', self.test_connections_are_reused.__doc__
+        pooled_db = hospital.database.HospitalDatabase(db_path, pool_size=3)
+        for i in range(10):
+            pooled_db.get_nurse('nur-1')
+            pooled_db.get_nurses_list()
+        stats = pooled_db.pool_stats()
+        self.assertEquals(stats['created'], 1)
+        self.assertEquals(stats['checkouts'], 20)
+        self.assertEquals(stats['in_use'], 0)
+        self.assertEquals(stats['size'], 3)
+        pooled_db.close()
+
+    def test_iterators_release_connection(self):
+        '''
+        Check that the iterators of the collections read pages without keeping a connection between them
+        '''
+        print '('+self.test_iterators_release_connection.__name__+')', self.test_iterators_release_connection.__doc__
+        pooled_db = hospital.database.HospitalDatabase(db_path, pool_size=1, pool_timeout=0.1)
+        page_size = hospital.database.STREAM_PAGE_SIZE
+        hospital.database.STREAM_PAGE_SIZE = 2
+        try:
+            nurses = pooled_db.iter_nurses_list(['id'])
+            first = next(nurses)
+            self.assertEquals(pooled_db.pool_stats()['in_use'], 0)
+            # The only connection is free for the other requests
+            self.assertIsNotNone(pooled_db.get_nurse('nur-1'))
+            self.assertEquals([first] + list(nurses), pooled_db.get_nurses_list(fields=['id']))
+            self.assertEquals(list(pooled_db.iter_nurses_patient_list('nur-1')),
+                              pooled_db.get_nurses_patient_list('nur-1'))
+            self.assertEquals(list(pooled_db.iter_patient_medication_list('pat-1')),
+                              pooled_db.get_patient_medication_list('pat-1'))
+        finally:
+            hospital.database.STREAM_PAGE_SIZE = page_size
+            pooled_db.close()
+
+    def test_resize_pool(self):
+        '''
+        Check that the pool can be given as many connections as threads
+        '''
+        print '('+self.test_resize_pool.__name__+')', self.test_resize_pool.__doc__
+        pooled_db = hospital.database.HospitalDatabase(db_path, pool_size=1)
+        pooled_db.get_nurse('nur-1')
+        pooled_db.resize_pool(50)
+        self.assertEquals(pooled_db.pool_stats()['size'], 50)
+        self.assertEquals(pooled_db.pool_stats()['open'], 0)
+        self.assertIsNotNone(pooled_db.get_nurse('nur-1'))
+        self.assertRaises(ValueError, pooled_db.resize_pool, 0)
+        pooled_db.close()
+
+    def test_connections_are_configured(self):
+        '''
+        Check that the pooled connections have the foreign keys on
+        '''
+        print '('+self.test_connections_are_configured.__name__+')', self.test_connections_are_configured.__doc__
+        with db.connection() as con:
+            data = con.execute('PRAGMA foreign_keys').fetchone()
+        self.assertEquals(tuple(data), (1,))
+
+    def test_conditional_write_single_checkout(self):
+        '''
+        Check that modifying an existing or unexisting nurse costs one connection checkout
+        '''
+        print '('+self.test_conditional_write_single_checkout.__name__+')', self.test_conditional_write_single_checkout.__doc__
+        checkouts = db.pool_stats()['checkouts']
+        self.assertEquals(db.modify_nurse('nur-1', "new name", "new surname", "new phone", "new address"), 'nur-1')
+        self.assertIsNone(db.modify_nurse('nur-5', "new name", "new surname", "new phone", "new address"))
+        self.assertEquals(db.pool_stats()['checkouts'], checkouts + 2)
+
+    def test_checkout_timeout(self):
+        '''
+        Check that a checkout fails when all the connections are in use
+        '''
+        print '('+self.test_checkout_timeout.__name__+')', self.test_checkout_timeout.__doc__
+        pooled_db = hospital.database.HospitalDatabase(db_path, pool_size=1, pool_timeout=0.05)
+        with pooled_db.connection():
+            with self.assertRaises(hospital.database.PoolTimeoutError):
+                pooled_db.get_nurse('nur-1')
+        self.assertEquals(pooled_db.pool_stats()['timeouts'], 1)
+        #The connection is available again
+        self.assertIsNotNone(pooled_db.get_nurse('nur-1'))
+        pooled_db.close()
+
+
+class StorageProfileTestCase(DatabaseAPITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_production_profile(self):
+        '''
+        Check that the production profile sets WAL mode, NORMAL synchronous and the busy timeout
+        '''
+        print '('+self.test_production_profile.__name__+')', self.test_production_profile.__doc__
+        wal_db = hospital.database.HospitalDatabase(db_path, profile='production')
+        status = wal_db.storage_status()
+        self.assertEquals(status['journal_mode'], 'WAL')
+        self.assertEquals(status['synchronous'], 'NORMAL')
+        self.assertEquals(status['busy_timeout'], 5000)
+        self.assertIsNotNone(wal_db.checkpoint('PASSIVE'))
+        wal_db.close()
+
+    def test_read_while_writing(self):
+        '''
+        Check that in WAL mode a reader is not blocked by an open write transaction
+        '''
+        print '('+self.test_read_while_writing.__name__+')', self.test_read_while_writing.__doc__
+        wal_db = hospital.database.HospitalDatabase(db_path, pool_size=2, profile='production')
+        with wal_db.connection() as con:
+            con.execute('UPDATE nurses_profile SET name = ? WHERE nurse_id = 1', ('writing',))
+            #The write transaction is still open
+            nurse = wal_db.get_nurse('nur-1')
+            self.assertEquals(nurse['name'], 'Jussi')
+        self.assertEquals(wal_db.get_nurse('nur-1')['name'], 'writing')
+        wal_db.close()
+
+    def test_unknown_profile(self):
+        '''
+        Check that an unknown profile name raises ValueError
+        '''
+        print '('+self.test_unknown_profile.__name__+')', self.test_unknown_profile.__doc__
+        with self.assertRaises(ValueError):
+            hospital.database.HospitalDatabase(db_path, profile='unknown')
+
+
+class MigrationTestCase(DatabaseAPITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_schema_version(self):
+        '''
+        Check that a new database is created with the latest schema version
+        '''
+        print '('+self.test_schema_version.__name__+')', self.test_schema_version.__doc__
+        self.assertEquals(db.schema_version(), hospital.migrations.latest_version())
+        #Nothing else to apply
+        self.assertEquals(db.migrate(), [])
+
+    def test_foreign_key_indexes(self):
+        '''
+        Check that the patients of a nurse and the medication of a patient are found through an index
+        '''
+        print '('+self.test_foreign_key_indexes.__name__+')', self.test_foreign_key_indexes.__doc__
+        with db.connection() as con:
+            plan = con.execute('EXPLAIN QUERY PLAN SELECT * FROM patients_profile WHERE p_nurse = 1').fetchall()
+            self.assertIn('patients_profile_p_nurse_idx', ' '.join(row[-1] for row in plan))
+            plan = con.execute('EXPLAIN QUERY PLAN SELECT * FROM medicaments WHERE m_patient = 1').fetchall()
+            self.assertIn('medicaments_m_patient_idx', ' '.join(row[-1] for row in plan))
+
+    def test_upgrade_in_place(self):
+        '''
+        Check that a database at version 1 is upgraded keeping its data
+        '''
+        print '('+self.test_upgrade_in_place.__name__+')', self.test_upgrade_in_place.__doc__
+        with db.connection() as con:
+            con.execute('DROP INDEX patients_profile_p_nurse_idx')
+            con.execute('DROP INDEX patients_profile_p_doctor_idx')
+            con.execute('DROP INDEX medicaments_m_patient_idx')
+            con.execute('PRAGMA user_version = 1')
+        self.assertEquals(db.migrate(2), [2])
+        self.assertEquals(db.schema_version(), 2)
+        self.assertEquals(len(db.get_nurses_list()), 11)
+        with db.connection() as con:
+            indexes = con.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()
+        self.assertIn('medicaments_m_patient_idx', [row[0] for row in indexes])
+
+    def test_schema_dump_version(self):
+        '''
+        Check that a database created from the schema dump has the latest version and nothing to migrate
+        '''
+        print '('+self.test_schema_dump_version.__name__+')', self.test_schema_dump_version.__doc__
+        dump_path = 'db/hospital_dump_test.db'
+        if os.path.exists(dump_path):
+            os.remove(dump_path)
+        dump_db = hospital.database.HospitalDatabase(dump_path)
+        try:
+            dump_db.create_tables_from_dump()
+            self.assertEquals(dump_db.schema_version(), hospital.migrations.latest_version())
+            self.assertEquals(dump_db.migrate(), [])
+            self.assertIsNotNone(dump_db.append_nurse('Dump', 'Nurse', 1, 'Address'))
+        finally:
+            dump_db.clean()
+
+    def test_row_versions(self):
+        '''
+        Check that the row and table versions grow with every write, cascades included
+        '''
+        print '('+self.test_row_versions.__name__+')', self.test_row_versions.__doc__
+        self.assertGreaterEqual(db.schema_version(), 3)
+        version = db.get_nurse_version('nur-1')
+        nurses = db.get_nurses_version()
+        db.modify_nurse('nur-1', 'new name', 'new surname', 1, 'new address')
+        self.assertEquals(db.get_nurse_version('nur-1'), version + 1)
+        self.assertGreater(db.get_nurses_version(), nurses)
+        self.assertIsNone(db.get_nurse_version('nur-500'))
+        patients = db.get_patients_version()
+        medicaments = db.get_medicaments_version()
+        db.delete_nurse('nur-1')
+        self.assertGreater(db.get_patients_version(), patients)
+        self.assertGreater(db.get_medicaments_version(), medicaments)
+
+
+class RecordTestCase(DatabaseAPITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_record_mapping(self):
+        '''
+        Check that the records returned by the database behave as read only dictionaries
+        '''
+        print '('+self.test_record_mapping.__name__+')', self.test_record_mapping.__doc__
+        patient = db.get_patient('pat-0')
+        self.assertIsInstance(patient, hospital.database.Record)
+        self.assertEquals(patient['nurse id'], 'nur-1')
+        self.assertEquals(patient.raw('nurse id'), 1)
+        self.assertEquals(patient, patient.as_dict())
+        self.assertEquals(sorted(patient.keys()), sorted(hospital.database.PATIENT_FIELDS.keys()))
+        self.assertIsNone(patient.get('salary'))
+        with self.assertRaises(TypeError):
+            patient['name'] = 'Other'
+        with self.assertRaises(AttributeError):
+            patient._values = ()
+        # The records do not have a __dict__ per instance
+        self.assertFalse(hasattr(patient, '__dict__'))
+
+    def test_records_are_shared(self):
+        '''
+        Check that the records are returned without copies and that a write stores a new record
+        '''
+        print '('+self.test_records_are_shared.__name__+')', self.test_records_are_shared.__doc__
+        memdb = hospital.database.HospitalNonPersistentDatabase()
+        memdb.load_init_values()
+        nurse = memdb.get_nurse('nur-1')
+        self.assertIs(memdb.get_nurse('nur-1'), nurse)
+        self.assertIs([item for item in memdb.get_nurses_list() if item['id'] == 'nur-1'][0], nurse)
+        self.assertIs(copy.deepcopy(nurse), nurse)
+        memdb.modify_nurse('nur-1', 'new name', 'new surname', 1, 'new address')
+        # The record read before the write does not change
+        self.assertEquals(nurse['name'], 'Jussi')
+        self.assertEquals(memdb.get_nurse('nur-1')['name'], 'new name')
+
+    def test_records_share_layout(self):
+        '''
+        Check that the records of a list share their layout and keep the rows of the cursor
+        '''
+        print '('+self.test_records_share_layout.__name__+')', self.test_records_share_layout.__doc__
+        nurses = db.get_nurses_list(fields=['id', 'name'])
+        self.assertTrue(all(nurse._layout is nurses[0]._layout for nurse in nurses))
+        self.assertTrue(all(type(nurse._values) is tuple for nurse in nurses))
+        self.assertEquals(nurses[0].project(hospital.database.get_layout(hospital.database.NURSE_FIELDS, ['name'])),
+                          {'name': nurses[0]['name']})
+
+
+class ChangeFeedTestCase(DatabaseAPITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_changes_since(self):
+        '''
+        Check that only the last change of the objects changed after a sequence number is returned
+        '''
+        print '('+self.test_changes_since.__name__+')', self.test_changes_since.__doc__
+        since = db.get_change_sequence()
+        self.assertEquals(db.get_changes(since), [])
+        db.modify_nurse('nur-1', 'new name', 'new surname', 1, 'new address')
+        db.modify_patient('pat-0', 'new name', 'new surname', 1, 1, 'new address')
+        db.modify_nurse('nur-1', 'other name', 'new surname', 1, 'new address')
+        changes = db.get_changes(since)
+        self.assertEquals([(change['entity'], change['id']) for change in changes],
+                          [('patients', 'pat-0'), ('nurses', 'nur-1')])
+        self.assertEquals(changes[1]['item']['name'], 'other name')
+        self.assertFalse(changes[1]['deleted'])
+        self.assertEquals(changes[1]['sequence'], db.get_change_sequence())
+        self.assertEquals(len(db.get_changes(since, 1)), 1)
+        self.assertRaises(ValueError, db.get_changes, -1)
+
+    def test_cascade_tombstones(self):
+        '''
+        Check that deleting a patient records a tombstone for it and for its medication
+        '''
+        print '('+self.test_cascade_tombstones.__name__+')', self.test_cascade_tombstones.__doc__
+        since = db.get_change_sequence()
+        medication = [medicament['id'] for medicament in db.get_patient_medication_list('pat-1')]
+        db.delete_patient('pat-1')
+        changes = db.get_changes(since)
+        self.assertTrue(all(change['deleted'] and change['item'] is None for change in changes))
+        self.assertEquals(sorted(change['id'] for change in changes), sorted(medication + ['pat-1']))
+        # Every object is created once
+        self.assertEquals(len(db.get_changes(0)), len(set((c['entity'], c['id']) for c in db.get_changes(0))))
+
+
+class NurseWardTestCase(DatabaseAPITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_get_nurse_ward(self):
+        '''
+        Check that the ward of a nurse has the same patients and medication as the lists
+        '''
+        print '('+self.test_get_nurse_ward.__name__+')', self.test_get_nurse_ward.__doc__
+        for dbase in (db, hospital.database.HospitalNonPersistentDatabase()):
+            if dbase is not db:
+                dbase.clean()
+                dbase.load_init_values()
+            for nurseid in ('nur-0', 'nur-1'):
+                nurse, patients = dbase.get_nurse_ward(nurseid)
+                self.assertEquals(nurse, dbase.get_nurse(nurseid))
+                self.assertEquals([patient for patient, medication in patients],
+                                  dbase.get_nurses_patient_list(nurseid))
+                for patient, medication in patients:
+                    self.assertEquals(medication, dbase.get_patient_medication_list(patient['id']))
+            self.assertIsNone(dbase.get_nurse_ward('nur-500'))
+
+    def test_nurse_ward_without_patients(self):
+        '''
+        Check the ward of a nurse without patients
+        '''
+        print '('+self.test_nurse_ward_without_patients.__name__+')', self.test_nurse_ward_without_patients.__doc__
+        nurseid = db.append_nurse('New', 'Nurse', 1, 'Address')
+        nurse, patients = db.get_nurse_ward(nurseid)
+        self.assertEquals(nurse['name'], 'New')
+        self.assertEquals(patients, [])
+
+
+class RelatedItemsTestCase(DatabaseAPITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_get_related_items(self):
+        '''
+        Check that the related objects of many ids are read at once, sorted and limited per id
+        '''
+        print '('+self.test_get_related_items.__name__+')', self.test_get_related_items.__doc__
+        for dbase in (db, hospital.database.HospitalNonPersistentDatabase()):
+            if dbase is not db:
+                dbase.clean()
+                dbase.load_init_values()
+            patients = dbase.get_related_items('patients', 'nurse id', [0, 1], ['name'])
+            self.assertEquals(patients, sorted(dbase.get_nurses_patient_list('nur-0', fields=['nurse id', 'name']) +
+                                               dbase.get_nurses_patient_list('nur-1', fields=['nurse id', 'name']),
+                                               key=lambda patient: patient.raw('nurse id')))
+            limited = dbase.get_related_items('patients', 'nurse id', [0, 1], limit=1)
+            self.assertEquals([patient['nurse id'] for patient in limited], ['nur-0', 'nur-1'])
+            doctors = dbase.get_related_items('doctors', 'id', [1, 1, None])
+            self.assertEquals([doctor['id'] for doctor in doctors], ['doc-1'])
+            self.assertRaises(ValueError, dbase.get_related_items, 'patients', 'salary', [1])
+            self.assertRaises(ValueError, dbase.get_related_items, 'wards', 'id', [1])
+
+
+class InMemoryDatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.memdb = hospital.database.HospitalNonPersistentDatabase()
+        self.memdb.load_init_values()
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_instances_are_independent(self):
+        '''
+        Check that every in memory database has its own objects and ids
+        '''
+        print '('+self.test_instances_are_independent.__name__+')', self.test_instances_are_independent.__doc__
+        other = hospital.database.HospitalNonPersistentDatabase()
+        other.load_init_values()
+        self.assertEquals(self.memdb.append_nurse('New', 'Nurse', 1, 'Address'), 'nur-2')
+        self.assertEquals(self.memdb.append_nurse('Other', 'Nurse', 1, 'Address'), 'nur-3')
+        self.assertEquals(len(other.get_nurses_list()), 2)
+        self.assertEquals(other.append_nurse('New', 'Nurse', 1, 'Address'), 'nur-2')
+        # The ids are not reused
+        self.memdb.delete_nurse('nur-3')
+        self.assertEquals(self.memdb.append_nurse('Last', 'Nurse', 1, 'Address'), 'nur-4')
+
+    def test_cascade_through_indexes(self):
+        '''
+        Check that deleting a nurse deletes their patients and their medication
+        '''
+        print '('+self.test_cascade_through_indexes.__name__+')', self.test_cascade_through_indexes.__doc__
+        self.assertEquals([patient['id'] for patient in self.memdb.get_nurses_patient_list('nur-0')], ['pat-1'])
+        medicamentid = self.memdb.append_medication('Ibuprofen', '600mg', '3 days', 'every 8 hours', '0 ml', 'oral',
+                                                    'pat-1')
+        self.assertEquals(len(self.memdb.get_patient_medication_list('pat-1')), 3)
+        self.assertEquals(self.memdb.delete_nurse('nur-0'), 'nur-0')
+        self.assertFalse(self.memdb.contains_patient('pat-1'))
+        self.assertFalse(self.memdb.contains_medicament(medicamentid))
+        self.assertEquals(self.memdb.get_patient_medication_list('pat-1'), [])
+        self.assertEquals(self.memdb.get_nurses_patient_list('nur-0'), [])
+        self.assertIsNone(self.memdb.append_medication('Ibuprofen', '600mg', '3 days', 'every 8 hours', '0 ml',
+                                                       'oral', 'pat-1'))
+
+    def test_concurrent_writes(self):
+        '''
+        Check that threads appending and deleting medicaments keep the objects and the indexes consistent
+        '''
+        print '('+self.test_concurrent_writes.__name__+')', self.test_concurrent_writes.__doc__
+        created = []
+        def worker():
+            for i in range(100):
+                medicamentid = self.memdb.append_medication('M', '1', '1 day', 'every hour', '0 ml', 'oral', 'pat-0')
+                created.append(medicamentid)
+                if i % 2:
+                    self.memdb.delete_medicament(medicamentid)
+        threads = [threading.Thread(target=worker) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(len(set(created)), 800)
+        self.assertEquals(len(self.memdb.get_patient_medication_list('pat-0')), 400)
+
+
+class DueDosesTestCase(DatabaseAPITestCase):
+    now = 1500000000
+
+    def setUp(self):
+        # The schedules of the loaded medicaments start now
+        db.clock = lambda: self.now
+        super(DueDosesTestCase, self).setUp()
+
+    def tearDown(self):
+        super(DueDosesTestCase, self).tearDown()
+        del db.clock
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def doses_of(self, dbase, medicamentid, hours=12):
+        return [dose.raw('due time') for dose in dbase.get_due_doses(self.now, self.now + hours * 3600)
+                if dose['medicament id'] == medicamentid]
+
+    def test_due_doses(self):
+        '''
+        Check that the doses due are sorted, in the period and of the patients of the nurse
+        '''
+        print '('+self.test_due_doses.__name__+')', self.test_due_doses.__doc__
+        memdb = hospital.database.HospitalNonPersistentDatabase()
+        memdb.clock = lambda: self.now
+        memdb.load_init_values()
+        for dbase in (db, memdb):
+            #med-0 is given every 8 hours
+            self.assertEquals(self.doses_of(dbase, 'med-0'), [self.now, self.now + 8 * 3600])
+            doses = dbase.get_due_doses(self.now, self.now + 24 * 3600)
+            keys = [(dose.raw('due time'), dose.raw('medicament id')) for dose in doses]
+            self.assertEquals(keys, sorted(keys))
+            self.assertTrue(all(self.now <= key[0] < self.now + 24 * 3600 for key in keys))
+            nurse = dbase.get_due_doses(self.now, self.now + 24 * 3600, 'nur-0')
+            self.assertTrue(nurse)
+            self.assertTrue(all(dose['nurse id'] == 'nur-0' for dose in nurse))
+            self.assertEquals([dose for dose in doses if dose['nurse id'] == 'nur-0'], nurse)
+            self.assertEquals(dbase.get_due_doses(self.now, self.now + 24 * 3600, limit=2), doses[:2])
+            self.assertEquals(dbase.get_due_doses(self.now, self.now + 24 * 3600, 'nur-500'), [])
+            self.assertRaises(ValueError, dbase.get_due_doses, self.now, self.now + 1, limit=-1)
+
+    def test_due_doses_use_indexes(self):
+        '''
+        Check that the doses due are a range of the indexes of the doses
+        '''
+        print '('+self.test_due_doses_use_indexes.__name__+')', self.test_due_doses_use_indexes.__doc__
+        with db.connection() as con:
+            plan = con.execute('EXPLAIN QUERY PLAN SELECT * FROM doses WHERE nurse_id = 1 AND due_time >= 1 \
+                                AND due_time < 2 ORDER BY due_time, medicament_id').fetchall()
+            plan = ' '.join(row[-1] for row in plan)
+            self.assertIn('doses_nurse_due_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+            plan = con.execute('EXPLAIN QUERY PLAN SELECT * FROM doses WHERE due_time >= 1 \
+                                AND due_time < 2 ORDER BY due_time, medicament_id').fetchall()
+            self.assertIn('doses_due_idx', ' '.join(row[-1] for row in plan))
+
+    def test_doses_follow_writes(self):
+        '''
+        Check that the doses change with the medicaments, the nurse of the patients and the deletes
+        '''
+        print '('+self.test_doses_follow_writes.__name__+')', self.test_doses_follow_writes.__doc__
+        medicamentid = db.append_medication('Ibuprofen', '600 mg', '1 day', 'every 4 hours', None, 'oral', 1)
+        self.assertEquals(self.doses_of(db, medicamentid), [self.now + hour * 3600 for hour in (0, 4, 8)])
+        #The schedule keeps its start
+        self.now += 3600
+        db.modify_medicament(medicamentid, 'Ibuprofen', '600 mg', '1 day', 'every 6 hours', None, 'oral')
+        self.assertEquals(self.doses_of(db, medicamentid), [self.now + 5 * 3600, self.now + 11 * 3600])
+        db.modify_medicament(medicamentid, 'Ibuprofen', '600 mg', '1 day', 'when needed', None, 'oral')
+        self.assertEquals(self.doses_of(db, medicamentid), [])
+        ids = db.append_medications([('Omeprazol', '20 mg', '2 days', 'once a day', None, 'oral', 1)])
+        self.assertEquals(self.doses_of(db, ids[0], 48), [self.now, self.now + 86400])
+        #The doses follow the nurse of the patient
+        nurse = db.get_patient('pat-1')['nurse id']
+        with db.connection() as con:
+            con.execute('UPDATE patients_profile SET p_nurse = 2 WHERE patient_id = 1')
+        self.assertIn(ids[0], [dose['medicament id'] for dose in db.get_due_doses(self.now, self.now + 1, 'nur-2')])
+        self.assertNotIn(ids[0], [dose['medicament id'] for dose in db.get_due_doses(self.now, self.now + 1, nurse)])
+        db.delete_medicament(ids[0])
+        self.assertEquals(self.doses_of(db, ids[0], 48), [])
+        db.delete_nurse('nur-2')
+        self.assertEquals(db.get_due_doses(self.now, self.now + 86400, 'nur-2'), [])
+        with db.connection() as con:
+            orphans = con.execute('SELECT COUNT(*) FROM doses WHERE medicament_id NOT IN \
+                                   (SELECT medicament_id FROM medicaments)').fetchone()[0]
+        self.assertEquals(orphans, 0)
+
+    def test_upgrade_writes_doses(self):
+        '''
+        Check that upgrading a database without schedules writes the doses of its medicaments
+        '''
+        print '('+self.test_upgrade_writes_doses.__name__+')', self.test_upgrade_writes_doses.__doc__
+        with db.connection() as con:
+            con.execute('DROP TABLE doses')
+            con.execute('DROP TABLE medication_schedules')
+            con.execute('PRAGMA user_version = %d' % (hospital.migrations.SCHEDULES_VERSION - 1))
+        self.assertEquals(db.migrate(), [hospital.migrations.SCHEDULES_VERSION])
+        self.assertEquals(self.doses_of(db, 'med-0'), [self.now, self.now + 8 * 3600])
+
+    def test_doses_after_horizon(self):
+        '''
+        Check that the doses of schedules without duration, or with too many doses, continue after the first week
+        '''
+        print '('+self.test_doses_after_horizon.__name__+')', self.test_doses_after_horizon.__doc__
+        memdb = hospital.database.HospitalNonPersistentDatabase()
+        memdb.clock = lambda: self.now
+        memdb.load_init_values()
+        written = self.now
+        for dbase in (db, memdb):
+            daily = dbase.append_medication('Omeprazol', '20 mg', 'until further notice', 'once a day', None,
+                                            'oral', 1)
+            minutes = dbase.append_medication('Saline', '1 ml', '1 month', 'every minute', None, 'iv', 1)
+            self.now = written + 20 * 86400
+            self.assertEquals(self.doses_of(dbase, minutes, 1), [self.now + minute * 60 for minute in range(60)])
+            self.now = written + 29 * 86400
+            self.assertEquals(len(self.doses_of(dbase, minutes, 48)), 24 * 60)
+            self.now = written + 30 * 86400
+            self.assertEquals(self.doses_of(dbase, daily, 48), [written + 30 * 86400, written + 31 * 86400])
+            # Read again, the doses are only written once
+            self.assertEquals(self.doses_of(dbase, daily, 48), [written + 30 * 86400, written + 31 * 86400])
+            # The doses cannot be read, nor written, too far ahead
+            self.assertRaises(ValueError, dbase.get_due_doses, self.now,
+                              self.now + hospital.schedule.MAX_AHEAD + 1)
+            self.now = written
+        with db.connection() as con:
+            # The doses of the days that passed without reading them are not written
+            count = con.execute('SELECT COUNT(*) FROM doses d JOIN medication_schedules s \
+                                 ON s.medicament_id = d.medicament_id WHERE s.duration_seconds IS NULL \
+                                 AND d.due_time >= ? AND d.due_time < ?',
+                                (written + hospital.schedule.OPEN_HORIZON, written + 20 * 86400)).fetchone()[0]
+        self.assertEquals(count, 0)
+
 if __name__ == '__main__':
     print 'Start running tests'
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,88 @@
+import unittest, json
+
+import hospital.encoders as encoders
+
+# Values that can be represented as JSON
+VALUES = [None, True, False, 0, 1, 127, 128, 255, 256, 65536, 2 ** 32, 2 ** 64 - 1, -1, -32, -33, -128, -129,
+          -2 ** 15 - 1, -2 ** 31 - 1, -2 ** 63, 1.5, -0.25, u'', u'a', u'\xf1and\xfa' * 20, u'x' * 70000,
+          range(20), range(70000), [], {}, {u'name': u'Anna', u'room': 12, u'link': {u'rel': u'self'}},
+          dict((u'key %d' % i, i) for i in range(20))]
+
+
+class EncodersTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_round_trip(self):
+        '''
+        Check that the decoded values are the encoded ones, like with JSON
+        '''
+        print '('+self.test_round_trip.__name__+')', self.test_round_trip.__doc__
+        for dumps, loads in ((encoders.msgpack_dumps, encoders.msgpack_loads),
+                             (encoders.cbor_dumps, encoders.cbor_loads)):
+            for value in VALUES:
+                self.assertEquals(loads(dumps(value)), value)
+                self.assertEquals(loads(dumps(value)), json.loads(json.dumps(value)))
+            # str are encoded as text
+            self.assertEquals(loads(dumps({'name': 'nur-1'})), {u'name': u'nur-1'})
+            self.assertEquals(loads(dumps((1, 2))), [1, 2])
+            self.assertRaises(TypeError, dumps, object())
+            self.assertRaises(ValueError, dumps, 2 ** 64)
+
+    def test_known_encodings(self):
+        '''
+        Check the encodings of the MessagePack and CBOR specifications
+        '''
+        print '('+self.test_known_encodings.__name__+')', self.test_known_encodings.__doc__
+        self.assertEquals(encoders.msgpack_dumps({u'a': 1}), '\x81\xa1a\x01')
+        self.assertEquals(encoders.msgpack_dumps([-1, 200, None]), '\x93\xff\xcc\xc8\xc0')
+        self.assertEquals(encoders.cbor_dumps([1, [2, 3]]), '\x82\x01\x82\x02\x03')
+        self.assertEquals(encoders.cbor_dumps(1000000), '\x1a\x00\x0f\x42\x40')
+        self.assertEquals(encoders.cbor_dumps(-1000), '\x39\x03\xe7')
+        self.assertEquals(encoders.cbor_dumps(u'\xfc'), '\x62\xc3\xbc')
+        # Half and single floats, indefinite lengths and tags are decoded
+        self.assertEquals(encoders.cbor_loads('\xf9\x3c\x00'), 1.0)
+        self.assertEquals(encoders.cbor_loads('\xf9\xc4\x00'), -4.0)
+        self.assertEquals(encoders.cbor_loads('\xfa\x47\xc3\x50\x00'), 100000.0)
+        self.assertEquals(encoders.cbor_loads('\x9f\x01\x82\x02\x03\xff'), [1, [2, 3]])
+        self.assertEquals(encoders.cbor_loads('\xbf\x61a\x01\xff'), {u'a': 1})
+        self.assertEquals(encoders.cbor_loads('\x7f\x62ab\x61c\xff'), u'abc')
+        self.assertEquals(encoders.cbor_loads('\xc1\x1a\x51\x4b\x67\xb0'), 1363896240)
+        self.assertEquals(encoders.msgpack_loads('\xca\x3f\xc0\x00\x00'), 1.5)
+        self.assertEquals(encoders.msgpack_loads('\xc4\x02ab'), 'ab')
+
+    def test_invalid_data(self):
+        '''
+        Check that truncated, extra or unsupported data raises ValueError
+        '''
+        print '('+self.test_invalid_data.__name__+')', self.test_invalid_data.__doc__
+        for loads, data in ((encoders.msgpack_loads, '\x92\x01'), (encoders.msgpack_loads, '\x01\x02'),
+                            (encoders.msgpack_loads, '\xc1'), (encoders.msgpack_loads, '\xa2\xff\xfe'),
+                            (encoders.msgpack_loads, '\x81\x90\x01'), (encoders.msgpack_loads, ''),
+                            (encoders.cbor_loads, '\x82\x01'), (encoders.cbor_loads, '\x01\x02'),
+                            (encoders.cbor_loads, '\x1c'), (encoders.cbor_loads, '\xff'),
+                            (encoders.cbor_loads, '\xbf\x01\xff'), (encoders.cbor_loads, '\x9f\x01')):
+            self.assertRaises(ValueError, loads, data)
+
+    def test_hostile_data(self):
+        '''
+        Check that deep nesting and indefinite strings of other items raise ValueError
+        '''
+        print '('+self.test_hostile_data.__name__+')', self.test_hostile_data.__doc__
+        for loads, data in ((encoders.cbor_loads, '\x7f\x01\xff'), (encoders.cbor_loads, '\x5f\x61a\xff'),
+                            (encoders.cbor_loads, '\x7f\x7f\xff\xff'),
+                            (encoders.msgpack_loads, '\x91' * 5000 + '\xc0'),
+                            (encoders.msgpack_loads, '\x81\xc0' * 5000 + '\xc0'),
+                            (encoders.cbor_loads, '\x81' * 5000 + '\xf6'),
+                            (encoders.cbor_loads, '\x9f' * 5000 + '\xf6'),
+                            (encoders.cbor_loads, '\xc1' * 5000 + '\xf6')):
+            self.assertRaises(ValueError, loads, data)
+        depth = encoders.MAX_DEPTH
+        self.assertEquals(encoders.msgpack_loads('\x91' * depth + '\xc0'), reduce(lambda v, i: [v], range(depth), None))
+        self.assertEquals(encoders.cbor_loads('\x81' * depth + '\xf6'), reduce(lambda v, i: [v], range(depth), None))
+
+if __name__ == '__main__':
+    print 'Start running tests'
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest, os, time
+from StringIO import StringIO
+
+import hospital.database
+import hospital.importer as importer
+
+db_path = 'db/hospital_test.db'
+db = hospital.database.HospitalDatabase(db_path)
+
+class ImporterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        db.load_init_values()
+
+    def tearDown(self):
+        db.clean()
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_import_nurses_ndjson(self):
+        '''
+        Import nurses from NDJSON in batches of 2 and check the progress reports
+        '''
+        print '('+self.test_import_nurses_ndjson.__name__+')', self.test_import_nurses_ndjson.__doc__
+        lines = ['{"name": "N%d", "surname": "S%d", "phone_number": %d, "address": "A"}' % (i, i, i) for i in range(5)]
+        progress = []
+        report = importer.import_stream(db, 'nurses', StringIO('\n'.join(lines)), 'ndjson', batch_size=2,
+                                        progress=lambda r: progress.append(r.imported))
+        self.assertEquals(report.imported, 5)
+        self.assertEquals(report.rejected, 0)
+        self.assertEquals(report.batches, 3)
+        self.assertEquals(progress, [2, 4, 5])
+        self.assertEquals(len(db.get_nurses_list()), 16)
+
+    def test_import_rejects(self):
+        '''
+        Check that malformed rows and rows referencing unknown patients are rejected
+        '''
+        print '('+self.test_import_rejects.__name__+')', self.test_import_rejects.__doc__
+        data = '\n'.join([
+            '{"name": "M1", "dosage": "1", "duration": "2 days", "hours": "every 8 hours", "bag_volume": "1", "administration": "oral", "patient_id": "pat-1"}',
+            'not json',
+            '{"name": "M2"}',
+            '{"name": "M3", "dosage": "1", "duration": "2 days", "hours": "every 8 hours", "bag_volume": "1", "administration": "oral", "patient_id": "pat-999"}',
+        ])
+        report = importer.import_stream(db, 'medicaments', StringIO(data), 'ndjson')
+        self.assertEquals(report.read, 4)
+        self.assertEquals(report.imported, 1)
+        self.assertEquals(report.rejected, 3)
+        self.assertEquals([reject['line'] for reject in report.rejects], [2, 3, 4])
+        self.assertEquals(len(db.get_patient_medication_list('pat-1')), 4)
+
+    def test_import_patients_csv(self):
+        '''
+        Import patients from CSV with explicit ids, a duplicated id is rejected
+        '''
+        print '('+self.test_import_patients_csv.__name__+')', self.test_import_patients_csv.__doc__
+        data = 'id,name,surname,room,phone_number,address,nurse_id,doctor_id\n' \
+               'pat-500,Ana,Lopez,12,,Calle 1,nur-1,doc-0\n' \
+               'pat-0,Dup,Licated,13,,Calle 2,nur-1,doc-0\n'
+        report = importer.import_stream(db, 'patients', StringIO(data), 'csv')
+        self.assertEquals(report.imported, 1)
+        self.assertEquals(report.rejected, 1)
+        patient = db.get_patient('pat-500')
+        self.assertEquals(patient['name'], 'Ana')
+        self.assertEquals(patient['room'], 12)
+        self.assertEquals(patient['nurse id'], 'nur-1')
+
+    def test_import_out_of_range(self):
+        '''
+        Check that ids and numbers out of the 64 bit range reject their row, not the whole batch
+        '''
+        print '('+self.test_import_out_of_range.__name__+')', self.test_import_out_of_range.__doc__
+        data = '\n'.join([
+            '{"id": "pat-500", "name": "Ana", "surname": "Lopez", "room": 12, "phone_number": null, "address": "Calle 1", "nurse_id": "nur-1", "doctor_id": "doc-0"}',
+            '{"id": "pat-501", "name": "Big", "surname": "Nurse", "room": 13, "phone_number": null, "address": "Calle 2", "nurse_id": "nur-99999999999999999999", "doctor_id": "doc-0"}',
+            '{"id": "pat-502", "name": "Big", "surname": "Room", "room": 99999999999999999999, "phone_number": null, "address": "Calle 3", "nurse_id": "nur-1", "doctor_id": "doc-0"}',
+        ])
+        report = importer.import_stream(db, 'patients', StringIO(data), 'ndjson')
+        self.assertEquals(report.imported, 1)
+        self.assertEquals(report.rejected, 2)
+        self.assertEquals([reject['line'] for reject in report.rejects], [2, 3])
+        self.assertEquals(db.get_patient('pat-500')['name'], 'Ana')
+        self.assertIsNone(db.get_patient('pat-502'))
+
+    def test_import_medicaments_doses(self):
+        '''
+        Check that the imported medicaments get their doses, with and without explicit ids
+        '''
+        print '('+self.test_import_medicaments_doses.__name__+')', self.test_import_medicaments_doses.__doc__
+        data = 'id,name,dosage,duration,hours,bag_volume,administration,patient_id\n' \
+               'med-900,M1,1,1 day,every 8 hours,1,oral,pat-1\n' \
+               ',M2,1,1 day,twice a day,1,oral,pat-1\n' \
+               'med-0,Dup,1,1 day,every hour,1,oral,pat-1\n'
+        now = time.time()
+        report = importer.import_stream(db, 'medicaments', StringIO(data), 'csv')
+        self.assertEquals(report.imported, 2)
+        doses = db.get_due_doses(now - 60, now + 86400)
+        counts = {}
+        for dose in doses:
+            counts[dose['medicament id']] = counts.get(dose['medicament id'], 0) + 1
+        self.assertEquals(counts['med-900'], 3)
+        self.assertEquals(counts['med-901'], 2)
+
+if __name__ == '__main__':
+    print 'Start running tests'
+    unittest.main()
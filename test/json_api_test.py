@@ -2,9 +2,12 @@ import unittest, copy
 import json
 
 import flask
+import werkzeug.test, werkzeug.wrappers
 
 import hospital.resources as resources
+import hospital.compression
 import hospital.database
+import hospital.encoders
 
 db_path ='db/hospital_test.db'
 #For non persistent database
@@ -81,6 +84,23 @@ class NursesListTestCase (ResourcesAPITestCase):
                                 headers={"Content-Type":"application/json", 'Authorization':'Admin'})
         self.assertEquals(resp2.status_code, 200)
 
+    def test_add_nurses(self):
+        '''
+        Checks that a JSON array of nurses is added at once
+        '''
+        print '('+self.test_add_nurses.__name__+')', self.test_add_nurses.__doc__
+        nurses = [{u"name":u"platano", u"surname":u"amarillo", u"phone_number":100, u"address":u"canarias"},
+                  {u"name":u"pera", u"surname":u"verde", u"phone_number":200, u"address":u"asturias"}]
+        resp = self.client.post(self.url,
+                                data=json.dumps(nurses),
+                                headers={"Content-Type":"application/json", 'Authorization':'Admin'})
+        self.assertEquals(resp.status_code, 201)
+        nurses_list = json.loads(resp.data)['nurses_list']
+        self.assertEquals(len(nurses_list), 2)
+        resp2 = self.client.get(nurses_list[1]['link']['href'])
+        self.assertEquals(resp2.status_code, 200)
+        self.assertEquals(json.loads(resp2.data)['nurse']['name'], 'pera')
+
     def test_add_nurse_wrong(self):
         '''
         Try to add a nurse with wrong format
@@ -121,6 +141,18 @@ class NurseTestCase (ResourcesAPITestCase):
                                 headers={"Content-Type":"application/json", 'Authorization':'Admin'})
         self.assertEquals(resp.status_code, 404)
     
+    def test_wide_ids(self):
+        '''
+        Checks that the id in the url is not truncated and that ids out of range return 404
+        '''
+        print self.test_wide_ids.__doc__
+        self.assertEquals(self.client.get('/hospital/api/nurses/nur-1000/').status_code, 404)
+        self.assertEquals(self.client.get('/hospital/api/nurses/nur-99999999999999999999/').status_code, 404)
+        with resources.app.test_request_context('/hospital/api/nurses/nur-5000000000/'):
+            self.assertEquals(flask.request.view_args['nurseid'], 5000000000)
+            self.assertEquals(resources.api.url_for(resources.Nurses_profile, nurseid=5000000000),
+                              '/hospital/api/nurses/nur-5000000000/')
+
     def test_get_nurse(self):
         '''
         Checks that GET nurse_profile return correct status code and data format
@@ -519,6 +551,478 @@ class MedicamentTestCase (ResourcesAPITestCase):
                                 headers={"Content-Type":"application/json", 'Authorization':'Admin'})
         self.assertEquals(resp.status_code, 404)
    
+
+class ImportTestCase (ResourcesAPITestCase):
+
+    url = '/hospital/api/admin/import/nurses/'
+
+    @classmethod
+    def setUpClass(cls):
+        print 'Testing ImportTestCase'
+
+    def test_import_nurses(self):
+        '''
+        Checks that nurses sent as NDJSON are imported and the report is returned
+        '''
+        print self.test_import_nurses.__doc__
+        data = '{"name": "a", "surname": "b", "phone_number": 1, "address": "c"}\n{"name": "d"}\n'
+        resp = self.client.post(self.url + '?batch_size=10', data=data,
+                                headers={"Content-Type":"application/x-ndjson"})
+        self.assertEquals(resp.status_code, 200)
+        report = json.loads(resp.data)
+        self.assertEquals(report['imported'], 1)
+        self.assertEquals(report['rejected'], 1)
+        self.assertEquals(len(db.get_nurses_list()), 12)
+
+    def test_import_wrong_format(self):
+        '''
+        Checks that an unsupported content type is refused
+        '''
+        print self.test_import_wrong_format.__doc__
+        resp = self.client.post(self.url, data='{}', headers={"Content-Type":"application/xml"})
+        self.assertEquals(resp.status_code, 415)
+
+
+class PaginationTestCase (ResourcesAPITestCase):
+
+    url = '/hospital/api/nurses/'
+
+    @classmethod
+    def setUpClass(cls):
+        print 'Testing PaginationTestCase'
+
+    def test_follow_next_links(self):
+        '''
+        Checks that following the next links returns every nurse once
+        '''
+        print self.test_follow_next_links.__doc__
+        url = self.url + '?limit=5'
+        names = []
+        pages = 0
+        while url:
+            resp = self.client.get(url)
+            self.assertEquals(resp.status_code, 200)
+            data = json.loads(resp.data)
+            self.assertLessEqual(len(data['nurses_list']), 5)
+            names.extend(nurse['name'] for nurse in data['nurses_list'])
+            url = data['next']['href'] if 'next' in data else None
+            pages += 1
+        self.assertEquals(pages, 3)
+        self.assertEquals(len(names), 11)
+        self.assertEquals(len(set(names)), 11)
+
+    def test_wrong_page_arguments(self):
+        '''
+        Checks that a wrong limit or cursor return 400
+        '''
+        print self.test_wrong_page_arguments.__doc__
+        self.assertEquals(self.client.get(self.url + '?limit=0').status_code, 400)
+        self.assertEquals(self.client.get(self.url + '?limit=abc').status_code, 400)
+        self.assertEquals(self.client.get(self.url + '?cursor=!!!').status_code, 400)
+
+    def test_sparse_fieldsets(self):
+        '''
+        Checks that ?fields= selects the fields of the items and of the profiles
+        '''
+        print self.test_sparse_fieldsets.__doc__
+        resp = self.client.get(self.url + '?limit=5&fields=surname,phone_number')
+        self.assertEquals(resp.status_code, 200)
+        data = json.loads(resp.data)
+        for nurse in data['nurses_list']:
+            self.assertEquals(sorted(nurse.keys()), ['link', 'phone number', 'surname'])
+        self.assertIn('fields=', data['next']['href'])
+        resp = self.client.get(self.url + 'nur-1/?fields=name')
+        self.assertEquals(resp.status_code, 200)
+        self.assertNotIn('surname', json.loads(resp.data)['nurse'])
+        self.assertEquals(self.client.get(self.url + '?fields=salary').status_code, 400)
+        self.assertEquals(self.client.get(self.url + '?fields=').status_code, 400)
+
+
+class ConditionalGetTestCase (ResourcesAPITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print 'Testing ConditionalGetTestCase'
+
+    def test_not_modified(self):
+        '''
+        Checks that the resources answer If-None-Match with 304 until they change
+        '''
+        print self.test_not_modified.__doc__
+        for url in ('/hospital/api/nurses/', '/hospital/api/nurses/nur-1/',
+                    '/hospital/api/nurses/nur-1/patients/', '/hospital/api/nurses/nur-1/patients/pat-0/',
+                    '/hospital/api/nurses/nur-0/patients/pat-1/medication/',
+                    '/hospital/api/nurses/nur-0/patients/pat-1/medication/med-1/'):
+            resp = self.client.get(url)
+            self.assertEquals(resp.status_code, 200)
+            etag = resp.headers['ETag']
+            resp = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEquals(resp.status_code, 304)
+            self.assertEquals(resp.data, '')
+            self.assertEquals(resp.headers['ETag'], etag)
+
+    def test_compressed_not_modified(self):
+        '''
+        Checks that the weak ETag of a compressed response is answered with 304
+        '''
+        print self.test_compressed_not_modified.__doc__
+        client = werkzeug.test.Client(hospital.compression.CompressionMiddleware(resources.app, min_size=10),
+                                      werkzeug.wrappers.BaseResponse)
+        url = '/hospital/api/nurses/'
+        resp = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEquals(resp.headers['Content-Encoding'], 'gzip')
+        self.assertTrue(resp.headers['ETag'].startswith('W/'))
+        resp = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': resp.headers['ETag']})
+        self.assertEquals(resp.status_code, 304)
+
+    def test_modified(self):
+        '''
+        Checks that a modification or another representation change the ETag
+        '''
+        print self.test_modified.__doc__
+        url = '/hospital/api/nurses/nur-1/'
+        etag = self.client.get(url).headers['ETag']
+        self.assertNotEqual(self.client.get(url + '?fields=name').headers['ETag'], etag)
+        db.modify_nurse('nur-1', 'new name', 'new surname', 1, 'new address')
+        resp = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEquals(resp.status_code, 200)
+        self.assertNotEqual(resp.headers['ETag'], etag)
+        etag = self.client.get('/hospital/api/nurses/').headers['ETag']
+        db.delete_nurse('nur-2')
+        resp = self.client.get('/hospital/api/nurses/', headers={'If-None-Match': etag})
+        self.assertEquals(resp.status_code, 200)
+
+
+class StreamingTestCase (ResourcesAPITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print 'Testing StreamingTestCase'
+
+    def test_stream_nurses(self):
+        '''
+        Checks that the streamed nurses list has the same content as the normal one
+        '''
+        print self.test_stream_nurses.__doc__
+        url = '/hospital/api/nurses/'
+        #Enough nurses to need several chunks
+        db.append_nurses([("name %d" % i, "surname", i, "address") for i in range(500)])
+        resp = self.client.get(url + '?stream=true')
+        self.assertEquals(resp.status_code, 200)
+        self.assertTrue(resp.is_streamed)
+        self.assertEquals(json.loads(resp.data), json.loads(self.client.get(url).data))
+
+    def test_stream_patients(self):
+        '''
+        Checks that the streamed patients list keeps the envelope link
+        '''
+        print self.test_stream_patients.__doc__
+        url = '/hospital/api/nurses/nur-0/patients/'
+        resp = self.client.get(url + '?stream=1')
+        self.assertEquals(resp.status_code, 200)
+        self.assertEquals(json.loads(resp.data), json.loads(self.client.get(url).data))
+        #Stream of an empty list
+        db.delete_patient('pat-15')
+        resp = self.client.get('/hospital/api/nurses/nur-11/patients/?stream=1')
+        self.assertEquals(json.loads(resp.data)['nurses_patient_list'], [])
+
+    def test_stream_with_pagination(self):
+        '''
+        Checks that streaming can not be combined with pagination
+        '''
+        print self.test_stream_with_pagination.__doc__
+        resp = self.client.get('/hospital/api/nurses/?stream=true&limit=2')
+        self.assertEquals(resp.status_code, 400)
+
+    def test_stream_binary(self):
+        '''
+        Checks that streaming is refused when the negotiated representation is not JSON
+        '''
+        print self.test_stream_binary.__doc__
+        for url in ('/hospital/api/nurses/?stream=true', '/hospital/api/nurses/nur-0/patients/?stream=1',
+                    '/hospital/api/nurses/nur-0/patients/pat-1/medication/?stream=1'):
+            for mediatype in ('application/msgpack', 'application/cbor'):
+                resp = self.client.get(url, headers={'Accept': mediatype})
+                self.assertEquals(resp.status_code, 406)
+            resp = self.client.get(url, headers={'Accept': 'application/cbor;q=0.5, application/json'})
+            self.assertEquals(resp.status_code, 200)
+            self.assertTrue(resp.is_streamed)
+
+
+class ChangeFeedTestCase (ResourcesAPITestCase):
+
+    url = '/hospital/api/changes/'
+
+    @classmethod
+    def setUpClass(cls):
+        print 'Testing ChangeFeedTestCase'
+
+    def test_get_changes(self):
+        '''
+        Checks that the change feed returns the objects changed since a sequence number
+        '''
+        print self.test_get_changes.__doc__
+        resp = self.client.get(self.url)
+        self.assertEquals(resp.status_code, 200)
+        sequence = json.loads(resp.data)['sequence']
+        db.modify_nurse('nur-1', 'new name', 'new surname', 1, 'new address')
+        db.delete_medicament('med-1')
+        data = json.loads(self.client.get(self.url + '?since=%d' % sequence).data)
+        self.assertEquals(len(data['changes']), 2)
+        self.assertEquals(data['changes'][0]['item']['name'], 'new name')
+        self.assertEquals(data['changes'][1]['id'], 'med-1')
+        self.assertTrue(data['changes'][1]['deleted'])
+        self.assertNotIn('item', data['changes'][1])
+        self.assertEquals(data['sequence'], data['changes'][1]['sequence'])
+        self.assertNotIn('next', data)
+        data = json.loads(self.client.get(self.url + '?since=%d' % data['sequence']).data)
+        self.assertEquals(data['changes'], [])
+
+    def test_follow_changes(self):
+        '''
+        Checks the next links of the change feed and its wrong arguments
+        '''
+        print self.test_follow_changes.__doc__
+        url = self.url + '?limit=10'
+        count = 0
+        while url:
+            data = json.loads(self.client.get(url).data)
+            count += len(data['changes'])
+            url = data.get('next', {}).get('href')
+        self.assertEquals(count, len(db.get_changes(0)))
+        self.assertEquals(self.client.get(self.url + '?since=-1').status_code, 400)
+        self.assertEquals(self.client.get(self.url + '?limit=0').status_code, 400)
+        self.assertEquals(self.client.get(self.url + '?since=abc').status_code, 400)
+
+
+class NurseWardTestCase (ResourcesAPITestCase):
+
+    url = '/hospital/api/nurses/nur-0/ward/'
+
+    @classmethod
+    def setUpClass(cls):
+        print 'Testing NurseWardTestCase'
+
+    def test_get_ward(self):
+        '''
+        Checks that the ward embeds the nurse, their patients and their medication
+        '''
+        print self.test_get_ward.__doc__
+        resp = self.client.get(self.url)
+        self.assertEquals(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEquals(data['nurse']['id'], 'nur-0')
+        self.assertEquals(data['nurse']['link']['href'], '/hospital/api/nurses/nur-0/')
+        patients = db.get_nurses_patient_list('nur-0')
+        self.assertEquals([patient['id'] for patient in data['patients']], [patient['id'] for patient in patients])
+        for patient in data['patients']:
+            medication = db.get_patient_medication_list(patient['id'])
+            self.assertEquals([medicament['id'] for medicament in patient['medication']],
+                              [medicament['id'] for medicament in medication])
+        resp = self.client.get(self.url, headers={'If-None-Match': resp.headers['ETag']})
+        self.assertEquals(resp.status_code, 304)
+        self.assertEquals(self.client.get('/hospital/api/nurses/nur-500/ward/').status_code, 404)
+
+
+class DueDosesTestCase (ResourcesAPITestCase):
+
+    url = '/hospital/api/nurses/nur-0/doses/'
+    now = 1500000000
+
+    def setUp(self):
+        # The schedules of the loaded medicaments start now
+        db.clock = lambda: self.now
+        super(DueDosesTestCase, self).setUp()
+
+    def tearDown(self):
+        super(DueDosesTestCase, self).tearDown()
+        del db.clock
+
+    @classmethod
+    def setUpClass(cls):
+        print 'Testing DueDosesTestCase'
+
+    def test_get_nurse_doses(self):
+        '''
+        Checks that the doses due in the ward of a nurse are returned sorted and linked
+        '''
+        print self.test_get_nurse_doses.__doc__
+        resp = self.client.get(self.url + '?from=%d&within=%d' % (self.now, 24 * 3600))
+        self.assertEquals(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertEquals(data['from'], self.now)
+        self.assertEquals(data['until'], self.now + 24 * 3600)
+        self.assertFalse(data['truncated'])
+        self.assertEquals(data['nurse link']['href'], '/hospital/api/nurses/nur-0/')
+        doses = db.get_due_doses(self.now, self.now + 24 * 3600, 'nur-0')
+        self.assertEquals([(dose['due time'], dose['medicament id']) for dose in data['doses']],
+                          [(dose['due time'], dose['medicament id']) for dose in doses])
+        first = data['doses'][0]
+        self.assertEquals(first['due'], '2017-07-14T02:40:00Z')
+        self.assertEquals(first['link']['href'], '/hospital/api/nurses/nur-0/patients/%s/medication/%s/' %
+                          (first['patient id'], first['medicament id']))
+        self.assertEquals(self.client.get('/hospital/api/nurses/nur-500/doses/').status_code, 404)
+
+    def test_get_hospital_doses(self):
+        '''
+        Checks the doses due in all the wards, the limit and the wrong arguments
+        '''
+        print self.test_get_hospital_doses.__doc__
+        url = '/hospital/api/doses/?from=%d' % self.now
+        data = json.loads(self.client.get(url + '&limit=2').data)
+        self.assertEquals(len(data['doses']), 2)
+        self.assertTrue(data['truncated'])
+        data = json.loads(self.client.get(url).data)
+        self.assertEquals(len(data['doses']), len(db.get_due_doses(self.now, self.now + 3600)))
+        self.assertTrue(all(self.now <= dose['due time'] < self.now + 3600 for dose in data['doses']))
+        for arguments in ('within=0', 'within=%d' % (8 * 24 * 3600), 'limit=0', 'limit=100000', 'from=abc'):
+            self.assertEquals(self.client.get('/hospital/api/doses/?' + arguments).status_code, 400)
+        # The doses are not written for any time in the future
+        far = '?from=%d' % (self.now + 30 * 24 * 3600)
+        self.assertEquals(self.client.get('/hospital/api/doses/' + far).status_code, 400)
+        self.assertEquals(self.client.get(self.url + far).status_code, 400)
+
+
+class ExpandTestCase (ResourcesAPITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print 'Testing ExpandTestCase'
+
+    def test_expand_nurses(self):
+        '''
+        Checks that ?expand= embeds the patients of the nurses and their medication
+        '''
+        print self.test_expand_nurses.__doc__
+        resp = self.client.get('/hospital/api/nurses/?expand=patients.medication&limit=5')
+        self.assertEquals(resp.status_code, 200)
+        data = json.loads(resp.data)
+        self.assertIn('expand=patients.medication', data['next']['href'])
+        for nurse in data['nurses_list']:
+            nurseid = nurse['link']['href'].split('/')[-2]
+            patients = db.get_nurses_patient_list(nurseid)
+            self.assertEquals([patient['id'] for patient in nurse['patients']], [patient['id'] for patient in patients])
+            for patient in nurse['patients']:
+                medication = db.get_patient_medication_list(patient['id'])
+                self.assertEquals([medicament['id'] for medicament in patient['medication']],
+                                  [medicament['id'] for medicament in medication])
+
+    def test_expand_to_one(self):
+        '''
+        Checks that ?expand= embeds the doctor of a patient and the patient of a medicament
+        '''
+        print self.test_expand_to_one.__doc__
+        data = json.loads(self.client.get('/hospital/api/nurses/nur-1/patients/?expand=doctor&fields=name').data)
+        for patient in data['nurses_patient_list']:
+            self.assertEquals(patient['doctor']['id'], db.get_patient(patient['link']['href'].split('/')[-2])['doctor id'])
+            self.assertNotIn('doctor id', patient)
+        data = json.loads(self.client.get('/hospital/api/nurses/nur-0/patients/pat-1/medication/med-1/'
+                                          '?expand=patient.nurse').data)
+        self.assertEquals(data['medicament']['patient']['id'], 'pat-1')
+        self.assertEquals(data['medicament']['patient']['nurse']['id'], 'nur-0')
+
+    def test_expand_wrong(self):
+        '''
+        Checks that unknown relations, too deep paths and streams with ?expand= are rejected
+        '''
+        print self.test_expand_wrong.__doc__
+        for url in ('/hospital/api/nurses/?expand=doctors', '/hospital/api/nurses/?expand=patients.nurse.patients',
+                    '/hospital/api/nurses/nur-1/?expand=', '/hospital/api/nurses/?expand=patients&stream=true'):
+            self.assertEquals(self.client.get(url).status_code, 400)
+
+
+class LinkBuilderTestCase (ResourcesAPITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print 'Testing LinkBuilderTestCase'
+
+    def test_same_urls_as_url_for(self):
+        '''
+        Check that the compiled links are identical to the urls built by url_for
+        '''
+        print '('+self.test_same_urls_as_url_for.__name__+')', self.test_same_urls_as_url_for.__doc__
+        calls = [(resources.Nurses_list, {}),
+                 (resources.Nurses_profile, {'nurseid': 'nur-2'}),
+                 (resources.Nurses_profile, {'nurseid': 2}),
+                 (resources.Nurses_patient_profile, {'nurseid': 'nur-1', 'patientid': 'pat-10'}),
+                 (resources.Patient_medication, {'nurseid': 1, 'patientid': 'pat-2', 'medicamentid': 'med-3'}),
+                 (resources.Hospital_import, {'entity': 'nurses'}),
+                 (resources.Nurses_list, {'limit': 2, 'cursor': 'bnVyLTI', 'fields': None}),
+                 (resources.Nurses_patient_list, {'nurseid': 'nur-1', 'expand': 'doctor'})]
+        for script_name in ('', '/hospital_server'):
+            with resources.app.test_request_context('/hospital/api/nurses/',
+                                                    base_url='http://localhost%s/' % script_name):
+                for resource, values in calls:
+                    expected = resources.api.url_for(resource, **values)
+                    self.assertEquals(resources.links.url_for(resource, **values), expected)
+                    self.assertEquals(type(resources.links.url_for(resource, **values)), type(expected))
+                self.assertTrue(resources.links.url_for(resources.Nurses_list).startswith(script_name + '/hospital/'))
+
+
+class ContentNegotiationTestCase (ResourcesAPITestCase):
+
+    url = '/hospital/api/nurses/'
+    nurse_url = '/hospital/api/nurses/nur-1/patients/'
+
+    @classmethod
+    def setUpClass(cls):
+        print 'Testing ContentNegotiationTestCase'
+
+    def test_binary_representations(self):
+        '''
+        Check that Accept selects MessagePack or CBOR with the same data as JSON
+        '''
+        print '('+self.test_binary_representations.__name__+')', self.test_binary_representations.__doc__
+        for url in (self.url, self.nurse_url):
+            resp = self.client.get(url)
+            self.assertEquals(resp.headers['Content-Type'], 'application/json')
+            data = json.loads(resp.data)
+            etags = set([resp.headers['ETag']])
+            for mediatype, loads in (('application/msgpack', hospital.encoders.msgpack_loads),
+                                     ('application/x-msgpack', hospital.encoders.msgpack_loads),
+                                     ('application/cbor', hospital.encoders.cbor_loads)):
+                resp = self.client.get(url, headers={'Accept': mediatype})
+                self.assertEquals(resp.status_code, 200)
+                self.assertEquals(resp.headers['Content-Type'], mediatype)
+                self.assertEquals(resp.headers['Vary'], 'Accept')
+                self.assertEquals(loads(resp.data), data)
+                self.assertLess(len(resp.data), len(json.dumps(data)))
+                # Every representation has its own ETag
+                self.assertNotIn(resp.headers['ETag'], etags)
+                etags.add(resp.headers['ETag'])
+                resp = self.client.get(url, headers={'Accept': mediatype, 'If-None-Match': resp.headers['ETag']})
+                self.assertEquals(resp.status_code, 304)
+        # Errors are negotiated too, and JSON is the default
+        resp = self.client.get(self.url + 'nur-100/', headers={'Accept': 'application/cbor'})
+        self.assertEquals(resp.status_code, 404)
+        self.assertIn('message', hospital.encoders.cbor_loads(resp.data))
+        resp = self.client.get(self.url, headers={'Accept': 'text/html,*/*;q=0.8'})
+        self.assertEquals(resp.headers['Content-Type'], 'application/json')
+
+    def test_binary_bodies(self):
+        '''
+        Check that the bodies of POST and PUT can be MessagePack or CBOR
+        '''
+        print '('+self.test_binary_bodies.__name__+')', self.test_binary_bodies.__doc__
+        nurses = [{'name': 'platano', 'surname': 'amarillo', 'phone_number': 100, 'address': 'canarias'}]
+        resp = self.client.post(self.url, data=hospital.encoders.msgpack_dumps(nurses),
+                                headers={'Content-Type': 'application/msgpack'})
+        self.assertEquals(resp.status_code, 201)
+        nurse_url = json.loads(resp.data)['nurses_list'][0]['link']['href']
+        resp = self.client.post(self.url, data=hospital.encoders.cbor_dumps(nurses),
+                                headers={'Content-Type': 'application/cbor', 'Accept': 'application/cbor'})
+        self.assertEquals(resp.status_code, 201)
+        self.assertEquals(len(hospital.encoders.cbor_loads(resp.data)['nurses_list']), 1)
+        resp = self.client.get(nurse_url)
+        self.assertEquals(json.loads(resp.data)['nurse']['name'], 'platano')
+        resp = self.client.post(self.url, data='\x92\x01', headers={'Content-Type': 'application/msgpack'})
+        self.assertEquals(resp.status_code, 400)
+        for mediatype, data in (('application/cbor', '\x7f\x01\xff'), ('application/msgpack', '\x91' * 5000 + '\xc0'),
+                                ('application/cbor', '\x81' * 5000 + '\xf6')):
+            resp = self.client.post(self.url, data=data, headers={'Content-Type': mediatype})
+            self.assertEquals(resp.status_code, 400)
+
 if __name__ == '__main__':
     print 'Start running tests'
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,99 @@
+import unittest, json, logging, StringIO
+
+import hospital.log as log
+
+
+class Counted(object):
+    '''
+    Log argument that counts how many times it is formatted
+    '''
+    formatted = 0
+
+    def __str__(self):
+        Counted.formatted += 1
+        return 'counted'
+
+
+class StructuredLogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = StringIO.StringIO()
+        self.logger = logging.getLogger('hospital.test')
+
+    def tearDown(self):
+        log.shutdown()
+        self.logger.setLevel(logging.NOTSET)
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def records(self):
+        log.shutdown()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_lines(self):
+        '''
+        Check that the records are written as JSON objects with their extra values
+        '''
+        print '('+self.test_json_lines.__name__+')', self.test_json_lines.__doc__
+        log.configure('INFO', stream=self.stream)
+        self.logger.info('GET %s', '/hospital/api/nurses/', extra={'status': 200})
+        try:
+            raise ValueError('bad id')
+        except ValueError:
+            self.logger.exception('failed')
+        records = self.records()
+        self.assertEquals(len(records), 2)
+        self.assertEquals(records[0]['message'], 'GET /hospital/api/nurses/')
+        self.assertEquals(records[0]['status'], 200)
+        self.assertEquals(records[0]['level'], 'INFO')
+        self.assertEquals(records[0]['logger'], 'hospital.test')
+        self.assertIn('ValueError: bad id', records[1]['exception'])
+
+    def test_levels(self):
+        '''
+        Check the level of the package and of a module, and that the discarded records are not formatted
+        '''
+        print '('+self.test_levels.__name__+')', self.test_levels.__doc__
+        log.configure(stream=self.stream)
+        Counted.formatted = 0
+        for i in range(100):
+            self.logger.debug('link %s', Counted())
+        self.logger.info('ignored')
+        self.logger.warning('kept')
+        self.assertEquals(Counted.formatted, 0)
+        self.assertEquals([record['message'] for record in self.records()], ['kept'])
+        self.stream = StringIO.StringIO()
+        log.configure(stream=self.stream, levels={'hospital.test': 'DEBUG'})
+        self.logger.debug('link %s', Counted())
+        logging.getLogger('hospital.other').info('ignored')
+        self.assertEquals([record['message'] for record in self.records()], ['link counted'])
+
+    def test_sampling(self):
+        '''
+        Check that one of every n records below WARNING is kept
+        '''
+        print '('+self.test_sampling.__name__+')', self.test_sampling.__doc__
+        log.configure('DEBUG', sample=10, stream=self.stream)
+        for i in range(100):
+            self.logger.debug('row %d', i)
+        self.logger.error('always')
+        messages = [record['message'] for record in self.records()]
+        self.assertEquals(messages, ['row %d' % i for i in range(0, 100, 10)] + ['always'])
+
+    def test_full_queue(self):
+        '''
+        Check that the records are dropped instead of waiting when the queue is full
+        '''
+        print '('+self.test_full_queue.__name__+')', self.test_full_queue.__doc__
+        handler = log.configure('INFO', stream=self.stream, queue_size=1)
+        # Stop the writer so that nothing leaves the queue
+        handler.listener.stop()
+        for i in range(5):
+            self.logger.info('message %d', i)
+        self.assertEquals(log.stats(), {'pending': 1, 'dropped': 4})
+
+if __name__ == '__main__':
+    print 'Start running tests'
+    unittest.main()
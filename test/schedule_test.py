@@ -0,0 +1,81 @@
+import unittest
+
+import hospital.schedule as schedule
+
+
+class ParseTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_parse_interval(self):
+        '''
+        Check that the usual ways of writing the hours give the seconds between two doses
+        '''
+        print '('+self.test_parse_interval.__name__+')', self.test_parse_interval.__doc__
+        self.assertEquals(schedule.parse_interval('every 8 hours'), 8 * 3600)
+        self.assertEquals(schedule.parse_interval('Every 30 minutes'), 1800)
+        self.assertEquals(schedule.parse_interval('every hour'), 3600)
+        self.assertEquals(schedule.parse_interval('each 1.5 h'), 5400)
+        self.assertEquals(schedule.parse_interval('every 2 days'), 2 * 86400)
+        self.assertEquals(schedule.parse_interval('once a day'), 86400)
+        self.assertEquals(schedule.parse_interval('twice a day'), 43200)
+        self.assertEquals(schedule.parse_interval('3 times per day'), 28800)
+        for hours in (None, '', 'when needed', 'every 0 hours', '0 times a day', 'every 8 parsecs'):
+            self.assertIsNone(schedule.parse_interval(hours))
+
+    def test_parse_duration(self):
+        '''
+        Check that the durations give seconds and the unknown ones None
+        '''
+        print '('+self.test_parse_duration.__name__+')', self.test_parse_duration.__doc__
+        self.assertEquals(schedule.parse_duration('1 week'), 604800)
+        self.assertEquals(schedule.parse_duration('2 days'), 2 * 86400)
+        self.assertEquals(schedule.parse_duration('for 12 hours'), 12 * 3600)
+        self.assertEquals(schedule.parse_duration('1 month'), 30 * 86400)
+        for duration in (None, '', 'until further notice', '0 days'):
+            self.assertIsNone(schedule.parse_duration(duration))
+
+
+class DoseTimesTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_upcoming_doses(self):
+        '''
+        Check that only the doses from now until the end of the duration are returned
+        '''
+        print '('+self.test_upcoming_doses.__name__+')', self.test_upcoming_doses.__doc__
+        self.assertEquals(schedule.dose_times(1000, 100, 500, 1000), [1000, 1100, 1200, 1300, 1400])
+        self.assertEquals(schedule.dose_times(1000, 100, 500, 1150), [1200, 1300, 1400])
+        self.assertEquals(schedule.dose_times(1000, 100, 500, 1500), [])
+        self.assertEquals(schedule.dose_times(1000, None, 500, 1000), [])
+
+    def test_open_ended_and_limits(self):
+        '''
+        Check that the doses without a duration stop after OPEN_HORIZON and there are at most MAX_DOSES
+        '''
+        print '('+self.test_open_ended_and_limits.__name__+')', self.test_open_ended_and_limits.__doc__
+        times = schedule.dose_times(0, 86400, None, 0)
+        self.assertEquals(len(times), schedule.OPEN_HORIZON // 86400)
+        self.assertEquals(len(schedule.dose_times(0, 1, None, 0)), schedule.MAX_DOSES)
+        self.assertEquals(len(schedule.dose_times(0, 1, None, 0, limit=None)), schedule.OPEN_HORIZON)
+
+    def test_dose_period(self):
+        '''
+        Check that the horizon is the time until which the doses returned are all the doses
+        '''
+        print '('+self.test_dose_period.__name__+')', self.test_dose_period.__doc__
+        self.assertEquals(schedule.dose_period(1000, 100, 500, 1000), ([1000, 1100, 1200, 1300, 1400], None))
+        self.assertEquals(schedule.dose_period(0, 86400, None, 0)[1], schedule.OPEN_HORIZON)
+        times, horizon = schedule.dose_period(0, 1, 10 ** 6, 0)
+        self.assertEquals(horizon, schedule.MAX_DOSES)
+        self.assertEquals(schedule.dose_period(0, 1, 10 ** 6, horizon)[0][0], schedule.MAX_DOSES)
+        self.assertEquals(schedule.dose_period(1000, None, None, 1000), ([], None))
+
+if __name__ == '__main__':
+    print 'Start running tests'
+    unittest.main()
@@ -0,0 +1,164 @@
+import unittest, os, signal, socket, subprocess, sys, tempfile, time, urllib2
+
+import hospital.server as server
+
+
+def pid_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid())]
+
+# Serves the text of the file named by its second argument when it was started
+RELOAD_SCRIPT = """
+import os, sys
+sys.path.insert(0, %r)
+import hospital.server as server
+VERSION = open(sys.argv[2]).read()
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return ['%%d %%s' %% (os.getppid(), VERSION)]
+
+server.serve(app, '127.0.0.1', int(sys.argv[1]), workers=2, argv=[sys.executable] + sys.argv)
+""" % os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ServerTestCase(unittest.TestCase):
+    workers = 2
+    threads = 1
+
+    def setUp(self):
+        sock = server.listen('127.0.0.1', 0)
+        self.url = 'http://127.0.0.1:%d/' % sock.getsockname()[1]
+        self.master = os.fork()
+        if not self.master:
+            try:
+                server.PreforkServer(pid_app, sock, workers=self.workers, max_requests=2, threads=self.threads).run()
+            finally:
+                os._exit(0)
+        sock.close()
+
+    def tearDown(self):
+        os.kill(self.master, signal.SIGTERM)
+        pid, status = os.waitpid(self.master, 0)
+        self.assertTrue(os.WIFEXITED(status))
+
+    def get(self):
+        # The workers may still be starting
+        for i in range(50):
+            try:
+                return int(urllib2.urlopen(self.url, timeout=5).read())
+            except urllib2.URLError:
+                time.sleep(0.1)
+        self.fail("The server did not answer")
+
+
+class PreforkServerTestCase(ServerTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_workers_are_recycled(self):
+        '''
+        Check that the workers are replaced after serving max_requests requests
+        '''
+        print '('+self.test_workers_are_recycled.__name__+')', self.test_workers_are_recycled.__doc__
+        pids = [self.get() for i in range(6)]
+        self.assertNotIn(self.master, pids)
+        # 2 requests per worker at most
+        self.assertGreaterEqual(len(set(pids)), 3)
+        for pid in set(pids):
+            self.assertLessEqual(pids.count(pid), 2)
+
+    def test_graceful_restart(self):
+        '''
+        Check that without argv SIGHUP replaces the workers without refusing requests
+        '''
+        print '('+self.test_graceful_restart.__name__+')', self.test_graceful_restart.__doc__
+        before = self.get()
+        os.kill(self.master, signal.SIGHUP)
+        # The old workers stop after waiting for a connection at most WORKER_POLL_INTERVAL
+        time.sleep(server.WORKER_POLL_INTERVAL + 0.5)
+        after = [self.get() for i in range(2)]
+        self.assertNotIn(before, after)
+
+
+class ThreadedServerTestCase(ServerTestCase):
+    workers = 1
+    threads = 4
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def test_idle_connections(self):
+        '''
+        Check that idle connections do not stop a worker from serving the other clients
+        '''
+        print '('+self.test_idle_connections.__name__+')', self.test_idle_connections.__doc__
+        pid = self.get()
+        port = int(self.url.rsplit(':', 1)[1].strip('/'))
+        idle = [socket.create_connection(('127.0.0.1', port)) for i in range(2)]
+        try:
+            started = time.time()
+            # max_requests is 2, the same worker serves the second request
+            self.assertEquals(self.get(), pid)
+            self.assertLess(time.time() - started, server.CONNECTION_TIMEOUT / 2)
+        finally:
+            for connection in idle:
+                connection.close()
+
+
+class ReexecTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print "Testing ", cls.__name__
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.script = os.path.join(self.folder, 'reload_app.py')
+        self.version = os.path.join(self.folder, 'version')
+        with open(self.script, 'w') as f:
+            f.write(RELOAD_SCRIPT)
+        with open(self.version, 'w') as f:
+            f.write('1')
+        sock = server.listen('127.0.0.1', 0)
+        self.port = sock.getsockname()[1]
+        sock.close()
+        self.master = subprocess.Popen([sys.executable, self.script, str(self.port), self.version])
+
+    def tearDown(self):
+        self.master.terminate()
+        self.master.wait()
+        for name in (self.script, self.version):
+            os.remove(name)
+        os.rmdir(self.folder)
+
+    def get(self):
+        # The workers may still be starting
+        for i in range(50):
+            try:
+                master, version = urllib2.urlopen('http://127.0.0.1:%d/' % self.port, timeout=5).read().split()
+                return int(master), version
+            except urllib2.URLError:
+                time.sleep(0.1)
+        self.fail("The server did not answer")
+
+    def test_restart_loads_new_code(self):
+        '''
+        Check that SIGHUP executes the master again, which serves the new code with the same pid
+        '''
+        print '('+self.test_restart_loads_new_code.__name__+')', self.test_restart_loads_new_code.__doc__
+        self.assertEquals(self.get(), (self.master.pid, '1'))
+        with open(self.version, 'w') as f:
+            f.write('2')
+        self.master.send_signal(signal.SIGHUP)
+        # The old workers stop after waiting for a connection at most WORKER_POLL_INTERVAL
+        time.sleep(server.WORKER_POLL_INTERVAL + 1.5)
+        self.assertEquals([self.get() for i in range(4)], [(self.master.pid, '2')] * 4)
+        self.assertIsNone(self.master.poll())
+
+if __name__ == '__main__':
+    print 'Start running tests'
+    unittest.main()